@@ -8,8 +8,115 @@ if !exists('g:alchemist#alchemist_client')
     let g:alchemist#alchemist_client = expand("<sfile>:p:h:h") . '/../elixir_sense_client'
 endif
 
-function! alchemist#alchemist_client(req, lnum, cnum, lines)
-    let req = a:req
+if !exists('g:alchemist#daemon')
+    let g:alchemist#daemon = has('nvim') || (has('job') && has('channel'))
+endif
+
+if !exists('g:alchemist#daemon_timeout')
+    let g:alchemist#daemon_timeout = 15000
+endif
+
+if !exists('g:alchemist#complete_debounce')
+    let g:alchemist#complete_debounce = 50
+endif
+
+if !exists('g:alchemist#server_standby')
+    let g:alchemist#server_standby = 0
+endif
+
+if !exists('g:alchemist#shared_server')
+    let g:alchemist#shared_server = 0
+endif
+
+if !exists('g:alchemist#trace')
+    let g:alchemist#trace = 0
+endif
+
+let s:daemon_id = 0
+let s:daemon_partial = ''
+let s:daemon_responses = {}
+let s:daemon_callbacks = {}
+
+" a:lines are the lines of the current buffer, unless the optional argument
+" is 0 (ex. a word typed on the command line)
+function! alchemist#alchemist_client(req, lnum, cnum, lines, ...)
+    if g:alchemist#daemon && s:daemon_start()
+        let result = s:daemon_request(s:daemon_payload(a:req, a:lnum, a:cnum, a:lines, get(a:000, 0, 1)))
+    else
+        let result = s:system_request(a:req, a:lnum, a:cnum, a:lines)
+    endif
+    return s:client_result(result)
+endfunction
+
+" Sends the request to the daemon without waiting for it, a:callback is
+" called with the result. A newer request of the same kind for the same
+" buffer supersedes it, the callback gets an empty result then. Returns 0
+" when the daemon isn't available.
+function! alchemist#alchemist_client_async(req, lnum, cnum, lines, callback)
+    if !g:alchemist#daemon || !s:daemon_start()
+        return 0
+    endif
+    let request = s:daemon_payload(a:req, a:lnum, a:cnum, a:lines, 1)
+    if has('nvim')
+        let s:daemon_id += 1
+        let s:daemon_callbacks[s:daemon_id] = a:callback
+        call chansend(s:daemon_job, json_encode([s:daemon_id, request]) . "\n")
+    else
+        call ch_sendexpr(job_getchannel(s:daemon_job), request,
+                    \ {'callback': {channel, result -> a:callback(s:client_result(result))}})
+    endif
+    return 1
+endfunction
+
+function! s:client_result(result)
+    let result = a:result
+    if type(result) == type([])
+        return result
+    endif
+    if type(result) != type('')
+        return ''
+    endif
+    if len(matchlist(result, '^error:')) > 0
+        call s:echo_error('alchemist.vim: failed with message ' . result)
+        return ''
+    endif
+    return result
+endfunction
+
+" Module names starting with a:prefix, the daemon keeps the module list of
+" the project. Returns '' without the daemon.
+function! alchemist#module_names(prefix)
+    if !g:alchemist#daemon || !s:daemon_start()
+        return ''
+    endif
+    let request = {'request': 'modules', 'prefix': a:prefix, 'directory': expand('%:p:h')}
+    return s:client_result(s:daemon_request(request))
+endfunction
+
+" Shows where the time of the last requests of the project went, with
+" a:bang the traces as JSON lines
+function! alchemist#stats(bang)
+    if !g:alchemist#daemon || !s:daemon_start()
+        call s:echo_error('alchemist.vim: :AlchemistStats needs g:alchemist#daemon')
+        return
+    endif
+    let request = {'request': 'stats', 'directory': expand('%:p:h')}
+    if a:bang
+        let request.format = 'json'
+    endif
+    let result = s:client_result(s:daemon_request(request))
+    let lines = type(result) == type([]) ? map(result, 'json_encode(v:val)') : split(result, '\n')
+    if empty(lines)
+        echo 'Alchemist: no traces, set g:alchemist#trace = 1 to record them'
+        return
+    endif
+    new
+    sil file `='[AlchemistStats]'`
+    setlocal buftype=nofile bufhidden=wipe noswapfile
+    call setline(1, lines)
+endfunction
+
+function! s:system_request(req, lnum, cnum, lines)
     let cmd = g:alchemist#alchemist_client
     if exists('g:alchemist#elixir_erlang_src')
         let cmd = cmd . ' -o ' . g:alchemist#elixir_erlang_src
@@ -18,14 +125,130 @@ function! alchemist#alchemist_client(req, lnum, cnum, lines)
     let cmd = cmd . ' --line=' . a:lnum
     let cmd = cmd . ' --column=' . a:cnum
     let cmd = cmd . ' --request=' . a:req
-    let result =  system(cmd, join(a:lines, "\n"))
-    if len(matchlist(result, '^error:')) > 0
-        call s:echo_error('alchemist.vim: failed with message ' . result)
-        return ''
+    if exists('g:alchemist#server_lifetime')
+        let cmd = cmd . ' --server-lifetime=' . g:alchemist#server_lifetime
     endif
-    return result
+    if g:alchemist#shared_server
+        let cmd = cmd . ' --shared-server'
+    endif
+    return system(cmd, join(a:lines, "\n"))
+endfunction
+
+" {{{ Client daemon
+" A long running elixir_sense_client that keeps the connection to the
+" ElixirSense server open, it talks JSON lines over the job's stdio.
+
+function! s:daemon_cmd()
+    let cmd = [g:alchemist#alchemist_client, '--daemon', '--standby=' . g:alchemist#server_standby]
+    if exists('g:alchemist#elixir_erlang_src')
+        let cmd += ['-o', g:alchemist#elixir_erlang_src]
+    endif
+    if exists('g:alchemist#server_lifetime')
+        let cmd += ['--server-lifetime=' . g:alchemist#server_lifetime]
+    endif
+    if g:alchemist#shared_server
+        let cmd += ['--shared-server']
+    endif
+    if g:alchemist#trace
+        let cmd += ['--trace']
+    endif
+    return cmd
+endfunction
+
+" Starts the server of the project when an elixir buffer is opened, so it's
+" ready by the first completion
+function! s:daemon_warmup()
+    if !g:alchemist#daemon || !s:daemon_start()
+        return
+    endif
+    let request = {'request': 'warmup', 'directory': expand('%:p:h')}
+    if has('nvim')
+        let s:daemon_id += 1
+        call chansend(s:daemon_job, json_encode([s:daemon_id, request]) . "\n")
+    else
+        call ch_sendexpr(job_getchannel(s:daemon_job), request)
+    endif
+endfunction
+
+augroup alchemist_daemon
+    autocmd!
+    autocmd FileType elixir call s:daemon_warmup()
+augroup END
+
+function! s:daemon_start()
+    if has('nvim')
+        if exists('s:daemon_job')
+            return 1
+        endif
+        let job = jobstart(s:daemon_cmd(), {
+                    \ 'on_stdout': function('s:nvim_daemon_stdout'),
+                    \ 'on_exit': function('s:nvim_daemon_exit')})
+        if job <= 0
+            return 0
+        endif
+        let s:daemon_job = job
+        return 1
+    endif
+    if exists('s:daemon_job') && job_status(s:daemon_job) == 'run'
+        return 1
+    endif
+    let s:daemon_job = job_start(s:daemon_cmd(), {'mode': 'json', 'err_io': 'null'})
+    return job_status(s:daemon_job) == 'run'
+endfunction
+
+" Only the lines of the buffer are synced as the buffer, other sources would
+" replace the version the daemon and the server diff the next changes with
+function! s:daemon_payload(req, lnum, cnum, lines, from_buffer)
+    let payload = {
+                \ 'request': a:req,
+                \ 'key': a:req . ':' . expand('%:p'),
+                \ 'directory': expand('%:p:h'),
+                \ 'line': a:lnum,
+                \ 'column': a:cnum,
+                \ 'buffer': join(a:lines, "\n")}
+    if a:from_buffer
+        let payload.buffer_id = bufnr('%')
+    endif
+    return payload
+endfunction
+
+function! s:daemon_request(request)
+    if !has('nvim')
+        return ch_evalexpr(job_getchannel(s:daemon_job), a:request,
+                    \ {'timeout': g:alchemist#daemon_timeout})
+    endif
+    let s:daemon_id += 1
+    let id = s:daemon_id
+    let s:daemon_responses = {}
+    call chansend(s:daemon_job, json_encode([id, a:request]) . "\n")
+    call wait(g:alchemist#daemon_timeout, {-> has_key(s:daemon_responses, id)})
+    return get(s:daemon_responses, id, '')
 endfunction
 
+function! s:nvim_daemon_stdout(job, data, event) dict
+    let lines = a:data
+    let lines[0] = s:daemon_partial . lines[0]
+    let s:daemon_partial = remove(lines, -1)
+    for line in lines
+        if line != ''
+            let [id, response] = json_decode(line)
+            if has_key(s:daemon_callbacks, id)
+                call remove(s:daemon_callbacks, id)(s:client_result(response))
+            else
+                let s:daemon_responses[id] = response
+            endif
+        endif
+    endfor
+endfunction
+
+function! s:nvim_daemon_exit(job, code, event) dict
+    unlet! s:daemon_job
+    let s:daemon_partial = ''
+    let s:daemon_callbacks = {}
+endfunction
+
+" }}}
+
 function! alchemist#get_doc(word)
     if a:word == ''
         let lnum = line('.')
@@ -44,11 +267,11 @@ function! alchemist#get_doc(word)
         let query = split(query, '\.')[0]
         return alchemist#get_doc_erl(query)
     endif
-    return alchemist#get_doc_ex(lnum, cnum, lines)
+    return alchemist#get_doc_ex(lnum, cnum, lines, a:word == '')
 endfunction
 
-function! alchemist#get_doc_ex(lnum, cnum, lines)
-    let result = alchemist#alchemist_client('docs', a:lnum, a:cnum, a:lines)
+function! alchemist#get_doc_ex(lnum, cnum, lines, ...)
+    let result = alchemist#alchemist_client('docs', a:lnum, a:cnum, a:lines, get(a:000, 0, 1))
 
     " fix heading colors
     let result = substitute(result, '\e\[7m\e\[33m', '[1m[33m', 'g')
@@ -217,7 +440,7 @@ function! alchemist#exdef(...)
         return
     endif
 
-    let result = alchemist#alchemist_client('definition', lnum, cnum, lines)
+    let result = alchemist#alchemist_client('definition', lnum, cnum, lines, empty(a:000))
     let source_match = split(result, '\n')
     if len(source_match) == 0 || source_match[0] == 'definition_not_found'
         call s:echo_error('E426: tag not found: ' . query)
@@ -566,3 +789,5 @@ endif
 command! -nargs=* -complete=customlist,elixircomplete#ex_doc_complete IEx
       \ call alchemist#open_iex(<q-args>)
 command! -nargs=0 IExHide call alchemist#hide_iex()
+
+command! -bang -nargs=0 AlchemistStats call alchemist#stats(<bang>0)
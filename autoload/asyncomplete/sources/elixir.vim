@@ -1,4 +1,19 @@
+let s:complete_timer = -1
+
+" Keystrokes coming faster than g:alchemist#complete_debounce only ask
+" for the suggestions of the last one
 function! asyncomplete#sources#elixir#completor(opt, ctx) abort
+    call timer_stop(s:complete_timer)
+    let s:complete_timer = timer_start(get(g:, 'alchemist#complete_debounce', 50),
+                \ {-> s:complete(a:opt, a:ctx)})
+endfunction
+
+function! s:complete(opt, ctx) abort
+    if alchemist#alchemist_client_async('suggestions', a:ctx['lnum'], a:ctx['col'], getline(1, '$'),
+                \ function('s:daemon_handler', [a:opt, a:ctx]))
+        return
+    endif
+
     let l:num = a:ctx['lnum']
     let l:col = a:ctx['col']
     let l:file = a:ctx['filepath']
@@ -22,43 +37,16 @@ function! asyncomplete#sources#elixir#completor(opt, ctx) abort
     endif
 endfunction
 
+function! s:daemon_handler(opt, ctx, result) abort
+    call s:complete_suggestions(a:opt, a:ctx, elixircomplete#suggestion_records(a:result))
+endfunction
+
 function! s:handler(opt, ctx, params, id, data, event) abort
     if a:event ==? 'stdout'
         let a:params['stdout_buffer'] = a:params['stdout_buffer'] . join(a:data, "\n")
     elseif a:event ==? 'exit'
-	let l:typed = a:ctx['typed']
         if a:data == 0
-		let suggestions = split(a:params['stdout_buffer'], '\n')
-		let l:matches = []
-		for sugg in suggestions
-			let details = matchlist(sugg, 'kind:\(.*\), word:\(.*\), abbr:\(.*\), menu:\(.*\), info:\(.*\)$')
-			if len(details) > 0
-				let info = substitute(s:strip(details[5]) , '<n>', '\n', "g")
-				if details[1] == 'f'
-					let word = details[2]
-					let sug_parts = split(l:typed, '\.')
-					let is_it_only_func = matchstr(l:typed, '\C^[a-z].*') != ''
-					if len(sug_parts) == 1 && l:typed[len(l:typed) -1] != '.' && is_it_only_func == 1
-						let word_parts = split(word, '\.')
-						let word_size = len(word_parts) - 1
-						let word = word_parts[word_size]
-					endif
-					let a = {'kind': details[1], 'word': word, 'abbr': details[3], 'menu': details[4], 'dup': 1, 'info': info}
-				elseif details[1] == 'm' || details[1] == 'p' || details[1] == 'e' || details[1] == 's'
-					let word = details[2]
-					let a = {'kind': details[1], 'word': word, 'menu': details[4], 'abbr': details[3], 'info': info}
-				endif
-
-				call add(l:matches, a)
-			endif
-		endfor
-		let l:col = a:ctx['col']
-		let l:kw = matchstr(l:typed, '\v\S+$')
-		let l:kwlen = len(l:kw)
-		let l:startcol = l:col - l:kwlen
-		echom l:startcol
-
-		call asyncomplete#complete(a:opt['name'], a:ctx, l:startcol, l:matches)
+		call s:complete_suggestions(a:opt, a:ctx, elixircomplete#suggestion_records(a:params['stdout_buffer']))
 	endif
         call delete(a:params['file'])
     elseif a:event ==? 'stdout'
@@ -66,13 +54,40 @@ function! s:handler(opt, ctx, params, id, data, event) abort
     endif
 endfunction
 
+function! s:complete_suggestions(opt, ctx, records) abort
+	let l:typed = a:ctx['typed']
+	let l:matches = []
+	for record in a:records
+		if record.kind == 'f'
+			let word = record.word
+			let sug_parts = split(l:typed, '\.')
+			let is_it_only_func = matchstr(l:typed, '\C^[a-z].*') != ''
+			if len(sug_parts) == 1 && l:typed[len(l:typed) -1] != '.' && is_it_only_func == 1
+				let word_parts = split(word, '\.')
+				let word_size = len(word_parts) - 1
+				let word = word_parts[word_size]
+			endif
+			let a = {'kind': record.kind, 'word': word, 'abbr': record.abbr, 'menu': record.menu, 'dup': 1, 'info': record.info}
+		elseif record.kind == 'm' || record.kind == 'p' || record.kind == 'e' || record.kind == 's'
+			let a = {'kind': record.kind, 'word': record.word, 'menu': record.menu, 'abbr': record.abbr, 'info': record.info}
+		else
+			continue
+		endif
+
+		call add(l:matches, a)
+	endfor
+	let l:col = a:ctx['col']
+	let l:kw = matchstr(l:typed, '\v\S+$')
+	let l:kwlen = len(l:kw)
+	let l:startcol = l:col - l:kwlen
+	echom l:startcol
+
+	call asyncomplete#complete(a:opt['name'], a:ctx, l:startcol, l:matches)
+endfunction
+
 function! s:write_buffer_to_tempfile(ctx) abort
 	let l:lines = getline(1, '$')
 	let l:file = tempname()
 	call writefile(l:lines, l:file)
 	return l:file
 endfunction
-
-function! s:strip(input_string)
-	return substitute(a:input_string, '^\s*\(.\{-}\)\s*$', '\1', '')
-endfunction
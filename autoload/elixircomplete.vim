@@ -3,8 +3,19 @@ if !exists('g:alchemist#alchemist_client')
 endif
 
 
+" Module names (`String.Ch`, `:li`) are completed from the module list of the
+" project, functions (`String.`, `String.ch`) and anything the list doesn't
+" have by asking for suggestions
+let s:module_lead = '^\%(:\w*\|\%(\u\w*\.\)*\u\w*\)$'
+
 function! elixircomplete#ex_doc_complete(ArgLead, CmdLine, CursorPos, ...)
-  let suggestions = elixircomplete#get_suggestions(a:ArgLead, 1, len(a:ArgLead) + 1, [a:ArgLead . "\n"])
+  if a:ArgLead =~# s:module_lead
+    let modules = alchemist#module_names(a:ArgLead)
+    if type(modules) == type([]) && !empty(modules)
+      return modules
+    endif
+  endif
+  let suggestions = elixircomplete#get_suggestions(a:ArgLead, 1, len(a:ArgLead) + 1, [a:ArgLead . "\n"], 0)
   if type(suggestions) != type([])
     return []
   endif
@@ -67,35 +78,52 @@ function! s:find_start()
 endfunction
 
 
-function! elixircomplete#get_suggestions(base_or_suggestions, lnum, cnum, lines)
+function! elixircomplete#get_suggestions(base_or_suggestions, lnum, cnum, lines, ...)
     let req = 'suggestions'
-    let result = alchemist#alchemist_client(req, a:lnum, a:cnum, a:lines)
-    let suggestions = split(result, '\n')
+    let result = alchemist#alchemist_client(req, a:lnum, a:cnum, a:lines, get(a:000, 0, 1))
     let parsed_suggestion = []
-    for sugg in suggestions
-        let details = matchlist(sugg, 'kind:\(.*\), word:\(.*\), abbr:\(.*\), menu:\(.*\), info:\(.*\)$')
-        if len(details) > 0
-            if details[1] == 'f'
-                let word = details[2]
-                let sug_parts = split(a:base_or_suggestions, '\.')
-                let is_it_only_func = matchstr(a:base_or_suggestions, '\C^[a-z].*') != ''
-                if len(sug_parts) == 1 && a:base_or_suggestions[len(a:base_or_suggestions) -1] != '.' && is_it_only_func == 1
-                    let word_parts = split(word, '\.')
-                    let word_size = len(word_parts) - 1
-                    let word = word_parts[word_size]
-                endif
-                let a = {'kind': details[1], 'word': word, 'abbr': details[3], 'menu': details[4], 'dup': 1}
-            elseif details[1] == 'm' || details[1] == 'p' || details[1] == 'e' || details[1] == 's'
-                let word = details[2]
-                let a = {'kind': details[1], 'word':  word, 'menu': details[4], 'abbr': details[3]}
+    for record in elixircomplete#suggestion_records(result)
+        if record.kind == 'f'
+            let word = record.word
+            let sug_parts = split(a:base_or_suggestions, '\.')
+            let is_it_only_func = matchstr(a:base_or_suggestions, '\C^[a-z].*') != ''
+            if len(sug_parts) == 1 && a:base_or_suggestions[len(a:base_or_suggestions) -1] != '.' && is_it_only_func == 1
+                let word_parts = split(word, '\.')
+                let word_size = len(word_parts) - 1
+                let word = word_parts[word_size]
             endif
+            let a = {'kind': record.kind, 'word': word, 'abbr': record.abbr, 'menu': record.menu, 'dup': 1}
+        elseif record.kind == 'm' || record.kind == 'p' || record.kind == 'e' || record.kind == 's'
+            let a = {'kind': record.kind, 'word':  record.word, 'menu': record.menu, 'abbr': record.abbr}
+        else
+            continue
+        endif
 
-            if exists('g:alchemist#extended_autocomplete') && g:alchemist#extended_autocomplete == 1
-                let info = substitute(s:strip(details[5]) , '<n>', '\n', "g")
-                let a.info = info
-            endif
-            call add(parsed_suggestion, a)
+        if exists('g:alchemist#extended_autocomplete') && g:alchemist#extended_autocomplete == 1
+            let a.info = record.info
         endif
+        call add(parsed_suggestion, a)
     endfor
     return parsed_suggestion
 endfunction
+
+" The daemon answers suggestions with records already, the command line
+" client with `kind:.., word:.., abbr:.., menu:.., info:..` lines
+function! elixircomplete#suggestion_records(result)
+    if type(a:result) == type([])
+        return a:result
+    endif
+    let records = []
+    for sugg in split(a:result, '\n')
+        let details = matchlist(sugg, 'kind:\(.*\), word:\(.*\), abbr:\(.*\), menu:\(.*\), info:\(.*\)$')
+        if len(details) > 0
+            call add(records, {
+                        \ 'kind': details[1],
+                        \ 'word': details[2],
+                        \ 'abbr': details[3],
+                        \ 'menu': s:strip(details[4]),
+                        \ 'info': substitute(s:strip(details[5]) , '<n>', '\n', "g")})
+        endif
+    endfor
+    return records
+endfunction
@@ -3,7 +3,7 @@ import os
 import tempfile
 import re
 import pprint
-import subprocess, shlex
+import subprocess
 import select, socket
 import time
 try :
@@ -11,24 +11,443 @@ try :
 except ImportError:
     pass
 import struct
+import glob
+import bisect
+import hashlib
+import json
+try:
+    import dbm
+except ImportError:
+    import anydbm as dbm
 import erl_terms
 import errno
+import logging
+import logging.handlers
+from collections import OrderedDict, deque
 
-class ElixirSenseClient:
+# Debug messages per subsystem, messages are only formatted when their
+# level is enabled, see enable_debug_log()
+log = logging.getLogger('alchemist')
+socket_log = logging.getLogger('alchemist.socket')
+codec_log = logging.getLogger('alchemist.codec')
+format_log = logging.getLogger('alchemist.format')
+
+def enable_debug_log(path='/tmp/log.log', levels=None):
+    """
+    Writes the debug messages of the clients to `path`, in batches and
+    rotated every MB. `levels` sets the level of subsystems, ex.
+    `{'codec': 'INFO'}` leaves the codec's debug messages out.
+    """
+    if not log.handlers:
+        target = logging.handlers.RotatingFileHandler(path, maxBytes=1024 * 1024, backupCount=2)
+        target.setFormatter(logging.Formatter('%(asctime)s %(name)s: %(message)s'))
+        log.addHandler(logging.handlers.MemoryHandler(100, logging.ERROR, target))
+        log.setLevel(logging.DEBUG)
+    for (subsystem, level) in (levels or {}).items():
+        logging.getLogger('alchemist.%s' % subsystem).setLevel(level)
+
+class SuggestionCache:
+    """
+    LRU cache of suggestions payloads. A hint extending the one of a cached
+    payload (`Enum.ma` -> `Enum.map`) is answered by narrowing the cached
+    suggestions down to the ones matching the new hint.
+
+    >>> cache = SuggestionCache(2)
+    >>> cache.put(('ctx', 'Enum.ma'), [{'type': 'hint', 'value': 'Enum.ma'}, {'type': 'function', 'name': 'map'}, {'type': 'function', 'name': 'max'}])
+    >>> cache.get(('ctx', 'Enum.map'))
+    [{'type': 'hint', 'value': 'Enum.map'}, {'type': 'function', 'name': 'map'}]
+    >>> cache.get(('ctx', 'Enum.m')) is None
+    True
+    >>> cache.get(('other', 'Enum.map')) is None
+    True
+    >>> cache.put(('ctx', 'List.'), [])
+    >>> cache.put(('ctx', ':gen_'), [{'type': 'hint', 'value': ':gen_'}, {'type': 'module', 'name': 'gen_event'}, {'type': 'module', 'name': 'gen_fsm'}])
+    >>> cache.get(('ctx', ':gen_e'))
+    [{'type': 'hint', 'value': ':gen_e'}, {'type': 'module', 'name': 'gen_event'}]
+    >>> cache.get(('ctx', 'List.first'))
+    [{'type': 'hint', 'value': 'List.first'}]
+    >>> cache.get(('ctx', 'Enum.map')) is None
+    True
+    """
+
+    def __init__(self, size=64):
+        self._size = size
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        (context, hint) = key
+        segment_start = hint.rfind('.') + 1
+        for end in range(len(hint), segment_start - 1, -1):
+            cached_key = (context, hint[:end])
+            if cached_key in self._entries:
+                payload = self._entries.pop(cached_key)
+                self._entries[cached_key] = payload
+                return self._narrow(payload, hint)
+        return None
+
+    def put(self, key, payload):
+        if self._size <= 0:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = [dict(s) for s in payload]
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+    def _narrow(self, payload, hint):
+        prefix = hint[hint.rfind('.') + 1:].lstrip(':')
+        narrowed = [{'type': 'hint', 'value': hint}]
+        for s in payload:
+            if s['type'] != 'hint' and s.get('name', '').startswith(prefix):
+                narrowed.append(dict(s))
+        return narrowed
+
+class DocsCache:
+    """
+    Docs payloads in a memory LRU backed by a dbm file, so the docs asked
+    for in a previous session or by another client process come back
+    without asking the server. The dbm file is shared with other processes,
+    it's only opened while it's read or written, and it's started over once
+    it holds `max_entries`. Keys are chosen by the client. A `size` of 0
+disables the cache, dbm file included.
+
+    >>> path = os.path.join(tempfile.mkdtemp(), 'docs')
+    >>> cache = DocsCache(path, 1)
+    >>> cache.put('Enum.map', {'docs': 'map docs'})
+    >>> cache.get('Enum.map') == {'docs': 'map docs'}
+    True
+    >>> cache.put('Enum.max', {'docs': 'max docs'})
+    >>> DocsCache(path, 1).get('Enum.map') == {'docs': 'map docs'}
+    True
+    >>> cache.get('Enum.min') is None
+    True
+    """
+
+    def __init__(self, path, size=64, max_entries=2000):
+        self._path = path
+        self._size = size
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        if self._size <= 0:
+            return None
+        if key in self._entries:
+            payload = self._entries.pop(key)
+            self._entries[key] = payload
+            return payload
+        try:
+            db = dbm.open(self._path, 'c')
+            try:
+                data = db.get(key.encode('utf-8'))
+            finally:
+                db.close()
+        except Exception:
+            return None
+        if data is None:
+            return None
+        payload = json.loads(data.decode('utf-8'))
+        self._remember(key, payload)
+        return payload
+
+    def put(self, key, payload):
+        if self._size <= 0:
+            return
+        self._remember(key, payload)
+        try:
+            db = dbm.open(self._path, 'c')
+            if len(db) >= self._max_entries:
+                db.close()
+                db = dbm.open(self._path, 'n')
+            try:
+                db[key.encode('utf-8')] = json.dumps(payload).encode('utf-8')
+            finally:
+                db.close()
+        except Exception:
+            pass
+
+    def _remember(self, key, payload):
+        if self._size <= 0:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = payload
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+class ModuleIndex:
+    """
+    Sorted module names (`Enum`, `:lists`), prefix queries are a binary
+    search for the first match.
+
+    >>> index = ModuleIndex(['String.Chars', 'Enum', ':lists', 'Enumerable', 'String'])
+    >>> index.complete('Enu')
+    ['Enum', 'Enumerable']
+    >>> index.complete('String.')
+    ['String.Chars']
+    >>> index.complete(':l')
+    [':lists']
+    >>> index.complete('', 2)
+    [':lists', 'Enum']
+    >>> index.complete('X')
+    []
+    """
+
+    def __init__(self, modules):
+        self._modules = sorted(modules)
+
+    def complete(self, prefix, limit=None):
+        matches = []
+        for i in range(bisect.bisect_left(self._modules, prefix), len(self._modules)):
+            if not self._modules[i].startswith(prefix) or len(matches) == limit:
+                break
+            matches.append(self._modules[i])
+        return matches
+
+class RequestTrace:
+    """
+    Timing breakdown of one process_command() call, in ms. A stage lasts
+    from the end of the previous one, stages that happen more than once (ex.
+    a retry) add up. The server sends the time of its own stages with each
+    response.
+
+    >>> trace = RequestTrace(['suggestions'])
+    >>> trace.stage('encode')
+    >>> trace.server('suggestions', {'parse': 1500, 'provider': 500})
+    >>> record = trace.finish()
+    >>> (record['requests'], sorted(record['stages']), record['server'])
+    (['suggestions'], ['encode'], {'suggestions': {'parse': 1.5, 'provider': 0.5}})
+    """
+
+    def __init__(self, requests):
+        self._started = time.time()
+        self._mark = self._started
+        self.record = {'time': self._started, 'requests': list(requests), 'stages': {}, 'server': {}}
+
+    def stage(self, name):
+        now = time.time()
+        stages = self.record['stages']
+        stages[name] = stages.get(name, 0) + (now - self._mark) * 1000
+        self._mark = now
+
+    def server(self, request, timings):
+        # the server measures in microseconds
+        self.record['server'][request] = dict((k, v / 1000.0) for (k, v) in timings.items())
 
+    def finish(self):
+        self.record['total'] = (time.time() - self._started) * 1000
+        return self.record
+
+class ServerConnection:
+    """
+    The socket to a server and the responses read from it that weren't
+    asked for yet. Clients of different projects using the shared server
+    share one ServerConnection, request ids are unique on it.
+    """
+    shared = {}
+
+    def __init__(self):
+        self.sock = None
+        self.request_id = 0
+        self.responses = {}
+
+class SourceIndex:
+    """
+    Index of the Elixir and OTP sources in `elixir_otp_src`, for the
+    definitions in stdlib and OTP modules compiled on another machine. The
+    files are found by their path inside elixir/lib (Elixir) or otp
+    (Erlang), and the line of the modules and functions defined in a file
+    by `Module` or `Module.function`. The file list is built the first time
+    it's needed, a file is parsed when it's first looked up and again when
+    its mtime changed. The index is saved in `index_file`.
+
+    >>> src = tempfile.mkdtemp()
+    >>> os.makedirs(os.path.join(src, 'elixir', 'lib', 'elixir', 'lib'))
+    >>> with open(os.path.join(src, 'elixir', 'lib', 'elixir', 'lib', 'enum.ex'), 'w') as f:
+    ...     _ = f.write('defmodule Enum do\\n  @doc "map"\\n  def map(enumerable, fun) do\\n  end\\nend\\n')
+    >>> os.makedirs(os.path.join(src, 'otp', 'lib', 'stdlib', 'src'))
+    >>> with open(os.path.join(src, 'otp', 'lib', 'stdlib', 'src', 'lists.erl'), 'w') as f:
+    ...     _ = f.write('-module(lists).\\n\\n-spec map(Fun, List1) -> List2.\\nmap(F, [H|T]) ->\\n')
+    >>> index = SourceIndex(src, os.path.join(src, 'index.json'))
+    >>> enum = index.find_file('/home/build/elixir-1.9/lib/elixir/lib/enum.ex')
+    >>> enum == os.path.realpath(os.path.join(src, 'elixir', 'lib', 'elixir', 'lib', 'enum.ex'))
+    True
+    >>> (index.find_line(enum, 'Enum', 'map'), index.find_line(enum, None, 'map'), index.find_line(enum, 'Enum', None))
+    (3, 3, 1)
+    >>> lists = SourceIndex(src, os.path.join(src, 'index.json')).find_file('/usr/lib/otp/lib/stdlib/src/lists.erl')
+    >>> (index.find_line(lists, 'lists', 'map'), index.find_line(lists, 'lists', 'foldl'))
+    (3, 0)
+    >>> index.find_file('/home/build/elixir-1.9/lib/elixir/lib/unknown.ex') is None
+    True
+    """
+    re_elixir_src = re.compile(r'.*(/elixir.*/lib.*)')
+    re_erlang_src = re.compile(r'.*otp.*(/lib/.*\.erl)')
+    re_elixir_def = re.compile(r'^\s*(defmodule|def|defp|defmacro|defmacrop|defdelegate|defguard|defguardp)\s+([\w.?!]+)')
+    re_erlang_module = re.compile(r'^-module\((\w+)\)\.')
+    re_erlang_def = re.compile(r'^(?:-spec\s+)?([a-z]\w*)\s*\(')
+
+    def __init__(self, src_dir, index_file):
+        self._src_dir = src_dir
+        self._index_file = index_file
+        self._files = None
+        self._symbols = {}
+        self._walked = False
+        try:
+            with open(index_file) as f:
+                index = json.load(f)
+            (self._files, self._symbols) = (index['files'], index['symbols'])
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def find_file(self, filename):
+        """
+        the source file for a file path recorded when the module was
+        compiled, None when it's not in the sources
+        """
+        key = self._file_key(filename)
+        if key is None:
+            return None
+        if self._files is None or (key not in self._files and not self._walked):
+            self._files = self._walk()
+            self._save()
+        return self._files.get(key)
+
+    def find_line(self, filename, module, function):
+        """
+        the line `module.function` (or any function named `function` when
+        the module isn't found, or `module`) is defined at in the file, 0
+        when it isn't found
+        """
+        symbols = self._file_symbols(filename)
+        for name in self._symbol_names(module, function):
+            if name in symbols:
+                return symbols[name]
+        suffixes = ['.%s' % name for name in self._symbol_names(module, function)]
+        if function is not None:
+            suffixes.append('.%s' % function)
+        lines = [line for (name, line) in symbols.items() if any(name.endswith(s) for s in suffixes)]
+        return min(lines or [0])
+
+    def _symbol_names(self, module, function):
+        if module is None:
+            return []
+        if function is None:
+            return [module]
+        return ['%s.%s' % (module, function)]
+
+    def _file_key(self, filename):
+        if self.re_elixir_src.match(filename):
+            return self.re_elixir_src.match(filename).group(1)
+        elif self.re_erlang_src.match(filename):
+            return self.re_erlang_src.match(filename).group(1)
+        return None
+
+    def _walk(self):
+        self._walked = True
+        files = {}
+        roots = [(os.path.join(self._src_dir, 'elixir', 'lib'), '.ex'), (os.path.join(self._src_dir, 'otp'), '.erl')]
+        for (root, extension) in roots:
+            for (dirpath, dirnames, filenames) in os.walk(root):
+                for filename in filenames:
+                    if filename.endswith(extension):
+                        path = os.path.join(dirpath, filename)
+                        files[path[len(root):]] = os.path.realpath(path)
+        return files
+
+    def _file_symbols(self, filename):
+        mtime = os.path.getmtime(filename) if os.path.isfile(filename) else 0
+        cached = self._symbols.get(filename)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        symbols = self._parse(filename)
+        self._symbols[filename] = [mtime, symbols]
+        self._save()
+        return symbols
+
+    def _parse(self, filename):
+        symbols = {}
+        module = None
+        try:
+            with open(filename, 'rb') as f:
+                lines = f.read().decode('utf-8', 'replace').split('\n')
+        except (IOError, OSError):
+            return symbols
+        for (line_num, line) in enumerate(lines, 1):
+            (kind, name) = self._definition(filename, line)
+            if kind == 'defmodule':
+                module = name
+                symbols.setdefault(module, line_num)
+            elif kind is not None and module is not None:
+                symbols.setdefault('%s.%s' % (module, name), line_num)
+        return symbols
+
+    def _definition(self, filename, line):
+        if filename.endswith('.erl'):
+            match = self.re_erlang_module.match(line)
+            if match:
+                return ('defmodule', match.group(1))
+            match = self.re_erlang_def.match(line)
+            return ('def', match.group(1)) if match else (None, None)
+        match = self.re_elixir_def.match(line)
+        return match.groups() if match else (None, None)
+
+    def _save(self):
+        tmp_file = '%s.%s' % (self._index_file, os.getpid())
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump({'files': self._files or {}, 'symbols': self._symbols}, f)
+            os.rename(tmp_file, self._index_file)
+        except (IOError, OSError):
+            pass
+
+class ElixirSenseClient:
+    _packet_header = struct.Struct('!I')
+    _max_iovec = 512
+    # project base dirs resolved in this process, by tmp dir and directory
+    _project_roots = {}
+    _project_root_check_interval = 1
+    # SourceIndex by elixir_otp_src dir
+    _source_indexes = {}
 
     def __init__(self, **kw):
         self._debug = kw.get('debug', False)
+        if self._debug:
+            enable_debug_log(levels=kw.get('log_levels'))
         self._cwd = kw.get('cwd', '')
         self.__create_tmp_dir()
-        self._cwd = self.get_project_base_dir()
+        self._cwd = self._cached_project_base_dir()
         self._ansi = kw.get('ansi', True)
         self._alchemist_script = kw.get('elixir_sense_script', None)
         self._elixir_otp_src = kw.get('elixir_otp_src', None)
+        self._compress = kw.get('compress', False)
+        self._timeout = kw.get('timeout', 10)
+        self._server_start_timeout = kw.get('server_start_timeout', 30)
+        self._server_lifetime = kw.get('server_lifetime', None)
+        self._suggestions_format = kw.get('suggestions_format', 'text')
         self.re_erlang_module = re.compile(r'^(?P<module>[a-z])')
-        self.re_elixir_src = re.compile(r'.*(/elixir.*/lib.*)')
-        self.re_erlang_src = re.compile(r'.*otp.*(/lib/.*\.erl)')
-        self.sock = None
+        self.re_subject = re.compile(r'[\w.:?!]*$')
+        self.re_subject_end = re.compile(r'^[\w?!]*')
+        self._shared_server = kw.get('shared_server', False)
+        if self._shared_server:
+            self._connection = ServerConnection.shared.setdefault(self._server_socket_path(), ServerConnection())
+        else:
+            self._connection = ServerConnection()
+        self._buffers = {}
+        self._buffer_prefix = '%s.%s:' % (os.getpid(), id(self))
+        self._suggestions_cache = SuggestionCache(kw.get('cache_size', 64))
+        self._docs_cache = DocsCache(kw.get('docs_cache_path', os.path.join(self._get_tmp_dir(), 'docs_cache')),
+                                     kw.get('cache_size', 64))
+        self._server_version = None
+        self._module_index = None
+        self._module_index_stamp = None
+        self._project_modules_stamp = None
+        self._project_modules_value = set()
+        self._traces = deque(maxlen=kw.get('trace_size', 100)) if kw.get('trace', False) else None
+        self._trace = None
+        self._build_stamp_value = 0
+        self._build_stamp_time = 0
+        self.re_hint = re.compile(r'[\w.:@?!]*$')
+        self.re_module_hint = re.compile(r'^(:\w|[A-Z])')
+        self.re_context_line = re.compile(r'^\s*(?:alias|import|require|use|defmodule)\b.*$', re.MULTILINE)
+        self.re_alias = re.compile(r'^\s*alias\s+([A-Z][\w.]*?)(?:\.\{([^}]*)\})?(?:\s*,\s*as:\s*([A-Z]\w*))?\s*$', re.MULTILINE)
 
 
     def __create_tmp_dir(self):
@@ -36,101 +455,520 @@ class ElixirSenseClient:
         if os.path.exists(dir_tmp) == False:
             os.makedirs(self._get_tmp_dir())
 
-    def process_command(self, request, source, line, column):
-        self._log('column: %s' % column)
-        self._log('line: %s' % line)
-        self._log('source: %s' % source)
-        py_struct = {
-                'request_id': 1,
-                'auth_token': None,
-                'request': request,
-                'payload': {
-                    'buffer': source,
-                    'line': int(line),
-                    'column': int(column)
-                    }
-                }
+    def process_command(self, request, source, line, column, buffer_id=None):
+        return self.process_batch([request], source, line, column, buffer_id)[0]
+
+    def process_batch(self, requests, source, line, column, buffer_id=None):
+        """
+        Sends several requests for the same buffer and cursor position (ex.
+        suggestions, signature and docs) at once. They are all in flight on
+        the same connection and the responses are matched by request_id.
+        Returns the results in the order of `requests`.
+
+        With a `buffer_id` the server keeps the buffer, only the lines
+        changed since the previous request for it are sent.
+
+        With `trace` the time spent in every stage of the call is kept, see
+        traces().
+        """
+        if self._traces is None or self._trace is not None:
+            return self._process_batch(requests, source, line, column, buffer_id)
+        self._trace = RequestTrace(requests)
+        try:
+            return self._process_batch(requests, source, line, column, buffer_id)
+        finally:
+            self._traces.append(self._trace.finish())
+            self._trace = None
+
+    def _process_batch(self, requests, source, line, column, buffer_id):
+        if 'docs' in requests and self._server_version is None:
+            self._fetch_server_version()
+            self._trace_stage('version')
+        cached = [self._cached_response(request, source, line, column) for request in requests]
+        misses = [request for (request, (key, hit)) in zip(requests, cached) if hit is None]
+        self._trace_stage('cache')
+        fetched = []
+        if misses:
+            payload = self._request_payload(source, line, column, buffer_id)
+            self._trace_stage('payload')
+            sock = self._get_socket()
+            self._trace_stage('connect')
+
+            try:
+                request_ids = [self._send_request(sock, request, payload) for request in misses]
+                fetched = [self._read_response(sock, request_id) for request_id in request_ids]
+            except Exception as e:
+                return ['error:%s' % e for request in requests]
+
+            if self._unknown_buffer(fetched, buffer_id):
+                return self.process_batch(requests, source, line, column, buffer_id)
+            if self._trace is not None:
+                for (request, response) in zip(misses, fetched):
+                    self._trace.server(request, response.get('timings') or {})
+
+        fetched = iter(fetched)
+        responses = []
+        for (key, hit) in cached:
+            if hit is None:
+                hit = next(fetched)
+                self._cache_response(key, hit)
+            responses.append(hit)
+        formatted = [self._format_response(request, response, (source, line, column)) for (request, response) in zip(requests, responses)]
+        self._trace_stage('format')
+        return formatted
+
+    def traces(self):
+        """
+        the timing breakdowns of the last `trace_size` calls, oldest first
+        """
+        return list(self._traces or [])
+
+    def trace_summary(self):
+        """
+        the median and 95th percentile of the total time and of every stage,
+        per request type
+
+        >>> alchemist = ElixirSenseClient(trace=True)
+        >>> alchemist._traces.append({'requests': ['docs'], 'total': 2.0, 'stages': {'wait': 1.5}, 'server': {'docs': {'provider': 1.0}}})
+        >>> print(alchemist.trace_summary())
+        docs (1 calls)                     p50 ms     p95 ms
+          total                              2.00       2.00
+          wait                               1.50       1.50
+          server provider                    1.00       1.00
+        """
+        lines = []
+        for requests in sorted(set(tuple(t['requests']) for t in self.traces())):
+            traces = [t for t in self.traces() if tuple(t['requests']) == requests]
+            lines.append('%-30s %10s %10s' % ('%s (%d calls)' % (', '.join(requests), len(traces)), 'p50 ms', 'p95 ms'))
+            rows = [('total', [t['total'] for t in traces])]
+            for stage in sorted(set(s for t in traces for s in t['stages'])):
+                rows.append((stage, [t['stages'][stage] for t in traces if stage in t['stages']]))
+            for stage in sorted(set(s for t in traces for r in t['server'].values() for s in r)):
+                rows.append(('server %s' % stage, [r[stage] for t in traces for r in t['server'].values() if stage in r]))
+            for (name, values) in rows:
+                values = sorted(values)
+                lines.append('  %-28s %10.2f %10.2f' % (name, values[len(values) // 2], values[int(0.95 * (len(values) - 1))]))
+        return '\n'.join(lines)
+
+    def _trace_stage(self, name):
+        if self._trace is not None:
+            self._trace.stage(name)
+
+    def module_names(self, prefix, limit=None):
+        """
+        the modules starting with `prefix`, answered from the module list
+        the server sent (all_modules) for the current build of the project
+        """
+        stamp = self._build_stamp()
+        if self._module_index is None or self._module_index_stamp != stamp:
+            modules = self.process_command('all_modules', '', 1, 1)
+            if not isinstance(modules, list):
+                return modules
+            self._module_index = ModuleIndex(modules)
+            self._module_index_stamp = stamp
+        return self._module_index.complete(prefix, limit)
+
+    def _cached_response(self, request, source, line, column):
+        """
+        returns the cache and key of a suggestions or docs request and the
+        cached response for it, if any
+        """
+        if request == 'suggestions':
+            (cache, key) = (self._suggestions_cache, self._suggestions_key(source, line, column))
+        elif request == 'docs':
+            (cache, key) = (self._docs_cache, self._docs_key(source, line, column))
+        else:
+            return (None, None)
+        if key is None:
+            return (None, None)
+        payload = cache.get(key)
+        if payload is None:
+            return ((cache, key), None)
+        return ((cache, key), {'request_id': None, 'error': None, 'payload': payload})
+
+    def _cache_response(self, cache_key, response):
+        if cache_key is not None and not response['error']:
+            (cache, key) = cache_key
+            cache.put(key, response['payload'])
+
+    def _fetch_server_version(self):
+        if self._server_version is None:
+            # traced on its own, not in the stages of the request needing it
+            (trace, self._trace) = (self._trace, None)
+            try:
+                self._set_server_version(self.process_command('version', '', 1, 1))
+            finally:
+                self._trace = trace
+
+    def _set_server_version(self, version):
+        if isinstance(version, dict):
+            self._server_version = '%s/%s' % (version['elixir'], version['otp'])
+
+    def _docs_key(self, source, line, column):
+        """
+        Docs of qualified subjects (`Enum.map`, `:lists`) are cached by the
+        module they name once the aliases of the buffer are expanded. The
+        docs of Elixir and OTP modules only depend on the version of the
+        server, the ones of modules compiled in the project (or its deps)
+        also on the project and its last build
+
+        >>> alchemist = ElixirSenseClient(cwd=tempfile.mkdtemp())
+        >>> alchemist._server_version = '1.9.4/22'
+        >>> other = ElixirSenseClient(cwd=tempfile.mkdtemp())
+        >>> other._server_version = '1.9.4/22'
+        >>> ebin = os.path.join(other._cwd, '_build', 'dev', 'lib', 'b', 'ebin')
+        >>> os.makedirs(ebin)
+        >>> open(os.path.join(ebin, 'Elixir.B.C.beam'), 'a').close()
+        >>> source = 'defmodule A do\\n  alias B.C\\n  C.foo()\\n  Enum.map()\\n  foo()\\nend'
+        >>> alchemist._docs_key(source, 3, 6) == alchemist._docs_key('B.C.foo()', 1, 7)
+        True
+        >>> alchemist._docs_key(source, 4, 8) == other._docs_key('Enum.map()', 1, 7)
+        True
+        >>> alchemist._docs_key('B.C.foo()', 1, 7) == other._docs_key('B.C.foo()', 1, 7)
+        False
+        >>> alchemist._docs_key('alias X.C\\nalias Y.C\\nC.foo()', 3, 4) is None
+        True
+        >>> alchemist._docs_key(source, 5, 4) is None
+        True
+        """
+        if self._server_version is None:
+            return None
+        subject = self._subject_at(source, line, column)
+        if not self.re_module_hint.match(subject):
+            return None
+        subject = self._expand_alias(source, subject)
+        if subject is None:
+            return None
+        if self._subject_module(subject) in self._project_modules():
+            key = (self._server_version, self._cwd, self._build_stamp(), subject)
+        else:
+            key = (self._server_version, subject)
+        return hashlib.md5(repr(key).encode('utf-8')).hexdigest()
+
+    def _expand_alias(self, source, subject):
+        """
+        the subject with its first segment replaced by the module the
+        buffer aliases it to, None when the buffer aliases it to different
+        modules or in a way that isn't understood here
+
+        >>> alchemist = ElixirSenseClient()
+        >>> alchemist._expand_alias('alias A.{B, C.D}', 'D.foo')
+        'A.C.D.foo'
+        >>> alchemist._expand_alias('alias A.B, as: X', 'X.foo')
+        'A.B.foo'
+        >>> alchemist._expand_alias('alias __MODULE__.X', 'X.foo') is None
+        True
+        """
+        if subject.startswith(':'):
+            return subject
+        (first, dot, rest) = subject.partition('.')
+        targets = set()
+        for (base, names, as_name) in self.re_alias.findall(source):
+            if names:
+                for name in names.split(','):
+                    name = name.strip()
+                    if name.split('.')[-1] == first:
+                        targets.add(base + '.' + name)
+            elif (as_name or base.split('.')[-1]) == first:
+                targets.add(base)
+        if len(targets) == 1:
+            return targets.pop() + dot + rest
+        # nested modules and aliases of other forms
+        mentioned = re.compile(r'^\s*(?:alias|defmodule)\b.*\b%s\b' % re.escape(first), re.MULTILINE)
+        if targets or mentioned.search(source):
+            return None
+        return subject
+
+    def _subject_module(self, subject):
+        """
+        >>> alchemist = ElixirSenseClient()
+        >>> (alchemist._subject_module('String.Chars.to_string'), alchemist._subject_module(':lists.map'))
+        ('Elixir.String.Chars', 'lists')
+        """
+        if subject.startswith(':'):
+            return subject[1:].partition('.')[0]
+        segments = []
+        for segment in subject.split('.'):
+            if not segment[:1].isupper():
+                break
+            segments.append(segment)
+        return '.'.join(['Elixir'] + segments)
 
-        req_erl_struct = erl_terms.encode(py_struct)
+    def _project_modules(self):
+        """
+        the modules compiled in the project and its deps, listed again when
+        the project is compiled
+        """
+        stamp = self._build_stamp()
+        if self._project_modules_stamp != stamp:
+            beams = glob.glob(os.path.join(self._cwd, '_build', '*', 'lib', '*', 'ebin', '*.beam'))
+            self._project_modules_value = set(os.path.basename(beam)[:-len('.beam')] for beam in beams)
+            self._project_modules_stamp = stamp
+        return self._project_modules_value
 
-        sock = self.__get_socket()
+    def _suggestions_key(self, source, line, column):
+        """
+        Only module (`Enum.ma`, `:gen_`) hints are cached, they depend on the
+        aliases, imports and modules of the buffer and on the compiled
+        project, but not on the scope of the cursor
+
+        >>> alchemist = ElixirSenseClient()
+        >>> source = 'defmodule A do\\n  alias B.C\\n  C.fo\\n  fo\\nend'
+        >>> alchemist._suggestions_key(source, 3, 7)[1]
+        'C.fo'
+        >>> alchemist._suggestions_key(source, 4, 5) is None
+        True
+        >>> alchemist._suggestions_key(source, 3, 7) == alchemist._suggestions_key(source.replace('C.fo', 'C.foo'), 3, 8)[:1] + ('C.fo',)
+        True
+        >>> alchemist._suggestions_key(source, 3, 7)[0] == alchemist._suggestions_key(source.replace('B.C', 'B.D'), 3, 7)[0]
+        False
+        """
+        lines = source.split('\n')
+        if line < 1 or line > len(lines):
+            return None
+        hint = self.re_hint.search(lines[line - 1][:column - 1]).group(0)
+        if not self.re_module_hint.match(hint):
+            return None
+        context = hash('\n'.join(self.re_context_line.findall(source)))
+        return ((self._cwd, self._build_stamp(), context), hint)
+
+    def _build_stamp(self):
+        """
+        the last time the project was compiled, checked at most once a
+        second
+        """
+        now = time.time()
+        if now - self._build_stamp_time > 1:
+            manifests = glob.glob(os.path.join(self._cwd, '_build', '*', 'lib', '*', '.mix', 'compile.*'))
+            self._build_stamp_value = max([self._mtime(m) for m in manifests] or [0])
+            self._build_stamp_time = now
+        return self._build_stamp_value
 
+    def _mtime(self, path):
         try:
-            resp_erl_struct = self._send_command(sock, req_erl_struct)
-        except Exception as e:
-            return 'error:%s' % e
+            return os.path.getmtime(path)
+        except OSError:
+            return 0
 
-        rep_py_struct = erl_terms.decode(resp_erl_struct)
+    def _request_payload(self, source, line, column, buffer_id=None):
+        log.debug('line: %s, column: %s, source: %d chars', line, column, len(source))
+        payload = {
+                'line': int(line),
+                'column': int(column)
+                }
+        if buffer_id is None:
+            payload['buffer'] = source
+        else:
+            payload.update(self._buffer_sync(buffer_id, source))
+        return payload
+
+    def _buffer_sync(self, buffer_id, source):
+        """
+        the lines changed since the last version sent, as one change
+        replacing the lines between the common prefix and suffix
+
+        >>> alchemist = ElixirSenseClient()
+        >>> alchemist._buffer_prefix = ''
+        >>> sorted(alchemist._buffer_sync(1, 'a\\nb\\nc').items())
+        [('buffer', 'a\\nb\\nc'), ('buffer_id', '1'), ('version', 1)]
+        >>> sorted(alchemist._buffer_sync(1, 'a\\nB\\nb\\nc').items())
+        [('base_version', 1), ('buffer_id', '1'), ('changes', [{'start': 1, 'end': 1, 'lines': ['B']}]), ('version', 2)]
+        >>> sorted(alchemist._buffer_sync(1, 'a\\nB\\nb\\nc').items())
+        [('base_version', 2), ('buffer_id', '1'), ('changes', []), ('version', 2)]
+        >>> sorted(alchemist._buffer_sync(1, 'a').items())
+        [('base_version', 2), ('buffer_id', '1'), ('changes', [{'start': 1, 'end': 4, 'lines': []}]), ('version', 3)]
+        """
+        lines = source.split('\n')
+        sync = {'buffer_id': '%s%s' % (self._buffer_prefix, buffer_id)}
+        previous = self._buffers.get(buffer_id)
+        if previous is None:
+            self._buffers[buffer_id] = (1, lines)
+            sync['version'] = 1
+            sync['buffer'] = source
+            return sync
+
+        (base_version, base_lines) = previous
+        sync['base_version'] = base_version
+        if lines == base_lines:
+            sync['version'] = base_version
+            sync['changes'] = []
+            return sync
+
+        start = 0
+        max_prefix = min(len(lines), len(base_lines))
+        while start < max_prefix and lines[start] == base_lines[start]:
+            start = start + 1
+        suffix = 0
+        max_suffix = max_prefix - start
+        while suffix < max_suffix and lines[-suffix - 1] == base_lines[-suffix - 1]:
+            suffix = suffix + 1
+
+        self._buffers[buffer_id] = (base_version + 1, lines)
+        sync['version'] = base_version + 1
+        sync['changes'] = [{
+            'start': start,
+            'end': len(base_lines) - suffix,
+            'lines': lines[start:len(lines) - suffix]
+            }]
+        return sync
+
+    def _unknown_buffer(self, responses, buffer_id):
+        """
+        the server lost the buffer (ex. it was restarted), it's sent whole
+        with the next request
+        """
+        if buffer_id is None or buffer_id not in self._buffers:
+            return False
+        if any(response['error'] == 'unknown_buffer' for response in responses):
+            del self._buffers[buffer_id]
+            return True
+        return False
+
+    def _format_response(self, request, rep_py_struct, cursor=None):
         if rep_py_struct['error']:
             return 'error:%s' % rep_py_struct['error']
-        self._log('ElixirSense: %s' % rep_py_struct)
+        format_log.debug('formatting %s response %s', request, rep_py_struct['request_id'])
         if request == "suggestions":
+            if self._suggestions_format == 'records':
+                return self.to_suggestion_records(rep_py_struct['payload'])
             return self.to_vim_suggestions(rep_py_struct['payload'])
         elif request == "docs":
             if rep_py_struct['payload']['docs']:
                 return rep_py_struct['payload']['docs']['docs']
             return rep_py_struct['payload']
         elif request == 'definition':
-            return self.to_vim_definition(rep_py_struct['payload'])
+            subject = self._definition_subject(*cursor) if cursor else (None, None)
+            return self.to_vim_definition(rep_py_struct['payload'], subject)
+        return rep_py_struct['payload']
+
+    def _next_request_id(self):
+        self._connection.request_id = self._connection.request_id + 1
+        return self._connection.request_id
 
-    def __get_socket(self):
-        if self.sock:
-            return self.sock
+    def _send_request(self, sock, request, payload):
+        request_id = self._next_request_id()
+        chunks = self._encode_request(request_id, request, payload)
+        self._trace_stage('encode')
+        self._send_command(sock, chunks)
+        self._trace_stage('send')
+        return request_id
+
+    def _encode_request(self, request_id, request, payload, cancel_key=None):
+        py_struct = {
+                'request_id': request_id,
+                'auth_token': None,
+                'request': request,
+                'payload': payload
+                }
+        if self._compress:
+            py_struct['compress'] = True
+        if cancel_key is not None:
+            py_struct['cancel_key'] = cancel_key
+        if self._traces is not None:
+            py_struct['trace'] = True
+        if self._shared_server:
+            py_struct['project'] = self._cwd
+        return erl_terms.encode_iovec(py_struct)
+
+    def _read_response(self, sock, request_id):
+        """
+        reads responses until the one for `request_id` arrives, the ones for
+        other requests in flight are kept until they're asked for
+        """
+        try:
+            while request_id not in self._connection.responses:
+                data = self._sock_readlines(sock)
+                self._trace_stage('wait')
+                codec_log.debug('decoding response of %d bytes', len(data))
+                response = erl_terms.decode(data)
+                self._trace_stage('decode')
+                if response['request_id'] is None:
+                    raise Exception(response['error'])
+                self._connection.responses[response['request_id']] = response
+        except socket.error as e:
+            self._connection_failed(sock, e)
+        return self._connection.responses.pop(request_id)
+
+    def _get_socket(self):
+        if self._connection.sock:
+            return self._connection.sock
         server_log = self._get_running_server_log()
         if server_log == None:
             server_log = self._create_server_log()
-            self._run_alchemist_server(server_log)
+            self._connection.sock = self._run_alchemist_server(server_log)
+            return self._connection.sock
 
         connection = self._extract_connection_settings(server_log)
-        if connection == None:
-            self._run_alchemist_server(server_log)
-            connection = self._extract_connection_settings(server_log)
-
         sock = self._connect(connection)
         if sock == None:
-            self._run_alchemist_server(server_log)
-            connection = self._extract_connection_settings(server_log)
-            if connection == None:
-                self._log("Couldn't find the connection settings from server_log: %s" % (server_log))
-                return  None
-            sock = self._connect(connection)
-        self.sock = sock
-        return self.sock
-
-    def to_vim_definition(self, definition):
+            self._remove_stale_socket(connection)
+            sock = self._run_alchemist_server(server_log)
+        self._connection.sock = sock
+        return self._connection.sock
+
+    def to_vim_definition(self, definition, subject=(None, None)):
+        """
+        the definition found by the server, if its file was compiled
+        somewhere else (ex. stdlib) it's looked up in the sources of
+        `elixir_otp_src` by `subject`, the (module, function) at the cursor
+        """
         if definition['found']:
             line = definition['line']
             filename = definition['file']
             if self._is_readable(filename):
                 return "%s:%s" % (filename, line)
 
-            filename = self._find_elixir_erlang_src(filename)
-            return "%s:%i" %(filename, 0)
+            index = self._source_index()
+            src_file = index.find_file(filename) if index else None
+            if src_file is None:
+                return "%s:%i" %(filename, 0)
+            (module, function) = subject
+            return "%s:%i" %(src_file, index.find_line(src_file, module, function))
         else:
             return "definition_not_found"
 
-    def to_vim_suggestions(self, suggestions):
+    def _subject_at(self, source, line, column):
+        """
+        the subject at the cursor as the server finds it, the text from its
+        start up to the end of the segment the cursor is on
+        """
+        lines = source.split('\n')
+        text = lines[int(line) - 1] if 0 < int(line) <= len(lines) else ''
+        column = int(column)
+        return self.re_subject.search(text[:column - 1]).group(0) + self.re_subject_end.match(text[column - 1:]).group(0)
+
+    def _definition_subject(self, source, line, column):
         """
         >>> alchemist = ElixirSenseClient()
-        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': 'Enum.ma'}, {'origin': 'Enum', 'arity': 2, 'name': 'map', 'args': 'enumerable,fun', 'type': 'function', 'spec': '@spec map(t, (element -> any)) :: list', 'summary': 'Returns a list where each item is the result of invoking`fun` on each corresponding item of `enumerable`.'}])
-        'kind:f, word:Enum.map, abbr:map(enumerable, fun), menu: Enum, info: @spec map(t, (element -> any)) :: list<n>Returns a list where each item is the result of invoking`fun` on each corresponding item of `enumerable`.\\n'
-        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': 'Cloud.Event'}, {'subtype': 'struct', 'type': 'module', 'name': 'Event', 'summary': ''}, {'subtype': None, 'type': 'module', 'name': 'EventBroadcaster', 'summary': ''}, {'subtype': None, 'type': 'module', 'name': 'EventConsumer', 'summary': ''}, {'subtype': None, 'type': 'module', 'name': 'EventService', 'summary': ''}])
-        'kind:m, word:Cloud.Event, abbr:Event, menu: struct, info: \\nkind:m, word:Cloud.EventBroadcaster, abbr:EventBroadcaster, menu: module, info: \\nkind:m, word:Cloud.EventConsumer, abbr:EventConsumer, menu: module, info: \\nkind:m, word:Cloud.EventService, abbr:EventService, menu: module, info: \\n'
-        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': 'Mix.'}, {'subtype': None, 'type': 'module', 'name': 'Mix', 'summary': ''}, {'subtype': None, 'type': 'module', 'name': 'Ecto', 'summary': ''},{'origin': 'Mix', 'arity': 0, 'name': 'compilers', 'args': '', 'type': 'function', 'spec': '', 'summary': 'Returns the default compilers used by Mix.'}])
-        'kind:m, word:Mix., abbr:Mix, menu: module, info: \\nkind:m, word:Mix.Ecto, abbr:Ecto, menu: module, info: \\nkind:f, word:Mix.compilers, abbr:compilers(), menu: Mix, info: Returns the default compilers used by Mix.\\n'
-        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': 'UserService.'}, {'subtype': None, 'type': 'module', 'name': 'UserService', 'summary': ''}, {'origin': 'interface.UserService', 'arity': 0, 'name': 'all_pending_users', 'args': '', 'type': 'function', 'spec': '', 'summary': 'returns all users that requested invitation'}])
-        'kind:m, word:UserService., abbr:UserService, menu: module, info: \\nkind:f, word:UserService.all_pending_users, abbr:all_pending_users(), menu: interface.UserService, info: returns all users that requested invitation\\n'
-        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': ':gen_'}, {'subtype': None, 'type': 'module', 'name': 'gen_event', 'summary': ''}, {'subtype': None, 'type': 'module', 'name': 'gen_fsm', 'summary': ''}])
-        'kind:m, word::gen_event, abbr::gen_event, menu: module, info: \\nkind:m, word::gen_fsm, abbr::gen_fsm, menu: module, info: \\n'
-        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': ':gen_server.'}, {'origin': ':gen_server', 'arity': 1, 'name': 'behaviour_info', 'args': '', 'type': 'function', 'spec': None, 'summary': ''}])
-        'kind:f, word::gen_server.behaviour_info, abbr:behaviour_info/1, menu: :gen_server, info: \\n'
-        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': 'put_'}, {'origin': 'Plug.Conn', 'arity': 3, 'name': 'put_private', 'args': 'conn,key,value', 'type': 'function', 'spec': '@spec put_private(t, atom, term) :: t', 'summary': 'Assigns a new **private** key and value in the connection.'}])
-        'kind:f, word:Plug.Conn.put_private, abbr:put_private(conn, key, value), menu: Plug.Conn, info: @spec put_private(t, atom, term) :: t<n>Assigns a new **private** key and value in the connection.\\n'
-        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': 'MyApp.Service.'}, {'subtype': None, 'type': 'module', 'name': 'Service', 'summary': ''}, {'origin': 'MyApp.Service', 'arity': 0, 'name': 'blank_capabilities', 'args': '', 'type': 'function', 'spec': '', 'summary': 'sum\\n'}])
-        'kind:m, word:MyApp.Service., abbr:Service, menu: module, info: \\nkind:f, word:MyApp.Service.blank_capabilities, abbr:blank_capabilities(), menu: MyApp.Service, info: sum\\n'
+        >>> alchemist._definition_subject('  Enum.map(list, fun)', 1, 8)
+        ('Enum', 'map')
+        >>> alchemist._definition_subject('x = :lists.map(f, l)', 1, 15)
+        ('lists', 'map')
+        >>> alchemist._definition_subject('alias String.Chars', 1, 16)
+        ('String.Chars', None)
+        >>> alchemist._definition_subject('map(list, fun)', 1, 2)
+        (None, 'map')
+        """
+        subject = self._subject_at(source, line, column).strip('.')
+        if subject.startswith(':'):
+            (module, _, function) = subject[1:].partition('.')
+            return (module, function or None)
+        (module, _, function) = subject.rpartition('.')
+        if function[:1].isupper():
+            return (subject, None)
+        return (module or None, function or None)
 
+    def to_suggestion_records(self, suggestions):
         """
-        result = ''
+        >>> alchemist = ElixirSenseClient()
+        >>> [record] = alchemist.to_suggestion_records([{'type': 'hint', 'value': 'Enum.ma'}, {'origin': 'Enum', 'arity': 2, 'name': 'map', 'args': 'enumerable,fun', 'type': 'function', 'spec': '@spec map(t, (element -> any)) :: list', 'summary': 'Returns a list, where each item is the result of invoking `fun`.'}])
+        >>> sorted(record.items())
+        [('abbr', 'map(enumerable, fun)'), ('info', '@spec map(t, (element -> any)) :: list\\nReturns a list, where each item is the result of invoking `fun`.'), ('kind', 'f'), ('menu', 'Enum'), ('word', 'Enum.map')]
+        >>> [record] = alchemist.to_suggestion_records([{'type': 'hint', 'value': ':gen_'}, {'subtype': None, 'type': 'module', 'name': 'gen_event', 'summary': ''}])
+        >>> sorted(record.items())
+        [('abbr', ':gen_event'), ('info', ''), ('kind', 'm'), ('menu', 'module'), ('word', ':gen_event')]
+        """
+        records = []
         prefix_module = ''
         hint = suggestions[0]
         if '.' in hint['value']:
@@ -142,18 +980,18 @@ class ElixirSenseClient:
                 continue
             if s['type'] == 'module':
                 mtype = s['subtype'] or s['type']
-                if ('%s.' % s['name']) == prefix_module:
+                name = s['name']
+                if ('%s.' % name) == prefix_module:
                     word = "%s" % (prefix_module)
                 else:
-                    if re.match(r'.*%s.$' %(s['name']), prefix_module):
+                    if re.match(r'.*%s.$' %(name), prefix_module):
                         word = prefix_module
                     else:
-                        word = "%s%s" % (prefix_module, s['name'])
-                if self.re_erlang_module.match(s['name']):
+                        word = "%s%s" % (prefix_module, name)
+                if self.re_erlang_module.match(name):
                     word = self.__erlang_pad(word)
-                    s['name'] = self.__erlang_pad(s['name'])
-                info = s['summary']
-                result = "%s%s" % (result, self.__suggestion_line('m', word, s['name'], mtype, info))
+                    name = self.__erlang_pad(name)
+                records.append(self.__suggestion_record('m', word, name, mtype, s['summary']))
             if s['type'] == 'function':
                 if ('%s.' % s['origin'][((len(prefix_module) -1)*-1):]) == prefix_module:
                     word = '%s%s' % (prefix_module, s['name'])
@@ -162,23 +1000,46 @@ class ElixirSenseClient:
                 if word[0] == ':':
                     args = '%s/%s' % (s['name'], s['arity'])
                 else:
-                    if s['args'] == None:
-                        s['args'] = ''
-                    args = '%s(%s)' % (s['name'], ", ".join(s['args'].split(',')))
+                    args = '%s(%s)' % (s['name'], ", ".join((s['args'] or '').split(',')))
                 info = s['summary']
                 if s['spec'] and s['summary'] != '':
                     info = '%s\n%s' % (s['spec'].strip(), s['summary'].strip())
                 elif s['spec']:
                     info = s['spec'].strip()
 
+                records.append(self.__suggestion_record('f', word, args, s['origin'], info))
+
+        return records
+
+    def to_vim_suggestions(self, suggestions):
+        """
+        >>> alchemist = ElixirSenseClient()
+        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': 'Enum.ma'}, {'origin': 'Enum', 'arity': 2, 'name': 'map', 'args': 'enumerable,fun', 'type': 'function', 'spec': '@spec map(t, (element -> any)) :: list', 'summary': 'Returns a list where each item is the result of invoking`fun` on each corresponding item of `enumerable`.'}])
+        'kind:f, word:Enum.map, abbr:map(enumerable, fun), menu: Enum, info: @spec map(t, (element -> any)) :: list<n>Returns a list where each item is the result of invoking`fun` on each corresponding item of `enumerable`.\\n'
+        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': 'Cloud.Event'}, {'subtype': 'struct', 'type': 'module', 'name': 'Event', 'summary': ''}, {'subtype': None, 'type': 'module', 'name': 'EventBroadcaster', 'summary': ''}, {'subtype': None, 'type': 'module', 'name': 'EventConsumer', 'summary': ''}, {'subtype': None, 'type': 'module', 'name': 'EventService', 'summary': ''}])
+        'kind:m, word:Cloud.Event, abbr:Event, menu: struct, info: \\nkind:m, word:Cloud.EventBroadcaster, abbr:EventBroadcaster, menu: module, info: \\nkind:m, word:Cloud.EventConsumer, abbr:EventConsumer, menu: module, info: \\nkind:m, word:Cloud.EventService, abbr:EventService, menu: module, info: \\n'
+        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': 'Mix.'}, {'subtype': None, 'type': 'module', 'name': 'Mix', 'summary': ''}, {'subtype': None, 'type': 'module', 'name': 'Ecto', 'summary': ''},{'origin': 'Mix', 'arity': 0, 'name': 'compilers', 'args': '', 'type': 'function', 'spec': '', 'summary': 'Returns the default compilers used by Mix.'}])
+        'kind:m, word:Mix., abbr:Mix, menu: module, info: \\nkind:m, word:Mix.Ecto, abbr:Ecto, menu: module, info: \\nkind:f, word:Mix.compilers, abbr:compilers(), menu: Mix, info: Returns the default compilers used by Mix.\\n'
+        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': 'UserService.'}, {'subtype': None, 'type': 'module', 'name': 'UserService', 'summary': ''}, {'origin': 'interface.UserService', 'arity': 0, 'name': 'all_pending_users', 'args': '', 'type': 'function', 'spec': '', 'summary': 'returns all users that requested invitation'}])
+        'kind:m, word:UserService., abbr:UserService, menu: module, info: \\nkind:f, word:UserService.all_pending_users, abbr:all_pending_users(), menu: interface.UserService, info: returns all users that requested invitation\\n'
+        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': ':gen_'}, {'subtype': None, 'type': 'module', 'name': 'gen_event', 'summary': ''}, {'subtype': None, 'type': 'module', 'name': 'gen_fsm', 'summary': ''}])
+        'kind:m, word::gen_event, abbr::gen_event, menu: module, info: \\nkind:m, word::gen_fsm, abbr::gen_fsm, menu: module, info: \\n'
+        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': ':gen_server.'}, {'origin': ':gen_server', 'arity': 1, 'name': 'behaviour_info', 'args': '', 'type': 'function', 'spec': None, 'summary': ''}])
+        'kind:f, word::gen_server.behaviour_info, abbr:behaviour_info/1, menu: :gen_server, info: \\n'
+        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': 'put_'}, {'origin': 'Plug.Conn', 'arity': 3, 'name': 'put_private', 'args': 'conn,key,value', 'type': 'function', 'spec': '@spec put_private(t, atom, term) :: t', 'summary': 'Assigns a new **private** key and value in the connection.'}])
+        'kind:f, word:Plug.Conn.put_private, abbr:put_private(conn, key, value), menu: Plug.Conn, info: @spec put_private(t, atom, term) :: t<n>Assigns a new **private** key and value in the connection.\\n'
+        >>> alchemist.to_vim_suggestions([{'type': 'hint', 'value': 'MyApp.Service.'}, {'subtype': None, 'type': 'module', 'name': 'Service', 'summary': ''}, {'origin': 'MyApp.Service', 'arity': 0, 'name': 'blank_capabilities', 'args': '', 'type': 'function', 'spec': '', 'summary': 'sum\\n'}])
+        'kind:m, word:MyApp.Service., abbr:Service, menu: module, info: \\nkind:f, word:MyApp.Service.blank_capabilities, abbr:blank_capabilities(), menu: MyApp.Service, info: sum\\n'
 
-                result = "%s%s" % (result, self.__suggestion_line('f', word, args, s['origin'], info))
+        """
+        return ''.join(self.__suggestion_line(r) for r in self.to_suggestion_records(suggestions))
 
-        return result
+    def __suggestion_record(self, kind, word, abbr, menu, info):
+        return {'kind': kind, 'word': word, 'abbr': abbr, 'menu': menu, 'info': info.strip()}
 
-    def __suggestion_line(self, kind, word, abbr, menu, info):
-        info = info.strip().replace('\n', "<n>")
-        return "kind:%s, word:%s, abbr:%s, menu: %s, info: %s\n" % (kind, word, abbr, menu, info)
+    def __suggestion_line(self, record):
+        info = record['info'].replace('\n', "<n>")
+        return "kind:%(kind)s, word:%(word)s, abbr:%(abbr)s, menu: %(menu)s, info: " % record + "%s\n" % info
 
     def __erlang_pad(self, module):
         if self.re_erlang_module.match(module):
@@ -186,16 +1047,8 @@ class ElixirSenseClient:
         else:
             return module
 
-    def _log(self, text):
-        if self._debug == False:
-            return
-
-        f = open("/tmp/log.log", "a")
-        f.write("%s\n" % text.encode('utf8'))
-        f.close()
-
-        #syslog.openlog("alchemist_client")
-        #syslog.syslog(syslog.LOG_ALERT, text)
+    def _log(self, text, *args):
+        log.debug(text, *args)
 
     def _get_path_unique_name(self, path):
         """
@@ -205,9 +1058,20 @@ class ElixirSenseClient:
         """
         return os.path.abspath(path).replace("/", "zS2")
 
+    def _server_log_name(self):
+        """
+        >>> ElixirSenseClient(cwd='/tmp')._server_log_name()
+        'zS2tmp'
+        >>> ElixirSenseClient(cwd='/tmp', shared_server=True)._server_log_name()
+        'shared_server'
+        """
+        if self._shared_server:
+            return 'shared_server'
+        return self._get_path_unique_name(self._cwd)
+
     def _create_server_log(self):
         dir_tmp = self._get_tmp_dir()
-        log_tmp = "%s/%s" % (dir_tmp, self._cwd.replace("/", "zS2"))
+        log_tmp = "%s/%s" % (dir_tmp, self._server_log_name())
         if os.path.exists(dir_tmp) == False:
             os.makedirs(dir_tmp)
 
@@ -218,8 +1082,8 @@ class ElixirSenseClient:
 
     def _get_running_server_log(self):
         dir_tmp = self._get_tmp_dir()
-        log_tmp = "%s/%s" % (dir_tmp, self._get_path_unique_name(self._cwd))
-        self._log("Load server settings from: %s" % (log_tmp))
+        log_tmp = "%s/%s" % (dir_tmp, self._server_log_name())
+        log.debug("Load server settings from: %s", log_tmp)
         if os.path.exists(dir_tmp) == False:
             return None
 
@@ -230,22 +1094,75 @@ class ElixirSenseClient:
 
     def _run_alchemist_server(self, server_log):
         """
-        execute alchemist server and wait until it has printed a line
-        into STDOUT
+        execute alchemist server listening on a socket file chosen here and
+        return a connection as soon as it accepts one. The server still
+        prints the connection settings into its log for other clients.
         """
         alchemist_script = self._alchemist_script
         if os.path.exists(alchemist_script) == False:
             raise Exception("alchemist script does not exist in (%s)" % alchemist_script)
-        alchemist_script = "elixir %s unix 0 dev" % alchemist_script
-        self._log(alchemist_script)
-        arg = shlex.split(alchemist_script)
+        socket_path = self._server_socket_path()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        arg = ["elixir", alchemist_script, "unix", socket_path, "dev"]
+        log.debug("Starting server: %s", arg)
+        started = time.time()
+        env = None
+        if self._server_lifetime is not None:
+            env = dict(os.environ, ALCHEMIST_SERVER_IDLE_TIMEOUT=str(self._server_lifetime))
         log_file = open(server_log, "w")
-        subprocess.Popen(arg, stdout=log_file, stderr=log_file, stdin=log_file, cwd=self._cwd)
-        for t in range(0, 50):
-            time.sleep(0.1)
-            r = open(server_log).readlines()
-            if len(r) > 0:
-                break
+        server = subprocess.Popen(arg, stdout=log_file, stderr=log_file, stdin=log_file, cwd=self._cwd, env=env)
+
+        sock = None
+        while sock == None and server.poll() == None and time.time() - started < self._server_start_timeout:
+            time.sleep(0.02)
+            if os.path.exists(socket_path):
+                sock = self._connect(("localhost", socket_path))
+        if sock == None:
+            # ex. the server fell back to tcp/ip on old OTP versions
+            sock = self._connect(self._extract_connection_settings(server_log))
+        log.debug("Server started in %.2f sec", time.time() - started)
+        return sock
+
+    def _remove_stale_socket(self, connection):
+        """
+        the server in the log doesn't accept connections anymore (ex. it was
+        killed), its socket file is removed
+
+        >>> alchemist = ElixirSenseClient()
+        >>> stale = os.path.join(tempfile.mkdtemp(), 'stale.sock')
+        >>> sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        >>> sock.bind(stale)
+        >>> sock.close()
+        >>> alchemist._remove_stale_socket(('localhost', stale))
+        >>> os.path.exists(stale)
+        False
+        """
+        if connection == None or not isinstance(connection[1], str):
+            return
+        path = connection[1]
+        if os.path.exists(path):
+            socket_log.debug("Removing socket of dead server: %s", path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _server_socket_path(self):
+        """
+        >>> alchemist = ElixirSenseClient(cwd='/tmp')
+        >>> os.path.basename(alchemist._server_socket_path())
+        'd42b9c57d24cf5db.sock'
+        >>> shared = ElixirSenseClient(cwd='/tmp', shared_server=True)
+        >>> os.path.basename(shared._server_socket_path())
+        'shared.sock'
+        >>> shared._connection is ElixirSenseClient(cwd='/', shared_server=True)._connection
+        True
+        """
+        if self._shared_server:
+            return os.path.join(self._get_tmp_dir(), "shared.sock")
+        digest = hashlib.md5(self._cwd.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self._get_tmp_dir(), "%s.sock" % digest)
 
     def _connect(self, host_port):
         if host_port == None: return None
@@ -259,81 +1176,106 @@ class ElixirSenseClient:
         try:
             sock.connect(host_port)
         except socket.error as e:
-            self._log("Can not establish connection to %s, error: %s" % (host_port, e))
+            socket_log.debug("Can not establish connection to %s, error: %s", host_port, e)
             return None
 
+        sock.settimeout(self._timeout)
         return sock
 
     def _send_command(self, sock, cmd):
-        packer = struct.Struct('!I')
-        packed_data = packer.pack(len(cmd))
+        """
+        sends the chunks of an encoded request, as returned by
+        erl_terms.encode_iovec(), as one packet
+        """
+        packed_data = self._packet_header.pack(sum(len(c) for c in cmd))
         try:
             if sock is None: raise Exception("Socket is not available.")
-            sock.sendall(packed_data + cmd)
-            return self._sock_readlines(sock)
+            self._sendall_chunks(sock, [packed_data] + cmd)
         except socket.error as e:
-            self.sock = None
-            self._log("Exception in communicating with server: %s" % e)
-            if e.errno == 35:
-                raise Exception("reached 10 sec timeout, error:Resource temporarily unavailable")
-            elif e.errno == errno.EPIPE:
-                raise Exception("Lost connection to Server. Try again, error:Resource temporarily unavailable")
-            else:
-                raise e
-
-        self._log("response for %s: %s" % (cmd.split(" ")[0], result.replace('\n', '\\n')))
-        return ''
-
-    def _find_elixir_erlang_src(self, filename):
-        if self._is_readable(filename):
-            return filename
-        if self.re_elixir_src.match(filename):
-            elixir_src_file = "%s/elixir/lib/%s" % (self._elixir_otp_src, self.re_elixir_src.match(filename).group(1))
-            if self._is_readable(elixir_src_file):
-                return os.path.realpath(elixir_src_file)
-        elif self.re_erlang_src.match(filename):
-            erlang_src_file = "%s/otp/%s" % (self._elixir_otp_src, self.re_erlang_src.match(filename).group(1))
-            if self._is_readable(erlang_src_file):
-                return os.path.realpath(erlang_src_file)
-        return filename
-
-    def _find_module_line(self, filename, module):
-        return self._find_pattern_in_file(
-                filename,
-                ["defmodule %s" % module, "-module(%s)." % module[1:]])
-
-    def _find_function_line(self, filename, function):
-        return self._find_pattern_in_file(
-                filename,
-                ["def %s" % function, "defp %s" % function, "-spec %s" % function])
-
-    def _find_pattern_in_file(self, filename, patterns):
-        if not os.path.isfile(filename) or not os.access(filename, os.R_OK):
-            return 1
-        lines = open(filename, "r").readlines()
-        for line_num, line_str in enumerate(lines):
-            matched_p = list(filter(lambda p: p in line_str, patterns))
-            if len(matched_p) > 0:
-                return line_num + 1
-        return 1
+            self._connection_failed(sock, e)
+
+    def _connection_failed(self, sock, e):
+        # a half read response would corrupt the next one, start over
+        # with a new connection
+        sock.close()
+        self._connection.sock = None
+        self._connection.responses = {}
+        socket_log.debug("Exception in communicating with server: %s", e)
+        if isinstance(e, socket.timeout):
+            raise Exception("%s, error:Resource temporarily unavailable" % e)
+        elif e.errno == 35:
+            raise Exception("reached 10 sec timeout, error:Resource temporarily unavailable")
+        elif e.errno == errno.EPIPE:
+            raise Exception("Lost connection to Server. Try again, error:Resource temporarily unavailable")
+        else:
+            raise e
+
+    def _sendall_chunks(self, sock, chunks):
+        if not hasattr(sock, 'sendmsg'):
+            sock.sendall(b''.join(chunks))
+            return
+        chunks = list(chunks)
+        while chunks:
+            sent = sock.sendmsg(chunks[:self._max_iovec])
+            while chunks and sent >= len(chunks[0]):
+                sent = sent - len(chunks[0])
+                chunks.pop(0)
+            if sent:
+                chunks[0] = memoryview(chunks[0])[sent:]
+
+    def _source_index(self):
+        if not self._elixir_otp_src:
+            return None
+        src_dir = os.path.abspath(self._elixir_otp_src)
+        if src_dir not in self._source_indexes:
+            digest = hashlib.md5(src_dir.encode('utf-8')).hexdigest()[:16]
+            index_file = os.path.join(self._get_tmp_dir(), "source_index_%s.json" % digest)
+            self._source_indexes[src_dir] = SourceIndex(src_dir, index_file)
+        return self._source_indexes[src_dir]
 
     def _is_readable(self, filename):
         if os.path.isfile(filename) and os.access(filename, os.R_OK):
             return True
         return False
 
-    def _sock_readlines(self, sock, recv_buffer=4096, timeout=10):
-        sock.setblocking(0)
-        packet_size = -1
-
-        select.select([sock], [], [], timeout)
-        data = sock.recv(recv_buffer)
-        (packet_size, ) = struct.unpack('!I', data[:4])
-        buf = data[4:]
-        while len(buf) < packet_size:
-            select.select([sock], [], [], timeout)
-            data = sock.recv(recv_buffer)
-            buf = buf + data
+    def _sock_readlines(self, sock, timeout=None):
+        """
+        reads one packet, the length header tells how big the response is so
+        it's read straight into a preallocated buffer
+
+        >>> alchemist = ElixirSenseClient()
+        >>> (server, client) = socket.socketpair()
+        >>> server.sendall(b'\\x00\\x00\\x00\\x05hello\\x00\\x00')
+        >>> alchemist._sock_readlines(client)
+        bytearray(b'hello')
+        >>> try:
+        ...     alchemist._sock_readlines(client, timeout=0.1)
+        ... except socket.timeout as e:
+        ...     print(e)
+        reached 0.1 sec timeout waiting for the server
+        """
+        if timeout is None:
+            timeout = self._timeout
+        deadline = time.time() + timeout
+        header = self._sock_recv_exactly(sock, self._packet_header.size, deadline, timeout)
+        (packet_size, ) = self._packet_header.unpack(bytes(header))
+        return self._sock_recv_exactly(sock, packet_size, deadline, timeout)
+
+    def _sock_recv_exactly(self, sock, size, deadline, timeout):
+        buf = bytearray(size)
+        view = memoryview(buf)
+        received = 0
+        while received < size:
+            remaining = deadline - time.time()
+            readable = []
+            if remaining > 0:
+                (readable, _, _) = select.select([sock], [], [], remaining)
+            if not readable:
+                raise socket.timeout("reached %s sec timeout waiting for the server" % timeout)
+            n = sock.recv_into(view[received:], size - received)
+            if n == 0:
+                raise socket.error(errno.EPIPE, "Server closed the connection")
+            received = received + n
         return buf
 
     def _extract_connection_settings(self, server_log):
@@ -348,7 +1290,7 @@ class ElixirSenseClient:
         None
         """
         for line in open(server_log, "r").readlines():
-            self._log(line)
+            log.debug("server log: %s", line)
             match = re.search(r'ok\:(?P<host>\w+):(?P<port>.*\.sock)', line)
             if match:
                 (host, port) = match.groups()
@@ -386,6 +1328,67 @@ class ElixirSenseClient:
 
         pass
 
+    def _cached_project_base_dir(self):
+        """
+        get_project_base_dir() memoized for the process. The base dir is
+        resolved again when the server log or the mix.exs of one of the
+        directories up from cwd is added or removed, which is checked at most
+        once a second. Other files written to the tmp dir (caches, logs of
+        other projects) don't invalidate it.
+
+        >>> tmp_dir = tempfile.mkdtemp()
+        >>> lib_dir = os.path.join(tmp_dir, "lib")
+        >>> os.mkdir(lib_dir)
+        >>> ElixirSenseClient(cwd=lib_dir)._cwd == lib_dir
+        True
+        >>> open(os.path.join(tmp_dir, "mix.exs"), 'a').close()
+        >>> ElixirSenseClient(cwd=lib_dir)._cwd == lib_dir
+        True
+        >>> ElixirSenseClient._project_root_check_interval = 0
+        >>> ElixirSenseClient(cwd=lib_dir)._cwd == tmp_dir
+        True
+        >>> ElixirSenseClient._project_root_check_interval = 1
+        """
+        key = (self._get_tmp_dir(), self._cwd)
+        now = time.time()
+        cached = self._project_roots.get(key)
+        if cached is not None and now - cached[2] <= self._project_root_check_interval:
+            return cached[0]
+
+        stamp = self._project_root_stamp()
+        if cached is not None and cached[1] == stamp:
+            root = cached[0]
+        else:
+            root = self.get_project_base_dir()
+        self._project_roots[key] = (root, stamp, now)
+        return root
+
+    def _project_root_stamp(self):
+        """
+        the markers get_project_base_dir() looks for in the directories up
+        from cwd
+
+        >>> tmp_dir = tempfile.mkdtemp()
+        >>> alchemist = ElixirSenseClient(cwd=tmp_dir)
+        >>> stamp = alchemist._project_root_stamp()
+        >>> open(os.path.join(alchemist._get_tmp_dir(), 'docs_cache'), 'a').close()
+        >>> alchemist._project_root_stamp() == stamp
+        True
+        >>> open(os.path.join(tmp_dir, "mix.exs"), 'a').close()
+        >>> alchemist._project_root_stamp() == stamp
+        False
+        """
+        dir_tmp = self._get_tmp_dir()
+        stamp = []
+        paths = self._cwd.split(os.sep)
+        for i in range(len(paths)):
+            project_dir = os.sep.join(paths[:len(paths)-i])
+            if project_dir:
+                stamp.append((
+                    os.path.exists(os.path.join(dir_tmp, project_dir.replace("/", "zS2"))),
+                    os.path.exists(os.path.join(project_dir, "mix.exs"))))
+        return stamp
+
     def get_project_base_dir(self, running_servers_logs=None):
         """
         >>> #prepare the test env
@@ -441,13 +1444,13 @@ class ElixirSenseClient:
                 continue
             log_tmp = "%s" % project_dir.replace("/", "zS2")
             if log_tmp in running_servers_logs:
-                self._log("project_dir(matched): "+str(project_dir))
+                log.debug("project_dir(matched): %s", project_dir)
                 return project_dir
 
             if os.path.exists(os.path.join(project_dir, "mix.exs")):
                 mix_dir.append(project_dir)
 
-        self._log("mix_dir: "+str(mix_dir))
+        log.debug("mix_dir: %s", mix_dir)
         if len(mix_dir):
             return mix_dir.pop()
 
@@ -3,6 +3,7 @@ defmodule Alchemist.Helpers.Complete do
   @builtin_functions [{:__info__, 1}, {:module_info, 0}, {:module_info, 1}]
 
   alias Alchemist.Helpers.ModuleInfo
+  alias Alchemist.Helpers.ModuleIndex
   alias ElixirSense.Core.Introspection
 
   @moduledoc false
@@ -283,42 +284,14 @@ defmodule Alchemist.Helpers.Complete do
   end
 
   defp match_modules(hint, root) do
-    root
-    |> get_modules()
-    |> :lists.usort()
-    |> Enum.drop_while(& not starts_with?(&1, hint))
-    |> Enum.take_while(& starts_with?(&1, hint))
-  end
-
-  defp get_modules(true) do
-    ["Elixir.Elixir"] ++ get_modules(false)
-  end
-
-  defp get_modules(false) do
-    modules = Enum.map(:code.all_loaded(), &Atom.to_string(elem(&1, 0)))
-    case :code.get_mode() do
-      :interactive -> modules ++ get_modules_from_applications()
-      _otherwise -> modules
-    end
-  end
-
-  defp get_modules_from_applications do
-    for [app] <- loaded_applications(),
-    {:ok, modules} = :application.get_key(app, :modules),
-    module <- modules do
-      Atom.to_string(module)
+    modules = ModuleIndex.match(hint)
+    if root and starts_with?("Elixir.Elixir", hint) do
+      :lists.umerge(["Elixir.Elixir"], modules)
+    else
+      modules
     end
   end
 
-  defp loaded_applications do
-    # If we invoke :application.loaded_applications/0,
-    # it can error if we don't call safe_fixtable before.
-    # Since in both cases we are reaching over the
-    # application controller internals, we choose to match
-    # for performance.
-    :ets.match(:ac_tab, {{:loaded, :"$1"}, :_})
-  end
-
   defp match_module_funs(mod, hint) do
     case ensure_loaded(mod) do
       {:module, _} ->
@@ -0,0 +1,84 @@
+defmodule Alchemist.Helpers.ModuleIndex do
+
+  @moduledoc false
+
+  # Sorted names of the loaded modules and of the modules of the loaded
+  # applications, in an ordered_set owned by the process that created it
+  # (the ContextLoader in the server) and updated when it reloads the
+  # project. Prefix matches are range scans of the table merged with the
+  # modules loaded since (modules are loaded lazily in interactive mode),
+  # without the table they fall back to listing and filtering every module.
+
+  @table __MODULE__
+
+  def new do
+    :ets.new(@table, [:ordered_set, :named_table, :public, read_concurrency: true])
+    :ets.insert(@table, for(name <- module_names(), do: {name}))
+    :ok
+  end
+
+  # Only the modules that appeared or went away since the last update are
+  # written, completions running meanwhile see a consistent list
+  def update do
+    names = MapSet.new(module_names())
+    indexed = MapSet.new(:ets.select(@table, [{{:"$1"}, [], [:"$1"]}]))
+    for name <- MapSet.difference(indexed, names), do: :ets.delete(@table, name)
+    :ets.insert(@table, for(name <- MapSet.difference(names, indexed), do: {name}))
+    :ok
+  end
+
+  def match(hint) do
+    case :ets.info(@table, :size) do
+      :undefined ->
+        module_names()
+        |> :lists.usort()
+        |> Enum.drop_while(& not String.starts_with?(&1, hint))
+        |> Enum.take_while(&String.starts_with?(&1, hint))
+      _ ->
+        first = if :ets.member(@table, hint), do: hint, else: :ets.next(@table, hint)
+        :lists.umerge(take_prefixed(first, hint, []), loaded_prefixed(hint))
+    end
+  end
+
+  defp take_prefixed(:"$end_of_table", _hint, acc), do: Enum.reverse(acc)
+  defp take_prefixed(name, hint, acc) do
+    if String.starts_with?(name, hint) do
+      take_prefixed(:ets.next(@table, name), hint, [name | acc])
+    else
+      Enum.reverse(acc)
+    end
+  end
+
+  defp loaded_prefixed(hint) do
+    :code.all_loaded()
+    |> Enum.map(&Atom.to_string(elem(&1, 0)))
+    |> Enum.filter(&String.starts_with?(&1, hint))
+    |> :lists.usort()
+  end
+
+  defp module_names do
+    modules = Enum.map(:code.all_loaded(), &Atom.to_string(elem(&1, 0)))
+    case :code.get_mode() do
+      :interactive -> modules ++ get_modules_from_applications()
+      _otherwise -> modules
+    end
+  end
+
+  defp get_modules_from_applications do
+    for [app] <- loaded_applications(),
+    {:ok, modules} = :application.get_key(app, :modules),
+    module <- modules do
+      Atom.to_string(module)
+    end
+  end
+
+  defp loaded_applications do
+    # If we invoke :application.loaded_applications/0,
+    # it can error if we don't call safe_fixtable before.
+    # Since in both cases we are reaching over the
+    # application controller internals, we choose to match
+    # for performance.
+    :ets.match(:ac_tab, {{:loaded, :"$1"}, :_})
+  end
+
+end
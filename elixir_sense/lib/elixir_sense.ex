@@ -39,8 +39,15 @@ defmodule ElixirSense do
   """
   @spec docs(String.t, pos_integer, pos_integer) :: %{subject: String.t, actual_subject: String.t, docs: Introspection.docs}
   def docs(code, line, column) do
+    docs(code, line, column, Parser.parse_string(code, true, true, line))
+  end
+
+  @doc """
+  Same as `docs/3`, using the metadata already parsed from `code`.
+  """
+  @spec docs(String.t, pos_integer, pos_integer, Metadata.t) :: %{subject: String.t, actual_subject: String.t, docs: Introspection.docs}
+  def docs(code, line, column, metadata) do
     subject = Source.subject(code, line, column)
-    metadata = Parser.parse_string(code, true, true, line)
     %State.Env{
       imports: imports,
       aliases: aliases,
@@ -68,8 +75,15 @@ defmodule ElixirSense do
   """
   @spec definition(String.t, pos_integer, pos_integer) :: Definition.location
   def definition(code, line, column) do
+    definition(code, line, column, Parser.parse_string(code, true, true, line))
+  end
+
+  @doc """
+  Same as `definition/3`, using the metadata already parsed from `code`.
+  """
+  @spec definition(String.t, pos_integer, pos_integer, Metadata.t) :: Definition.location
+  def definition(code, line, column, buffer_file_metadata) do
     subject = Source.subject(code, line, column)
-    buffer_file_metadata = Parser.parse_string(code, true, true, line)
     %State.Env{
       imports: imports,
       aliases: aliases,
@@ -134,8 +148,15 @@ defmodule ElixirSense do
   """
   @spec suggestions(String.t, non_neg_integer, non_neg_integer) :: [Suggestion.suggestion]
   def suggestions(buffer, line, column) do
+    suggestions(buffer, line, column, Parser.parse_string(buffer, true, true, line))
+  end
+
+  @doc """
+  Same as `suggestions/3`, using the metadata already parsed from `buffer`.
+  """
+  @spec suggestions(String.t, non_neg_integer, non_neg_integer, Metadata.t) :: [Suggestion.suggestion]
+  def suggestions(buffer, line, column, buffer_file_metadata) do
     hint = Source.prefix(buffer, line, column)
-    buffer_file_metadata = Parser.parse_string(buffer, true, true, line)
     text_before = Source.text_before(buffer, line, column)
     %State.Env{
       imports: imports,
@@ -178,8 +199,15 @@ defmodule ElixirSense do
   """
   @spec signature(String.t, pos_integer, pos_integer) :: Signature.signature_info
   def signature(code, line, column) do
+    signature(code, line, column, Parser.parse_string(code, true, true, line))
+  end
+
+  @doc """
+  Same as `signature/3`, using the metadata already parsed from `code`.
+  """
+  @spec signature(String.t, pos_integer, pos_integer, Metadata.t) :: Signature.signature_info
+  def signature(code, line, column, buffer_file_metadata) do
     prefix = Source.text_before(code, line, column)
-    buffer_file_metadata = Parser.parse_string(code, true, true, line)
     %State.Env{
       imports: imports,
       aliases: aliases,
@@ -12,6 +12,8 @@ defmodule ElixirSense.Core.Metadata do
             vars_info_per_scope_id: %{},
             error: nil
 
+  @type t :: %__MODULE__{}
+
   def get_env(%__MODULE__{} = metadata, line_number) do
     case Map.get(metadata.lines_to_env, line_number) do
       nil -> %State.Env{}
@@ -5,6 +5,7 @@ defmodule ElixirSense.Core.Parser do
 
   alias ElixirSense.Core.MetadataBuilder
   alias ElixirSense.Core.Metadata
+  alias ElixirSense.Core.ParserCache
 
   def parse_file(file, try_to_fix_parse_error, try_to_fix_line_not_found, cursor_line_number) do
     case File.read(file) do
@@ -14,50 +15,78 @@ defmodule ElixirSense.Core.Parser do
     end
   end
 
+  # The metadata of a buffer that parses as is doesn't depend on the cursor
+  # line, it's cached once for every line it has an env for. The buffers
+  # repaired for a parse error or a line without env are cached per line.
   def parse_string(source, try_to_fix_parse_error, try_to_fix_line_not_found, cursor_line_number) do
-    case string_to_ast(source, try_to_fix_parse_error, cursor_line_number) do
-      {:ok, ast} ->
-        acc = MetadataBuilder.build(ast)
-        if Map.has_key?(acc.lines_to_env, cursor_line_number) or !try_to_fix_line_not_found  do
-          %Metadata{
-            source: source,
-            mods_funs_to_positions: acc.mods_funs_to_positions,
-            lines_to_env: acc.lines_to_env,
-            vars_info_per_scope_id: acc.vars_info_per_scope_id,
-          }
-        else
-          # IO.puts :stderr, "LINE NOT FOUND"
-          source
-          |> fix_line_not_found(cursor_line_number)
-          |> parse_string(false, false, cursor_line_number)
-        end
-      {:error, error} ->
-        # IO.puts :stderr, "CAN'T FIX IT"
-        # IO.inspect :stderr, error, []
-        %Metadata{
-          source: source,
-          error: error
-        }
+    hash = ParserCache.hash(source)
+    parsed = ParserCache.fetch({hash, :as_is}, fn -> parse_as_is(source) end)
+    if found?(parsed, try_to_fix_line_not_found, cursor_line_number) do
+      parsed
+    else
+      key = {hash, try_to_fix_parse_error, try_to_fix_line_not_found, cursor_line_number}
+      ParserCache.fetch(key, fn ->
+        repair(source, parsed, try_to_fix_parse_error, try_to_fix_line_not_found, cursor_line_number)
+      end)
     end
   end
 
-  defp string_to_ast(source, try_to_fix_parse_error, cursor_line_number) do
+  defp found?(%Metadata{lines_to_env: lines_to_env}, try_to_fix_line_not_found, cursor_line_number) do
+    Map.has_key?(lines_to_env, cursor_line_number) or !try_to_fix_line_not_found
+  end
+  defp found?(_error, _try_to_fix_line_not_found, _cursor_line_number), do: false
+
+  defp parse_as_is(source) do
     case Code.string_to_quoted(source, columns: true) do
+      {:ok, ast} -> metadata(source, ast)
+      error -> error
+    end
+  end
+
+  defp repair(source, %Metadata{}, _try_to_fix_parse_error, _try_to_fix_line_not_found, cursor_line_number) do
+    # IO.puts :stderr, "LINE NOT FOUND"
+    source = fix_line_not_found(source, cursor_line_number)
+    case parse_as_is(source) do
+      %Metadata{} = metadata -> metadata
+      {:error, error} -> %Metadata{source: source, error: error}
+    end
+  end
+
+  defp repair(source, error, true, try_to_fix_line_not_found, cursor_line_number) do
+    # IO.puts :stderr, "PARSE ERROR"
+    # IO.inspect :stderr, error, []
+    case source |> fix_parse_error(cursor_line_number, error) |> Code.string_to_quoted(columns: true) do
       {:ok, ast} ->
-        {:ok, ast}
-      error ->
-        # IO.puts :stderr, "PARSE ERROR"
-        # IO.inspect :stderr, error, []
-        if try_to_fix_parse_error do
-          source
-          |> fix_parse_error(cursor_line_number, error)
-          |> string_to_ast(false, cursor_line_number)
+        metadata = metadata(source, ast)
+        if found?(metadata, try_to_fix_line_not_found, cursor_line_number) do
+          metadata
         else
-          error
+          repair(source, metadata, false, false, cursor_line_number)
         end
+      error ->
+        repair(source, error, false, try_to_fix_line_not_found, cursor_line_number)
     end
   end
 
+  defp repair(source, {:error, error}, false, _try_to_fix_line_not_found, _cursor_line_number) do
+    # IO.puts :stderr, "CAN'T FIX IT"
+    # IO.inspect :stderr, error, []
+    %Metadata{
+      source: source,
+      error: error
+    }
+  end
+
+  defp metadata(source, ast) do
+    acc = MetadataBuilder.build(ast)
+    %Metadata{
+      source: source,
+      mods_funs_to_positions: acc.mods_funs_to_positions,
+      lines_to_env: acc.lines_to_env,
+      vars_info_per_scope_id: acc.vars_info_per_scope_id,
+    }
+  end
+
   defp fix_parse_error(source, _cursor_line_number, {:error, {line, {"\"" <> <<_::bytes-size(1)>> <> "\" is missing terminator" <> _, _}, _}}) when is_integer(line) do
     source
     |> replace_line_with_marker(line)
@@ -0,0 +1,100 @@
+defmodule ElixirSense.Core.ParserCache do
+  @moduledoc """
+  Metadata of the parsed buffers, keyed by the hash of their content, so a
+  buffer is parsed once while the cursor moves around or different requests
+  are made for it.
+
+  The table is owned by this process and shared by the request handlers.
+  Entries are accounted with their external size, which unlike the memory
+  of the table includes the buffer binaries. When the total grows over
+  `@max_memory` bytes the least recently used entries are evicted until it's
+  back under `@target_memory`. Without the process (the parser used outside
+  the server) nothing is cached.
+  """
+  use GenServer
+
+  @table __MODULE__
+  @max_memory 64 * 1024 * 1024
+  @target_memory 48 * 1024 * 1024
+
+  def start_link do
+    GenServer.start_link(__MODULE__, [], [name: __MODULE__])
+  end
+
+  def init([]) do
+    :ets.new(@table, [:set, :named_table, :public, read_concurrency: true, write_concurrency: true])
+    {:ok, nil}
+  end
+
+  def hash(source) do
+    :erlang.md5(source)
+  end
+
+  @doc """
+  Returns the value cached for `key`, or computes it with `fun` and caches it.
+  """
+  def fetch(key, fun) do
+    case lookup(key) do
+      {:ok, value} ->
+        value
+      :error ->
+        value = fun.()
+        put(key, value)
+        value
+    end
+  end
+
+  def clear do
+    if cache?(), do: :ets.delete_all_objects(@table)
+    :ok
+  end
+
+  def handle_cast(:evict, state) do
+    if memory() > @max_memory do
+      :ets.select(@table, [{{:"$1", :_, :"$2", :"$3"}, [], [{{:"$2", :"$1", :"$3"}}]}])
+      |> Enum.sort()
+      |> Enum.reduce_while(nil, fn {_used, key, size}, _ ->
+        :ets.delete(@table, key)
+        if :ets.update_counter(@table, :memory, -size) > @target_memory, do: {:cont, nil}, else: {:halt, nil}
+      end)
+    end
+    {:noreply, state}
+  end
+
+  defp lookup(key) do
+    if cache?() do
+      case :ets.lookup(@table, key) do
+        [{^key, value, _used, _size}] ->
+          :ets.update_element(@table, key, {3, :erlang.monotonic_time()})
+          {:ok, value}
+        [] ->
+          :error
+      end
+    else
+      :error
+    end
+  end
+
+  defp put(key, value) do
+    if cache?() do
+      size = :erlang.external_size(value)
+      # the value of a key computed concurrently is only counted once
+      if :ets.insert_new(@table, {key, value, :erlang.monotonic_time(), size}) and
+          :ets.update_counter(@table, :memory, size, {:memory, 0}) > @max_memory do
+        GenServer.cast(__MODULE__, :evict)
+      end
+    end
+  end
+
+  defp cache? do
+    :ets.info(@table, :size) != :undefined
+  end
+
+  defp memory do
+    case :ets.lookup(@table, :memory) do
+      [{:memory, memory}] -> memory
+      [] -> 0
+    end
+  end
+
+end
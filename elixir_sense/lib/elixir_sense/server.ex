@@ -30,6 +30,7 @@ defmodule ElixirSense.Server do
     case IO.gets("") do
       :eof ->
         IO.puts(:stderr, "Stopping ElixirSense server")
+        TCPServer.remove_socket_file()
       _  ->
         loop()
     end
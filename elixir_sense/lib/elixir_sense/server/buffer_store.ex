@@ -0,0 +1,138 @@
+defmodule ElixirSense.Server.BufferStore do
+  @moduledoc """
+  Keeps the buffers of the clients, so after sending a buffer once they only
+  send the lines that changed since the version the server has.
+
+  Buffers are identified by the `"buffer_id"` chosen by the client. A payload
+  either opens the buffer with the whole text (`"buffer"`) or sends a list of
+  `"changes"` from `"base_version"` to `"version"`. A change replaces the lines
+  from `"start"` up to, but not including, `"end"` (0-based) with `"lines"`.
+
+  The metadata parsed for a version is kept with the buffer and reused while
+  the buffer doesn't change.
+  """
+
+  alias ElixirSense.Core.Parser
+
+  @max_buffers 32
+
+  defmodule UnknownBufferError do
+    defexception message: "unknown_buffer"
+  end
+
+  def start_link do
+    Agent.start_link(fn -> %{} end, name: __MODULE__)
+  end
+
+  @doc """
+  Applies the buffer sent in the payload and returns the buffer text and its
+  metadata for the given line. Raises UnknownBufferError when the server
+  doesn't have the version the changes are based on, the client must send
+  the whole buffer then.
+  """
+  def sync(%{"buffer_id" => buffer_id, "version" => version, "line" => line} = payload) do
+    source = update(buffer_id, version, payload)
+    {source, metadata(buffer_id, version, source, line)}
+  end
+
+  @doc """
+  Applies the buffer sent in the payload before the request is handled, in
+  the order the requests were received, so cancelling the request doesn't
+  lose the changes. The returned payload carries the text of the applied
+  version, so the request is served from it even when the requests pipelined
+  after it stored newer versions. A payload that can't be applied is returned
+  as is and `sync/1` raises for it.
+  """
+  def apply_buffer(%{"buffer_id" => buffer_id, "version" => version} = payload) do
+    source = update(buffer_id, version, payload)
+    payload
+    |> Map.drop(["buffer", "changes", "base_version"])
+    |> Map.put(:applied_source, source)
+  rescue
+    UnknownBufferError -> payload
+  end
+  def apply_buffer(payload), do: payload
+
+  def close(buffer_id) do
+    Agent.update(__MODULE__, &Map.delete(&1, buffer_id))
+  end
+
+  def apply_changes(lines, changes) do
+    Enum.reduce(changes, lines, fn %{"start" => first, "end" => last, "lines" => new_lines}, lines ->
+      Enum.take(lines, first) ++ new_lines ++ Enum.drop(lines, last)
+    end)
+  end
+
+  defp update(_buffer_id, _version, %{applied_source: source}) do
+    source
+  end
+
+  defp update(buffer_id, version, %{"buffer" => source}) do
+    Agent.update(__MODULE__, fn buffers ->
+      put_buffer(buffers, buffer_id, version, String.split(source, "\n"), source)
+    end)
+    source
+  end
+
+  defp update(buffer_id, version, %{"changes" => changes, "base_version" => base_version}) do
+    result = Agent.get_and_update(__MODULE__, fn buffers ->
+      case Map.get(buffers, buffer_id) do
+        %{version: ^version, source: source} ->
+          {{:ok, source}, buffers}
+        %{version: ^base_version, lines: lines} ->
+          lines = apply_changes(lines, changes)
+          source = Enum.join(lines, "\n")
+          {{:ok, source}, put_buffer(buffers, buffer_id, version, lines, source)}
+        _ ->
+          {:error, buffers}
+      end
+    end)
+
+    case result do
+      {:ok, source} -> source
+      :error -> raise UnknownBufferError
+    end
+  end
+
+  defp update(buffer_id, version, _payload) do
+    case Agent.get(__MODULE__, &Map.get(&1, buffer_id)) do
+      %{version: ^version, source: source} -> source
+      _ -> raise UnknownBufferError
+    end
+  end
+
+  defp metadata(buffer_id, version, source, line) do
+    cached = Agent.get(__MODULE__, fn buffers ->
+      case Map.get(buffers, buffer_id) do
+        %{version: ^version, metadata: metadata} -> metadata
+        _ -> nil
+      end
+    end)
+
+    if cached && Map.has_key?(cached.lines_to_env, line) do
+      cached
+    else
+      metadata = Parser.parse_string(source, true, true, line)
+      Agent.update(__MODULE__, fn buffers ->
+        case Map.get(buffers, buffer_id) do
+          %{version: ^version} = buffer -> Map.put(buffers, buffer_id, %{buffer | metadata: metadata})
+          _ -> buffers
+        end
+      end)
+      metadata
+    end
+  end
+
+  defp put_buffer(buffers, buffer_id, version, lines, source) do
+    buffer = %{version: version, lines: lines, source: source, metadata: nil, used: :erlang.monotonic_time()}
+    buffers
+    |> Map.put(buffer_id, buffer)
+    |> evict()
+  end
+
+  defp evict(buffers) when map_size(buffers) > @max_buffers do
+    {buffer_id, _} = Enum.min_by(buffers, fn {_, %{used: used}} -> used end)
+    Map.delete(buffers, buffer_id)
+  end
+  defp evict(buffers), do: buffers
+end
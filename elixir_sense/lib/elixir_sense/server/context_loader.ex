@@ -4,14 +4,24 @@ defmodule ElixirSense.Server.ContextLoader do
   """
   use GenServer
 
+  alias Alchemist.Helpers.ModuleIndex
+
+  # How often, at most, the build artifacts are checked for changes
   @minimal_reload_time 2000
+  # Projects sharing the server whose env (see set_context/2) is remembered
+  # while another one is loaded
+  @max_contexts 8
 
   def start_link(env) do
     GenServer.start_link(__MODULE__, env, [name: __MODULE__])
   end
 
+  # Listing the loaded modules is left for after the server started, calls
+  # are only handled after it
   def init(env) do
-    {:ok, {all_loaded(), [], [], env, Path.expand("."), 0}}
+    send(self(), :load)
+    Application.put_env(:elixir_sense, :env, env)
+    {:ok, {[], [], [], env, Path.expand("."), 0, nil, %{}, {%{}, []}}}
   end
 
   def set_context(env, cwd) do
@@ -22,36 +32,136 @@ defmodule ElixirSense.Server.ContextLoader do
     GenServer.call(__MODULE__, :get_state)
   end
 
-  def reload do
-    GenServer.call(__MODULE__, :reload)
+  @doc """
+  Makes sure the context of `project` (the current one when nil) is loaded
+  and up to date, and keeps it loaded until the calling process calls
+  `release/0` or exits. Switching or reloading a project purges the modules
+  of the loaded one, so it waits for the processes holding it.
+  """
+  def reload(project \\ nil) do
+    GenServer.call(__MODULE__, {:reload, project}, :infinity)
   end
 
-  def handle_call(:reload, _from, {loaded, paths, apps, env, cwd, last_load_time}) do
-    time = :erlang.system_time(:milli_seconds)
-    reload = time - last_load_time > @minimal_reload_time
-
-    {new_paths, new_apps} =
-      if reload do
-        purge_modules(loaded)
-        purge_paths(paths)
-        purge_apps(apps)
-        {load_paths("test", cwd), load_apps("test", cwd)}
-        {load_paths(env, cwd), load_apps(env, cwd)}
-      else
-        {paths, apps}
-      end
+  def release do
+    GenServer.cast(__MODULE__, {:release, self()})
+  end
 
-    {:reply, :ok, {loaded, new_paths, new_apps, env, cwd, time}}
+  def handle_call({:reload, project}, from, state) do
+    {:noreply, checkout(from, project, state)}
   end
 
-  def handle_call({:set_context, {env, cwd}}, _from, {loaded, paths, apps, _env, _cwd, last_load_time}) do
-    {:reply, {env, cwd}, {loaded, paths, apps, env, cwd, last_load_time}}
+  def handle_call({:set_context, {env, cwd}}, _from, {loaded, paths, apps, _env, _cwd, _last_check_time, _fingerprint, contexts, requests}) do
+    {:reply, {env, cwd}, {loaded, paths, apps, env, cwd, 0, nil, contexts, requests}}
   end
 
   def handle_call(:get_state, _from, state) do
     {:reply, state, state}
   end
 
+  def handle_cast({:release, pid}, state) do
+    {:noreply, state |> release(pid) |> serve_waiting()}
+  end
+
+  # The module index used by completions lives as long as this process
+  def handle_info(:load, {_loaded, paths, apps, env, cwd, last_check_time, fingerprint, contexts, requests}) do
+    loaded = all_loaded()
+    ModuleIndex.new()
+    {:noreply, {loaded, paths, apps, env, cwd, last_check_time, fingerprint, contexts, requests}}
+  end
+
+  def handle_info({:DOWN, _ref, :process, pid, _reason}, state) do
+    {:noreply, state |> release(pid) |> serve_waiting()}
+  end
+
+  # Callers are served in order, once one of them waits for the loaded
+  # context to be released the following ones wait too
+  defp checkout({pid, _} = from, project, state) do
+    state = release(state, pid)
+    {holders, waiting} = elem(state, 8)
+    case check(project, state) do
+      {:current, state} when waiting == [] ->
+        GenServer.reply(from, :ok)
+        hold(state, pid)
+      {:stale, state} when holders == %{} and waiting == [] ->
+        state = load(project, state)
+        GenServer.reply(from, :ok)
+        hold(state, pid)
+      {_, state} ->
+        put_elem(state, 8, {holders, waiting ++ [{from, project}]})
+    end
+  end
+
+  defp serve_waiting({_, _, _, _, _, _, _, _, {holders, waiting}} = state) when holders == %{} do
+    state = put_elem(state, 8, {holders, []})
+    Enum.reduce(waiting, state, fn {from, project}, state -> checkout(from, project, state) end)
+  end
+  defp serve_waiting(state), do: state
+
+  defp hold({_, _, _, _, _, _, _, _, {holders, waiting}} = state, pid) do
+    put_elem(state, 8, {Map.put(holders, pid, Process.monitor(pid)), waiting})
+  end
+
+  defp release({_, _, _, _, _, _, _, _, {holders, waiting}} = state, pid) do
+    case Map.pop(holders, pid) do
+      {nil, _} ->
+        state
+      {ref, holders} ->
+        Process.demonitor(ref, [:flush])
+        put_elem(state, 8, {holders, waiting})
+    end
+  end
+
+  # Requests of another project sharing the server need it to be loaded, the
+  # loaded project is only reloaded when its build artifacts changed since
+  # the last load
+  defp check(project, {_, _, _, _, cwd, _, _, _, _} = state) when is_binary(project) and project != cwd do
+    {:stale, state}
+  end
+
+  defp check(_project, {_, _, _, env, cwd, last_check_time, fingerprint, _, _} = state) do
+    time = :erlang.system_time(:milli_seconds)
+
+    if time - last_check_time > @minimal_reload_time do
+      case build_fingerprint(env, cwd) do
+        ^fingerprint -> {:current, put_elem(state, 5, time)}
+        _ -> {:stale, state}
+      end
+    else
+      {:current, state}
+    end
+  end
+
+  # The env of a project is the one it had when it was switched away from
+  defp load(project, {loaded, paths, apps, env, cwd, _last_check_time, _fingerprint, contexts, requests})
+      when is_binary(project) and project != cwd do
+    contexts = put_context(contexts, cwd, env)
+    default_env = Application.get_env(:elixir_sense, :env, env)
+    {project_env, _} = Map.get(contexts, project, {default_env, 0})
+    load(nil, {loaded, paths, apps, project_env, project, 0, nil, contexts, requests})
+  end
+
+  defp load(_project, {loaded, paths, apps, env, cwd, _last_check_time, _fingerprint, contexts, requests}) do
+    time = :erlang.system_time(:milli_seconds)
+    fingerprint = build_fingerprint(env, cwd)
+    purge_modules(loaded)
+    purge_paths(paths)
+    purge_apps(apps)
+    {load_paths("test", cwd), load_apps("test", cwd)}
+    state = {loaded, load_paths(env, cwd), load_apps(env, cwd), env, cwd, time, fingerprint, contexts, requests}
+    ModuleIndex.update()
+    state
+  end
+
+  defp put_context(contexts, cwd, env) do
+    contexts = Map.put(contexts, cwd, {env, :erlang.monotonic_time()})
+    if map_size(contexts) > @max_contexts do
+      {project, _} = Enum.min_by(contexts, fn {_, {_, used}} -> used end)
+      Map.delete(contexts, project)
+    else
+      contexts
+    end
+  end
+
   defp preload_modules(modules) do
     modules |> Enum.each(fn mod ->
       {:module, _} = Code.ensure_loaded(mod)
@@ -63,6 +173,20 @@ defmodule ElixirSense.Server.ContextLoader do
     for {m, _} <- :code.all_loaded, do: m
   end
 
+  # Mix rewrites the manifests on every compilation, the ebin dirs change
+  # when modules or apps are added or removed
+  defp build_fingerprint(env, cwd) do
+    ["_build/#{env}/lib/*/.mix/compile.*", "_build/#{env}/lib/*/ebin"]
+    |> Enum.flat_map(&Path.wildcard(Path.join(cwd, &1), match_dot: true))
+    |> Enum.map(fn path ->
+      case File.stat(path) do
+        {:ok, %File.Stat{mtime: mtime}} -> {path, mtime}
+        _ -> {path, nil}
+      end
+    end)
+    |> Enum.sort()
+  end
+
   defp load_paths(env, cwd) do
     for path <- Path.wildcard(Path.join(cwd, "_build/#{env}/lib/*/ebin")) do
       Code.prepend_path(path)
@@ -4,22 +4,51 @@ defmodule ElixirSense.Server.RequestHandler do
   Handles all requests received by the TCP Server and maps those requests to ElixirSense API calls.
   """
 
-  alias ElixirSense.Server.ContextLoader
+  alias ElixirSense.Server.{ContextLoader, BufferStore, Timings}
+  alias ElixirSense.Core.Parser
+
+  def handle_request("signature", %{"buffer_id" => _, "line" => line, "column" => column} = payload) do
+    {buffer, metadata} = Timings.measure(:parse, fn -> BufferStore.sync(payload) end)
+    Timings.measure(:provider, fn -> ElixirSense.signature(buffer, line, column, metadata) end)
+  end
+
+  def handle_request("docs", %{"buffer_id" => _, "line" => line, "column" => column} = payload) do
+    {buffer, metadata} = Timings.measure(:parse, fn -> BufferStore.sync(payload) end)
+    Timings.measure(:provider, fn -> ElixirSense.docs(buffer, line, column, metadata) end)
+  end
+
+  def handle_request("definition", %{"buffer_id" => _, "line" => line, "column" => column} = payload) do
+    {buffer, metadata} = Timings.measure(:parse, fn -> BufferStore.sync(payload) end)
+    Timings.measure(:provider, fn -> ElixirSense.definition(buffer, line, column, metadata) end)
+  end
+
+  def handle_request("suggestions", %{"buffer_id" => _, "line" => line, "column" => column} = payload) do
+    {buffer, metadata} = Timings.measure(:parse, fn -> BufferStore.sync(payload) end)
+    Timings.measure(:provider, fn -> ElixirSense.suggestions(buffer, line, column, metadata) end)
+  end
+
+  def handle_request("close_buffer", %{"buffer_id" => buffer_id}) do
+    BufferStore.close(buffer_id)
+  end
 
   def handle_request("signature", %{"buffer" => buffer, "line" => line, "column" => column}) do
-    ElixirSense.signature(buffer, line, column)
+    metadata = Timings.measure(:parse, fn -> Parser.parse_string(buffer, true, true, line) end)
+    Timings.measure(:provider, fn -> ElixirSense.signature(buffer, line, column, metadata) end)
   end
 
   def handle_request("docs", %{"buffer" => buffer, "line" => line, "column" => column}) do
-    ElixirSense.docs(buffer, line, column)
+    metadata = Timings.measure(:parse, fn -> Parser.parse_string(buffer, true, true, line) end)
+    Timings.measure(:provider, fn -> ElixirSense.docs(buffer, line, column, metadata) end)
   end
 
   def handle_request("definition", %{"buffer" => buffer, "line" => line, "column" => column}) do
-    ElixirSense.definition(buffer, line, column)
+    metadata = Timings.measure(:parse, fn -> Parser.parse_string(buffer, true, true, line) end)
+    Timings.measure(:provider, fn -> ElixirSense.definition(buffer, line, column, metadata) end)
   end
 
   def handle_request("suggestions", %{"buffer" => buffer, "line" => line, "column" => column}) do
-    ElixirSense.suggestions(buffer, line, column)
+    metadata = Timings.measure(:parse, fn -> Parser.parse_string(buffer, true, true, line) end)
+    Timings.measure(:provider, fn -> ElixirSense.suggestions(buffer, line, column, metadata) end)
   end
 
   def handle_request("expand_full", %{"buffer" => buffer, "selected_code" => selected_code, "line" => line}) do
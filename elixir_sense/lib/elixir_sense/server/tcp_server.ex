@@ -4,10 +4,12 @@ defmodule ElixirSense.Server.TCPServer do
   """
   use Bitwise
 
-  alias ElixirSense.Server.{RequestHandler, ContextLoader}
+  alias ElixirSense.Server.{RequestHandler, ContextLoader, BufferStore, Timings}
+  alias ElixirSense.Core.ParserCache
 
   @connection_handler_supervisor ElixirSense.Server.TCPServer.ConnectionHandlerSupervisor
   @default_listen_options [:binary, active: false, reuseaddr: true, packet: 4]
+  @compress_threshold 16_384
 
   def start([socket_type: socket_type, port: port, env: env]) do
     import Supervisor.Spec
@@ -16,6 +18,8 @@ defmodule ElixirSense.Server.TCPServer do
       worker(Task, [__MODULE__, :listen, [socket_type, "localhost", port]]),
       supervisor(Task.Supervisor, [[name: @connection_handler_supervisor]]),
       worker(SelfDestructTimer, [env]),
+      worker(BufferStore, []),
+      worker(ParserCache, []),
       worker(ContextLoader, [env])
     ]
 
@@ -33,6 +37,9 @@ defmodule ElixirSense.Server.TCPServer do
     |> format_output(host, port_or_file, auth_token)
     |> IO.puts
 
+    {uptime, _} = :erlang.statistics(:wall_clock)
+    IO.puts(:stderr, "ElixirSense server listening #{uptime}ms after start")
+
     accept(socket, auth_token)
   end
 
@@ -55,8 +62,26 @@ defmodule ElixirSense.Server.TCPServer do
     {String.to_integer(port), @default_listen_options ++ [ip: {127, 0, 0, 1}]}
   end
 
-  defp listen_options("unix", _port) do
-    {0, @default_listen_options ++ [ifaddr: {:local, socket_file()}]}
+  # Clients may choose the socket file, they connect as soon as it accepts
+  # connections instead of waiting for the output
+  defp listen_options("unix", "0") do
+    listen_options("unix", socket_file())
+  end
+
+  defp listen_options("unix", file) do
+    File.rm(file)
+    Application.put_env(:elixir_sense, :socket_file, file)
+    {0, @default_listen_options ++ [ifaddr: {:local, String.to_charlist(file)}]}
+  end
+
+  @doc """
+  Removes the unix socket file, called when the server stops
+  """
+  def remove_socket_file do
+    case Application.get_env(:elixir_sense, :socket_file) do
+      nil -> :ok
+      file -> File.rm(file)
+    end
   end
 
   defp accept(socket, auth_token) do
@@ -73,25 +98,64 @@ defmodule ElixirSense.Server.TCPServer do
     end)
   end
 
-  defp connection_handler(socket, auth_token) do
+  defp connection_handler(socket, auth_token, running \\ %{}) do
     SelfDestructTimer.reset
     case :gen_tcp.recv(socket, 0) do
       {:error, :closed} ->
         IO.puts :stderr, "Client socket is closed"
       {:ok, data} ->
-        data
-        |> process_request(auth_token)
-        |> send_response(socket)
-        connection_handler(socket, auth_token)
+        decoded = data |> decode_request_data() |> apply_buffer(auth_token)
+        running = cancel_superseded(running, decoded)
+        {:ok, pid} = start_request_handler(decoded, socket, auth_token)
+        connection_handler(socket, auth_token, track_request(running, decoded, pid))
+    end
+  end
+
+  # Clients may pipeline several requests on the same connection, each one is
+  # handled in its own process and answered as soon as it's done. Clients
+  # match the responses to their requests by request_id.
+  defp start_request_handler(decoded, socket, auth_token) do
+    Task.Supervisor.start_child(@connection_handler_supervisor, fn ->
+      decoded
+      |> process_request(auth_token)
+      |> send_response(socket)
+    end)
+  end
+
+  # Buffer changes are applied here, before the request that sent them can
+  # be cancelled by a newer one, the next changes are based on them
+  defp apply_buffer({:ok, %{"auth_token" => req_token, "payload" => %{"buffer_id" => _} = payload} = data}, auth_token) do
+    if secure_compare(auth_token, req_token) do
+      {:ok, %{data | "payload" => BufferStore.apply_buffer(payload)}}
+    else
+      {:ok, data}
+    end
+  end
+  defp apply_buffer(decoded, _auth_token), do: decoded
+
+  # A request with a "cancel_key" supersedes the request with the same key
+  # still running on this connection (ex. completion for the previous
+  # keystroke), the superseded one is killed without a response.
+  defp cancel_superseded(running, {:ok, %{"cancel_key" => key}}) do
+    {pid, running} = Map.pop(running, key)
+    if pid do
+      Task.Supervisor.terminate_child(@connection_handler_supervisor, pid)
     end
+    running
   end
+  defp cancel_superseded(running, _decoded), do: running
 
-  defp process_request(data, auth_token) do
+  defp track_request(running, {:ok, %{"cancel_key" => key}}, pid), do: Map.put(running, key, pid)
+  defp track_request(running, _decoded, _pid), do: running
+
+  defp process_request(decoded, auth_token) do
     with \
-      {:ok, decoded_data} <- decode_request_data(data),
+      {:ok, decoded_data} <- decoded,
       {:ok, result} <- dispatch_request(decoded_data, auth_token)
     do
-      :erlang.term_to_binary(result)
+      result
+      |> :erlang.term_to_binary()
+      |> compress(decoded_data)
     else
       {:invalid_request, message} ->
         IO.puts(:stderr, "Server Error: #{message}")
@@ -102,17 +166,20 @@ defmodule ElixirSense.Server.TCPServer do
     end
   end
 
+  # Requests with a "project" are handled in the context of that project,
+  # so clients of several projects can share one server. The context stays
+  # loaded until the request is answered.
   defp dispatch_request(%{
     "request_id" => request_id,
     "auth_token" => req_token,
     "request" => request,
-    "payload" => payload}, auth_token) do
+    "payload" => payload} = data, auth_token) do
     try do
       result =
         if secure_compare(auth_token, req_token) do
-          ContextLoader.reload()
-          payload = RequestHandler.handle_request(request, payload) |> format_payload()
-          %{request_id: request_id, payload: payload, error: nil}
+          Timings.measure(:reload, fn -> ContextLoader.reload(Map.get(data, "project")) end)
+          payload = Timings.measure(:handler, fn -> RequestHandler.handle_request(request, payload) end)
+          put_timings(%{request_id: request_id, payload: format_payload(payload), error: nil}, data)
         else
           %{request_id: request_id, payload: nil, error: "unauthorized"}
         end
@@ -122,6 +189,8 @@ defmodule ElixirSense.Server.TCPServer do
         message = Exception.message(e)
         details = Exception.format_stacktrace(System.stacktrace)
         {:error, request_id, message, details}
+    after
+      ContextLoader.release()
     end
   end
 
@@ -129,6 +198,24 @@ defmodule ElixirSense.Server.TCPServer do
     {:invalid_request, "Invalid request"}
   end
 
+  # Clients tracing their requests get the time spent in each stage of the
+  # request next to the request_id
+  defp put_timings(result, %{"trace" => true}), do: Map.put(result, :timings, Timings.all())
+  defp put_timings(result, _data), do: result
+
+  # Clients that ask for it get big responses (docs, all_modules) as a
+  # zlib COMPRESSED term, compressing the already encoded term avoids
+  # encoding the response twice
+  defp compress(<<131, term::binary>> = data, %{"compress" => true}) when byte_size(term) > @compress_threshold do
+    compressed = :zlib.compress(term)
+    if byte_size(compressed) < byte_size(term) do
+      <<131, 80, byte_size(term)::32, compressed::binary>>
+    else
+      data
+    end
+  end
+  defp compress(data, _request), do: data
+
   defp send_response(data, socket) do
     :gen_tcp.send(socket, data)
   end
@@ -138,9 +225,9 @@ defmodule ElixirSense.Server.TCPServer do
     dir = "/tmp/elixir-sense-#{System.get_env("USER")}"
     case File.mkdir_p(dir) do
       :ok ->
-        String.to_charlist("#{dir}/#{sock_id}.sock")
+        "#{dir}/#{sock_id}.sock"
       _ ->
-        String.to_charlist("/tmp/elixir-sense-#{sock_id}.sock")
+        "/tmp/elixir-sense-#{sock_id}.sock"
     end
 
   end
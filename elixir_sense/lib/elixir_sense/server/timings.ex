@@ -0,0 +1,29 @@
+defmodule ElixirSense.Server.Timings do
+  @moduledoc """
+  Time spent in the stages (reload, parse, provider...) of the request
+  handled by the current process, in microseconds. Clients asking for a
+  "trace" get them in the response.
+  """
+
+  @doc """
+  Runs `fun` adding its time to `stage`. The time of the stages measured
+  within `fun` isn't counted in `stage`, the stages add up to the time of
+  the request.
+  """
+  def measure(stage, fun) do
+    outer = Process.put(__MODULE__, 0)
+    started = :erlang.monotonic_time(:microsecond)
+    try do
+      fun.()
+    after
+      time = :erlang.monotonic_time(:microsecond) - started
+      nested = Process.get(__MODULE__)
+      if outer, do: Process.put(__MODULE__, outer + time), else: Process.delete(__MODULE__)
+      Process.put({__MODULE__, stage}, Process.get({__MODULE__, stage}, 0) + time - nested)
+    end
+  end
+
+  def all do
+    for {{__MODULE__, stage}, time} <- Process.get(), into: %{}, do: {stage, time}
+  end
+end
@@ -1,7 +1,7 @@
 defmodule SelfDestructTimer do
 
-  #doc "Self destruct after how many seconds?"
-  @timeout 600
+  #doc "Self destruct after how many seconds? ALCHEMIST_SERVER_IDLE_TIMEOUT overrides it, 0 never does"
+  @default_timeout 600
 
   def start_link(_) do
     {:ok, pid} = Agent.start_link(&now/0, name: __MODULE__ )
@@ -24,6 +24,12 @@ defmodule SelfDestructTimer do
   def reset, do: Agent.update(__MODULE__, fn _ -> now() end)
 
   #doc "Self destruct after how many seconds?"
+  defp timeout do
+    case Integer.parse(System.get_env("ALCHEMIST_SERVER_IDLE_TIMEOUT") || "") do
+      {seconds, ""} -> seconds
+      _ -> @default_timeout
+    end
+  end
 
   #doc "Current time as unix timestamp"
   defp now, do: DateTime.utc_now |> DateTime.to_unix
@@ -36,11 +42,15 @@ defmodule SelfDestructTimer do
 
   #doc "Have we reached self-destruct time yet?"
   defp idle_expired do
-    idle_time() >= @timeout
+    timeout = timeout()
+    timeout > 0 and idle_time() >= timeout
   end
 
-  #doc "Boom!"
-  defp destroy, do: System.halt(42)
+  #doc "Boom! Clients must not find the socket of a dead server"
+  defp destroy do
+    ElixirSense.Server.TCPServer.remove_socket_file()
+    System.halt(42)
+  end
 
   defp schedule_tick do
     :timer.apply_after(60_000, __MODULE__, :tick, [])
@@ -4,9 +4,11 @@ requires = [
   "elixir_sense/core/state.ex",
   "elixir_sense/core/metadata_builder.ex",
   "elixir_sense/core/metadata.ex",
+  "elixir_sense/core/parser_cache.ex",
   "elixir_sense/core/parser.ex",
   "elixir_sense/core/source.ex",
   "alchemist/helpers/module_info.ex",
+  "alchemist/helpers/module_index.ex",
   "alchemist/helpers/complete.ex",
   "elixir_sense/providers/definition.ex",
   "elixir_sense/providers/docs.ex",
@@ -14,16 +16,53 @@ requires = [
   "elixir_sense/providers/signature.ex",
   "elixir_sense/providers/expand.ex",
   "elixir_sense/providers/eval.ex",
+  "elixir_sense/server/timings.ex",
   "elixir_sense/server/request_handler.ex",
   "elixir_sense/server/context_loader.ex",
+  "elixir_sense/server/buffer_store.ex",
   "elixir_sense/server/tcp_server.ex",
   "elixir_sense.ex",
   "self_destruct_timer.ex",
   "elixir_sense/server.ex"
 ]
 
-requires |> Enum.each(fn file ->
-  Code.require_file("lib/#{file}", __DIR__)
-end)
+sources = Enum.map(requires, &Path.join([__DIR__, "lib", &1]))
+
+# The server is compiled once per Elixir/OTP version and sources into a cache
+# dir, later starts only load the .beam files
+build_id =
+  {System.version, :erlang.system_info(:otp_release), Enum.map(sources, &{&1, File.stat!(&1).mtime})}
+  |> :erlang.phash2()
+  |> Integer.to_string()
+build_dir = Path.join([System.get_env("ALCHEMIST_SERVER_BUILD_DIR") || System.tmp_dir!(), "alchemist_server_build", build_id])
+
+compile = fn ->
+  tmp_dir = "#{build_dir}.#{System.unique_integer([:positive])}"
+  File.mkdir_p!(tmp_dir)
+  if Code.ensure_loaded?(Kernel.ParallelCompiler) and function_exported?(Kernel.ParallelCompiler, :compile_to_path, 2) do
+    {:ok, _, _} = Kernel.ParallelCompiler.compile_to_path(sources, tmp_dir)
+  else
+    Kernel.ParallelCompiler.files_to_path(sources, tmp_dir)
+  end
+  case File.rename(tmp_dir, build_dir) do
+    :ok -> :ok
+    _ -> File.rm_rf(tmp_dir)
+  end
+end
+
+try do
+  if File.dir?(build_dir) do
+    Code.prepend_path(build_dir)
+    for beam <- Path.wildcard(Path.join(build_dir, "*.beam")) do
+      {:module, _} = beam |> Path.basename(".beam") |> String.to_atom() |> Code.ensure_loaded()
+    end
+  else
+    compile.()
+  end
+rescue
+  e ->
+    IO.puts(:stderr, "Cannot use the compiled server in #{build_dir}: #{Exception.message(e)}")
+    Enum.each(sources, &Code.require_file/1)
+end
 
 ElixirSense.Server.start(System.argv)
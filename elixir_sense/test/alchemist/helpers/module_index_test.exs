@@ -0,0 +1,42 @@
+defmodule Alchemist.Helpers.ModuleIndexTest do
+
+  use ExUnit.Case
+
+  alias Alchemist.Helpers.ModuleIndex
+
+  setup do
+    if :ets.info(ModuleIndex, :size) == :undefined do
+      ModuleIndex.new()
+    end
+    :ok
+  end
+
+  test "match returns the sorted modules starting with the hint" do
+    modules = ModuleIndex.match("Elixir.Enum")
+
+    assert "Elixir.Enum" in modules
+    assert "Elixir.Enumerable" in modules
+    assert modules == Enum.sort(modules)
+    assert Enum.all?(modules, &String.starts_with?(&1, "Elixir.Enum"))
+  end
+
+  test "match returns nothing for an unknown prefix" do
+    assert ModuleIndex.match("Elixir.DoesNotExist") == []
+  end
+
+  test "modules loaded after the index was built are matched after an update" do
+    Code.compile_string("defmodule Alchemist.Helpers.ModuleIndexTest.Later do end")
+    ModuleIndex.update()
+
+    assert ModuleIndex.match("Elixir.Alchemist.Helpers.ModuleIndexTest.") ==
+      ["Elixir.Alchemist.Helpers.ModuleIndexTest.Later"]
+  end
+
+  test "modules loaded after the index was built are matched before an update" do
+    Code.compile_string("defmodule Alchemist.Helpers.ModuleIndexTest.Lazy do end")
+
+    assert ModuleIndex.match("Elixir.Alchemist.Helpers.ModuleIndexTest.Lazy") ==
+      ["Elixir.Alchemist.Helpers.ModuleIndexTest.Lazy"]
+  end
+
+end
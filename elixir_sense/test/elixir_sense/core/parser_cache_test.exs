@@ -0,0 +1,57 @@
+defmodule ElixirSense.Core.ParserCacheTest do
+  use ExUnit.Case
+
+  alias ElixirSense.Core.{Parser, ParserCache}
+
+  setup do
+    if Process.whereis(ParserCache) == nil do
+      {:ok, _} = start_supervised(%{id: ParserCache, start: {ParserCache, :start_link, []}})
+    end
+    ParserCache.clear()
+    :ok
+  end
+
+  test "fetch computes the value of a key once" do
+    assert ParserCache.fetch(:key, fn -> send(self(), :computed); 1 end) == 1
+    assert ParserCache.fetch(:key, fn -> send(self(), :computed); 2 end) == 1
+    assert_received :computed
+    refute_received :computed
+  end
+
+  test "the metadata of an unchanged buffer is reused for every line with an env" do
+    source = """
+    defmodule MyModule do
+      import List
+
+    end
+    """
+    metadata = Parser.parse_string(source, true, true, 1)
+
+    assert Parser.parse_string(source, true, true, 3) == metadata
+    assert ParserCache.fetch({ParserCache.hash(source), :as_is}, fn -> flunk("not cached") end) == metadata
+  end
+
+  test "repaired buffers are cached per cursor line" do
+    source = """
+    defmodule MyModule do
+      import List
+      Enum +
+    end
+    """
+    metadata = Parser.parse_string(source, true, true, 3)
+
+    assert ParserCache.fetch({ParserCache.hash(source), true, true, 3}, fn -> flunk("not cached") end) == metadata
+    assert ParserCache.fetch({ParserCache.hash(source), true, true, 2}, fn -> :not_cached end) == :not_cached
+  end
+
+  test "the least recently used entries are evicted over the memory limit" do
+    for i <- 1..80 do
+      ParserCache.fetch({:big, i}, fn -> :binary.copy("a", 1024 * 1024) end)
+    end
+    :sys.get_state(ParserCache)
+
+    assert ParserCache.fetch({:big, 1}, fn -> :evicted end) == :evicted
+    assert ParserCache.fetch({:big, 80}, fn -> :evicted end) != :evicted
+  end
+
+end
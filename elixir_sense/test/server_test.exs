@@ -30,7 +30,7 @@ defmodule ElixirSense.ServerTest do
     auth_token = auth_token|> String.trim
     {:ok, socket} = :gen_tcp.connect('localhost', port, [:binary, active: false, packet: 4])
 
-    {:ok, socket: socket, auth_token: auth_token}
+    {:ok, socket: socket, auth_token: auth_token, port: port}
   end
 
   test "definition request", %{socket: socket, auth_token: auth_token} do
@@ -136,8 +136,56 @@ defmodule ElixirSense.ServerTest do
     assert send_request(socket, request) |> Enum.at(0) == %{type: :hint, value: "List."}
   end
 
+  test "suggestions request for a synced buffer", %{socket: socket, auth_token: auth_token} do
+    request = %{
+      "request_id" => 1,
+      "auth_token" => auth_token,
+      "request" => "suggestions",
+      "payload" => %{
+        "buffer_id" => "server_test",
+        "version" => 1,
+        "buffer" => "defmodule MyModule do\n  List.\nend",
+        "line" => 2,
+        "column" => 8
+      }
+    }
+    assert send_request(socket, request) |> Enum.at(0) == %{type: :hint, value: "List."}
+
+    request = put_in(request, ["payload"], %{
+      "buffer_id" => "server_test",
+      "version" => 2,
+      "base_version" => 1,
+      "changes" => [%{"start" => 1, "end" => 2, "lines" => ["  Enum."]}],
+      "line" => 2,
+      "column" => 8
+    })
+    assert send_request(socket, request) |> Enum.at(0) == %{type: :hint, value: "Enum."}
+  end
+
+  test "changes to an unknown buffer", %{socket: socket, auth_token: auth_token} do
+    request = %{
+      "request_id" => 1,
+      "auth_token" => auth_token,
+      "request" => "suggestions",
+      "payload" => %{
+        "buffer_id" => "not_opened",
+        "version" => 2,
+        "base_version" => 1,
+        "changes" => [],
+        "line" => 1,
+        "column" => 1
+      }
+    }
+    data = :erlang.term_to_binary(request)
+    response = capture_io(:stderr, fn ->
+      send(self(), send_and_recv(socket, data) |> :erlang.binary_to_term)
+    end)
+    assert_received %{error: "unknown_buffer"}
+    assert response =~ "unknown_buffer"
+  end
+
   test "set_context request", %{socket: socket, auth_token: auth_token} do
-    {_, _, _, env, cwd, _} = ContextLoader.get_state()
+    {_, _, _, env, cwd, _, _, _, _} = ContextLoader.get_state()
 
     assert env == "dev"
 
@@ -152,10 +200,215 @@ defmodule ElixirSense.ServerTest do
     }
     send_request(socket, request)
 
-    {_, _, _, env, _, _} = ContextLoader.get_state()
+    {_, _, _, env, _, _, _, _, _} = ContextLoader.get_state()
     assert env == "test"
   end
 
+  test "requests are handled in the context of their project", %{socket: socket, auth_token: auth_token} do
+    {_, _, _, _, cwd, _, _, _, _} = ContextLoader.get_state()
+    project = Path.join(System.tmp_dir!, "elixir_sense_other_project")
+
+    request = %{
+      "request_id" => 1,
+      "auth_token" => auth_token,
+      "request" => "version",
+      "project" => project,
+      "payload" => %{}
+    }
+    send_request(socket, request)
+    {_, _, _, env, ^project, _, _, _, _} = ContextLoader.get_state()
+    assert env == "dev"
+
+    send_request(socket, %{request | "project" => cwd})
+    {_, _, _, _, ^cwd, _, _, _, _} = ContextLoader.get_state()
+  end
+
+  test "switching projects waits for the requests of the loaded one" do
+    {_, _, _, _, cwd, _, _, _, _} = ContextLoader.get_state()
+    project = Path.join(System.tmp_dir!, "elixir_sense_other_project")
+    test = self()
+
+    holder = spawn(fn ->
+      :ok = ContextLoader.reload(cwd)
+      send(test, :loaded)
+      receive do
+        :release -> ContextLoader.release()
+      end
+    end)
+    assert_receive :loaded
+
+    switch = Task.async(fn -> ContextLoader.reload(project) end)
+    refute Task.yield(switch, 100)
+    {_, _, _, _, ^cwd, _, _, _, _} = ContextLoader.get_state()
+
+    send(holder, :release)
+    assert Task.await(switch) == :ok
+    {_, _, _, _, ^project, _, _, _, _} = ContextLoader.get_state()
+
+    for _ <- 1..3 do
+      assert ContextLoader.reload(cwd) == :ok
+      {_, _, _, _, ^cwd, _, _, _, _} = ContextLoader.get_state()
+      assert ContextLoader.reload(project) == :ok
+      {_, _, _, _, ^project, _, _, _, _} = ContextLoader.get_state()
+    end
+
+    assert ContextLoader.reload(cwd) == :ok
+    ContextLoader.release()
+  end
+
+  test "traced request", %{socket: socket, auth_token: auth_token} do
+    request = %{
+      "request_id" => 1,
+      "auth_token" => auth_token,
+      "request" => "suggestions",
+      "trace" => true,
+      "payload" => %{
+        "buffer" => "List.fla",
+        "line" => 1,
+        "column" => 9
+      }
+    }
+    %{request_id: 1, timings: timings} =
+      socket |> send_and_recv(:erlang.term_to_binary(request)) |> :erlang.binary_to_term
+
+    assert %{reload: _, handler: _, parse: _, provider: _} = timings
+  end
+
+  test "the time of nested stages isn't counted in the outer stage" do
+    alias ElixirSense.Server.Timings
+
+    Timings.measure(:outer, fn -> Timings.measure(:inner, fn -> Process.sleep(50) end) end)
+
+    assert %{outer: outer, inner: inner} = Timings.all()
+    assert inner >= 50_000
+    assert outer < 50_000
+  end
+
+  test "compressed all_modules request", %{socket: socket, auth_token: auth_token} do
+    request = %{
+      "request_id" => 1,
+      "auth_token" => auth_token,
+      "request" => "all_modules",
+      "compress" => true,
+      "payload" => %{}
+    }
+    <<131, 80, _::binary>> = response = send_and_recv(socket, :erlang.term_to_binary(request))
+
+    assert %{payload: modules, error: nil} = :erlang.binary_to_term(response)
+    assert "Enum" in modules
+  end
+
+  test "pipelined requests are matched by request_id", %{socket: socket, auth_token: auth_token} do
+    for {id, code} <- [{10, "{a, b} = {1, 2}"}, {11, "var = 1"}] do
+      request = %{
+        "request_id" => id,
+        "auth_token" => auth_token,
+        "request" => "match",
+        "payload" => %{"code" => code}
+      }
+      :ok = :gen_tcp.send(socket, :erlang.term_to_binary(request))
+    end
+
+    responses =
+      for _ <- 1..2, into: %{} do
+        {:ok, data} = :gen_tcp.recv(socket, 0, 1000)
+        %{request_id: id, payload: payload} = :erlang.binary_to_term(data)
+        {id, payload}
+      end
+
+    assert responses[10] == "# Bindings\n\na = 1\n\nb = 2"
+    assert responses[11] == "# Bindings\n\nvar = 1"
+  end
+
+  test "request superseded by the same cancel_key", %{auth_token: auth_token, port: port} do
+    # the superseded request may or may not be answered, it gets its own
+    # connection so a late response can't leak into other tests
+    {:ok, socket} = :gen_tcp.connect('localhost', port, [:binary, active: false, packet: 4])
+
+    for {id, code} <- [{20, "{a, b} = {1, 2}"}, {21, "var = 1"}] do
+      request = %{
+        "request_id" => id,
+        "auth_token" => auth_token,
+        "cancel_key" => "match",
+        "request" => "match",
+        "payload" => %{"code" => code}
+      }
+      :ok = :gen_tcp.send(socket, :erlang.term_to_binary(request))
+    end
+
+    response =
+      Stream.repeatedly(fn ->
+        {:ok, data} = :gen_tcp.recv(socket, 0, 1000)
+        :erlang.binary_to_term(data)
+      end)
+      |> Enum.find(&(&1.request_id == 21))
+
+    assert response.payload == "# Bindings\n\nvar = 1"
+    :gen_tcp.close(socket)
+  end
+
+  test "buffer changes of a superseded request are kept", %{auth_token: auth_token, port: port} do
+    {:ok, socket} = :gen_tcp.connect('localhost', port, [:binary, active: false, packet: 4])
+
+    payloads = [
+      %{"buffer" => "defmodule MyModule do\n  List.\nend", "version" => 1},
+      %{"changes" => [%{"start" => 1, "end" => 2, "lines" => ["  Enum."]}], "base_version" => 1, "version" => 2},
+      %{"changes" => [%{"start" => 1, "end" => 2, "lines" => ["  Map."]}], "base_version" => 2, "version" => 3}
+    ]
+    for {payload, id} <- Enum.with_index(payloads, 30) do
+      request = %{
+        "request_id" => id,
+        "auth_token" => auth_token,
+        "cancel_key" => "suggestions",
+        "request" => "suggestions",
+        "payload" => Map.merge(payload, %{"buffer_id" => "superseded_test", "line" => 2, "column" => 7})
+      }
+      :ok = :gen_tcp.send(socket, :erlang.term_to_binary(request))
+    end
+
+    response =
+      Stream.repeatedly(fn ->
+        {:ok, data} = :gen_tcp.recv(socket, 0, 1000)
+        :erlang.binary_to_term(data)
+      end)
+      |> Enum.find(&(&1.request_id == 32))
+
+    assert response.error == nil
+    assert response.payload |> Enum.at(0) == %{type: :hint, value: "Map."}
+    :gen_tcp.close(socket)
+  end
+
+  test "pipelined requests for consecutive versions of a buffer", %{auth_token: auth_token, port: port} do
+    {:ok, socket} = :gen_tcp.connect('localhost', port, [:binary, active: false, packet: 4])
+
+    payloads = [
+      %{"buffer" => "defmodule MyModule do\n  List.\nend", "version" => 1, "column" => 8},
+      %{"changes" => [%{"start" => 1, "end" => 2, "lines" => ["  Map."]}], "base_version" => 1, "version" => 2, "column" => 7}
+    ]
+    for {payload, id} <- Enum.with_index(payloads, 40) do
+      request = %{
+        "request_id" => id,
+        "auth_token" => auth_token,
+        "request" => "suggestions",
+        "payload" => Map.merge(payload, %{"buffer_id" => "pipelined_test", "line" => 2})
+      }
+      :ok = :gen_tcp.send(socket, :erlang.term_to_binary(request))
+    end
+
+    responses =
+      for _ <- 1..2, into: %{} do
+        {:ok, data} = :gen_tcp.recv(socket, 0, 1000)
+        response = :erlang.binary_to_term(data)
+        {response.request_id, response}
+      end
+
+    assert responses[40].error == nil
+    assert responses[40].payload |> Enum.at(0) == %{type: :hint, value: "List."}
+    assert responses[41].error == nil
+    assert responses[41].payload |> Enum.at(0) == %{type: :hint, value: "Map."}
+    :gen_tcp.close(socket)
+  end
+
   test "unauthorized request", %{socket: socket} do
     request = %{
       "request_id" => 1,
@@ -0,0 +1,241 @@
+"""
+asyncio flavour of ElixirSenseClient for editor integrations that can't
+afford to block while the server answers (deoplete, completor, ...).
+
+Needs python 3.5+, the blocking client in elixir_sense.py stays the one
+used by the command line client.
+"""
+import asyncio
+import socket
+import struct
+import threading
+import erl_terms
+from elixir_sense import ElixirSenseClient, ServerConnection, ModuleIndex, RequestTrace, socket_log
+
+class AsyncElixirSenseClient(ElixirSenseClient):
+    """
+    Same requests and results as ElixirSenseClient.process_command(), but
+    as coroutines sharing one connection. A reader task matches responses
+    to the pending requests by request_id.
+
+    Requests sent with a `key` replace the pending request with the same
+    key, ex. completion for the previous keystroke is cancelled as soon as
+    the next one is asked for. They wait `debounce` seconds before being
+    sent, so a burst of keystrokes sends only the last one, and the server
+    drops the superseded one it's still working on (`cancel_key`).
+
+    The positional arguments are the ones of the blocking client, the
+    options only it has are keyword only.
+
+    >>> (server, sock) = socket.socketpair()
+    >>> client = AsyncElixirSenseClient()
+    >>> loop = asyncio.new_event_loop()
+    >>> loop.run_until_complete(client._attach(sock))
+    >>> def reply(request_id, payload):
+    ...     data = erl_terms.encode({'request_id': request_id, 'error': None, 'payload': payload})
+    ...     server.sendall(struct.pack('!I', len(data)) + data)
+    >>> task = loop.create_task(client.process_command('ping', '', 1, 1))
+    >>> loop.run_until_complete(asyncio.sleep(0.01))
+    >>> request = erl_terms.decode(server.recv(4096)[4:])
+    >>> reply(request['request_id'], 'pong')
+    >>> loop.run_until_complete(task)
+    'pong'
+    >>> task = loop.create_task(client.module_names('Enum'))
+    >>> loop.run_until_complete(asyncio.sleep(0.01))
+    >>> request = erl_terms.decode(server.recv(4096)[4:])
+    >>> reply(request['request_id'], ['Enum', 'Enumerable', 'String'])
+    >>> loop.run_until_complete(task)
+    ['Enum', 'Enumerable']
+    >>> client._debounce = 0.02
+    >>> first = loop.create_task(client.process_command('ping', '', 1, 1, key='ping'))
+    >>> second = loop.create_task(client.process_command('ping', '', 1, 2, key='ping'))
+    >>> loop.run_until_complete(asyncio.sleep(0.05))
+    >>> first.cancelled()
+    True
+    >>> request = erl_terms.decode(server.recv(4096)[4:])
+    >>> (request['payload']['column'], request['cancel_key'])
+    (2, 'ping')
+    >>> reply(request['request_id'], 'pong')
+    >>> loop.run_until_complete(second)
+    'pong'
+    >>> loop.run_until_complete(client.process_command('ping', '', 1, 1, timeout=0.05))
+    'error:reached 0.05 sec timeout waiting for the server, error:Resource temporarily unavailable'
+    >>> loop.run_until_complete(client.close())
+    >>> loop.close()
+    """
+
+    def __init__(self, **kw):
+        ElixirSenseClient.__init__(self, **kw)
+        # the reader task owns the socket, it isn't shared with other clients
+        self._connection = ServerConnection()
+        self._debounce = kw.get('debounce', 0)
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._connecting = None
+        self._pending = {}
+        self._latest = {}
+
+    async def process_command(self, request, source, line, column, buffer_id=None, *, timeout=None, key=None):
+        if key is None:
+            return await self._process(request, source, line, column, timeout, buffer_id)
+
+        previous = self._latest.get(key)
+        if previous is not None:
+            previous.cancel()
+        task = asyncio.ensure_future(self._debounced(request, source, line, column, timeout, buffer_id, key))
+        self._latest[key] = task
+        try:
+            return await task
+        finally:
+            if self._latest.get(key) is task:
+                del self._latest[key]
+
+    async def process_batch(self, requests, source, line, column, buffer_id=None, *, timeout=None):
+        return await asyncio.gather(
+                *[self._process(request, source, line, column, timeout, buffer_id) for request in requests])
+
+    async def module_names(self, prefix, limit=None):
+        stamp = self._build_stamp()
+        if self._module_index is None or self._module_index_stamp != stamp:
+            modules = await self.process_command('all_modules', '', 1, 1)
+            if not isinstance(modules, list):
+                return modules
+            self._module_index = ModuleIndex(modules)
+            self._module_index_stamp = stamp
+        return self._module_index.complete(prefix, limit)
+
+    async def _fetch_server_version(self):
+        if self._server_version is None:
+            self._set_server_version(await self.process_command('version', '', 1, 1))
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        self._connection_lost(ConnectionError("Client closed the connection"))
+
+    async def _debounced(self, request, source, line, column, timeout, buffer_id, key):
+        if self._debounce:
+            await asyncio.sleep(self._debounce)
+        return await self._process(request, source, line, column, timeout, buffer_id, key)
+
+    async def _process(self, request, source, line, column, timeout, buffer_id=None, cancel_key=None):
+        # requests run concurrently, each one has its own trace
+        if self._traces is None:
+            return await self._process_traced(request, source, line, column, timeout, buffer_id, cancel_key, None)
+        trace = RequestTrace([request])
+        try:
+            return await self._process_traced(request, source, line, column, timeout, buffer_id, cancel_key, trace)
+        finally:
+            self._traces.append(trace.finish())
+
+    async def _process_traced(self, request, source, line, column, timeout, buffer_id, cancel_key, trace):
+        if timeout is None:
+            timeout = self._timeout
+        if request == 'docs' and self._server_version is None:
+            self._set_server_version(await self._process('version', '', 1, 1, timeout))
+            if trace is not None:
+                trace.stage('version')
+        (cache_key, cached) = self._cached_response(request, source, line, column)
+        if cached is not None:
+            return self._format_response(request, cached)
+        payload = self._request_payload(source, line, column, buffer_id)
+        if trace is not None:
+            trace.stage('payload')
+        request_id = self._next_request_id()
+        future = asyncio.get_event_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await asyncio.wait_for(self._send(request_id, request, payload, cancel_key, future), timeout)
+        except asyncio.TimeoutError:
+            return 'error:reached %s sec timeout waiting for the server, error:Resource temporarily unavailable' % timeout
+        except Exception as e:
+            return 'error:%s' % e
+        finally:
+            self._pending.pop(request_id, None)
+        if trace is not None:
+            trace.stage('wait')
+            trace.server(request, future.result().get('timings') or {})
+        if self._unknown_buffer([future.result()], buffer_id):
+            return await self._process(request, source, line, column, timeout, buffer_id, cancel_key)
+        self._cache_response(cache_key, future.result())
+        formatted = self._format_response(request, future.result(), (source, line, column))
+        if trace is not None:
+            trace.stage('format')
+        return formatted
+
+    async def _send(self, request_id, request, payload, cancel_key, future):
+        await self._open_connection()
+        chunks = self._encode_request(request_id, request, payload, cancel_key)
+        self._writer.writelines([self._packet_header.pack(sum(len(c) for c in chunks))] + chunks)
+        await self._writer.drain()
+        await future
+
+    async def _open_connection(self):
+        if self._writer is not None:
+            return
+        # starting the server takes a while, requests timing out meanwhile
+        # must not start another one
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self._start_connection())
+        await asyncio.shield(self._connecting)
+
+    async def _start_connection(self):
+        try:
+            sock = await asyncio.get_event_loop().run_in_executor(None, self._get_socket)
+            if sock is None:
+                raise ConnectionError("Couldn't connect to ElixirSense server")
+            self._connection.sock = None
+            await self._attach(sock)
+        finally:
+            self._connecting = None
+
+    async def _attach(self, sock):
+        (self._reader, self._writer) = await asyncio.open_connection(sock=sock)
+        self._reader_task = asyncio.ensure_future(self._read_responses(self._reader))
+
+    async def _read_responses(self, reader):
+        try:
+            while True:
+                header = await reader.readexactly(self._packet_header.size)
+                (packet_size, ) = self._packet_header.unpack(header)
+                response = erl_terms.decode(await reader.readexactly(packet_size))
+                # requests that timed out or were replaced are gone already
+                future = self._pending.get(response['request_id'])
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except asyncio.IncompleteReadError:
+            self._connection_lost(ConnectionError("Server closed the connection"))
+        except OSError as e:
+            self._connection_lost(e)
+
+    def _connection_lost(self, e):
+        socket_log.debug("Exception in communicating with server: %s", e)
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(e)
+
+
+class EventLoopThread:
+    """
+    Runs an event loop in a daemon thread, so synchronous plugin code can
+    submit AsyncElixirSenseClient coroutines and poll or wait for them.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=self.loop.run_forever)
+        thread.daemon = True
+        thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
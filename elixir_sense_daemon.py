@@ -0,0 +1,248 @@
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from elixir_sense import ElixirSenseClient, log
+
+class ElixirSenseDaemon:
+    """
+    Long running companion of ElixirSenseClient. It keeps one client (and
+    its socket to the ElixirSense server) per project alive between
+    requests, so editors only pay for a round trip instead of starting a
+    new python process for every completion.
+
+    Requests are JSON lines in the format used by vim channels in json
+    mode: `[id, {"request": .., "directory": .., "line": .., "column": .., "buffer": ..}]`,
+    every request is answered with `[id, response]`. A list of `"requests"`
+    for the same buffer and position is answered with a list of responses.
+
+    Requests with a `"key"` that piled up while the daemon was busy are
+    coalesced, only the latest one per key is handled and the superseded
+    ones are answered with an empty response.
+
+    Suggestions are answered with a list of records (kind, word, abbr,
+    menu and info) instead of the text lines of the command line client.
+
+    Requests with a `"buffer_id"` only send the lines that changed since
+    the previous request for that buffer to the server.
+
+    A `"modules"` request is answered with the modules starting with its
+    `"prefix"`, from a module list kept per project.
+
+    With `trace` the clients keep the timing breakdown of their last
+    requests, a `"stats"` request is answered with a summary of the ones of
+    the project, or the list of them with `"format": "json"`.
+
+    A `"warmup"` request starts the server of the project without waiting
+    for the first completion. With `standby` the servers of the projects
+    used in the last `standby` seconds are kept alive, and started again
+    if they died, so they're warm when the editor is used again.
+    """
+
+    def __init__(self, **kw):
+        kw.setdefault('suggestions_format', 'records')
+        self._standby = kw.pop('standby', 0)
+        self._client_kw = kw
+        self._clients = {}
+        self._dir_clients = {}
+        self._last_used = {}
+        self._last_keep_alive = time.time()
+
+    def client_for(self, directory):
+        """
+        >>> daemon = ElixirSenseDaemon()
+        >>> tmp_dir = tempfile.mkdtemp()
+        >>> daemon.client_for(tmp_dir) is daemon.client_for(tmp_dir)
+        True
+        """
+        directory = os.path.abspath(directory)
+        if directory in self._dir_clients:
+            return self._dir_clients[directory]
+
+        client = ElixirSenseClient(cwd=directory, **self._client_kw)
+        client = self._clients.setdefault(client._cwd, client)
+        self._dir_clients[directory] = client
+        return client
+
+    def handle(self, request):
+        """
+        >>> daemon = ElixirSenseDaemon()
+        >>> daemon.handle({'request': 'suggestions', 'directory': '/does/not/exist'})
+        "error:working directory [/does/not/exist] doesn't exist"
+        """
+        directory = request.get('directory', '')
+        if os.path.isdir(directory) == False:
+            return "error:working directory [%s] doesn't exist" % directory
+        try:
+            client = self.client_for(directory)
+            response = self._handle_request(client, request)
+        except Exception as e:
+            return 'error:%s' % e
+        if response is None:
+            return ''
+        # only projects whose server works are kept alive
+        if not _is_error(response):
+            self._last_used[client] = time.time()
+        return response
+
+    def _handle_request(self, client, request):
+        if request.get('request') == 'warmup':
+            if client._get_socket() is None:
+                return "error:couldn't start the ElixirSense server"
+            return ''
+        if request.get('request') == 'stats':
+            if request.get('format') == 'json':
+                return client.traces()
+            return client.trace_summary()
+        if request.get('request') == 'modules':
+            return client.module_names(request.get('prefix', ''))
+        if 'requests' in request:
+            return client.process_batch(
+                    request['requests'],
+                    request.get('buffer', ''),
+                    request.get('line', 1),
+                    request.get('column', 1),
+                    request.get('buffer_id'))
+        return client.process_command(
+                request['request'],
+                request.get('buffer', ''),
+                request.get('line', 1),
+                request.get('column', 1),
+                request.get('buffer_id'))
+
+    def handle_line(self, line):
+        """
+        >>> daemon = ElixirSenseDaemon()
+        >>> daemon.handle_line(b'[3, {"request": "docs", "directory": "/does/not/exist"}]')
+        '[3, "error:working directory [/does/not/exist] doesn\\'t exist"]'
+        >>> daemon.handle_line(b'not json')
+        '[0, "error:invalid request"]'
+        """
+        try:
+            (request_id, request) = json.loads(line.decode('utf-8'))
+        except ValueError:
+            return json.dumps([0, 'error:invalid request'])
+        return json.dumps([request_id, self.handle(request)])
+
+    def handle_lines(self, lines):
+        """
+        >>> daemon = ElixirSenseDaemon()
+        >>> daemon.handle_lines([
+        ...     b'[1, {"request": "docs", "directory": "/does/not/exist", "key": "docs"}]',
+        ...     b'[2, {"request": "docs", "directory": "/does/not/exist", "key": "docs"}]'])
+        ['[1, ""]', '[2, "error:working directory [/does/not/exist] doesn\\'t exist"]']
+        """
+        latest = {}
+        for (index, line) in enumerate(lines):
+            key = self._request_key(line)
+            if key is not None:
+                latest[key] = index
+
+        responses = []
+        for (index, line) in enumerate(lines):
+            key = self._request_key(line)
+            if key is not None and latest[key] != index:
+                responses.append(json.dumps([json.loads(line.decode('utf-8'))[0], '']))
+            else:
+                responses.append(self.handle_line(line))
+        return responses
+
+    def _request_key(self, line):
+        try:
+            (request_id, request) = json.loads(line.decode('utf-8'))
+            return request.get('key')
+        except (ValueError, AttributeError):
+            return None
+
+    def keep_alive(self):
+        """
+        pings the servers of the projects used in the last `standby` seconds
+        so they don't self destruct while the editor is idle, the projects
+        whose server can't be reached are dropped until they're used again
+
+        >>> daemon = ElixirSenseDaemon(standby=3600)
+        >>> class BrokenClient:
+        ...     def process_command(self, *args):
+        ...         raise OSError("No such file or directory: 'elixir'")
+        >>> daemon._last_used[BrokenClient()] = time.time()
+        >>> daemon.keep_alive()
+        >>> daemon._last_used
+        {}
+        """
+        now = time.time()
+        self._last_keep_alive = now
+        for (client, last_used) in list(self._last_used.items()):
+            if now - last_used > self._standby:
+                del self._last_used[client]
+                continue
+            try:
+                response = client.process_command('version', '', 1, 1)
+            except Exception as e:
+                response = 'error:%s' % e
+            if _is_error(response):
+                log.debug("Keeping the server alive failed: %s", response)
+                del self._last_used[client]
+
+    def _keep_alive_interval(self):
+        """
+        >>> ElixirSenseDaemon(standby=3600)._keep_alive_interval()
+        60
+        >>> ElixirSenseDaemon(standby=3600, server_lifetime=30)._keep_alive_interval()
+        15
+        >>> ElixirSenseDaemon()._keep_alive_interval() is None
+        True
+        """
+        if not self._standby:
+            return None
+        lifetime = self._client_kw.get('server_lifetime') or 120
+        return max(1, min(60, lifetime // 2))
+
+    def serve(self, infile, outfile):
+        lines = queue.Queue()
+        reader = threading.Thread(target=self._read_lines, args=(infile, lines))
+        reader.daemon = True
+        reader.start()
+        interval = self._keep_alive_interval()
+        eof = False
+        while not eof:
+            if interval is not None and time.time() - self._last_keep_alive >= interval:
+                self.keep_alive()
+            try:
+                batch = [lines.get(timeout=interval)]
+            except queue.Empty:
+                continue
+            # requests sent while the previous ones were handled
+            while not lines.empty():
+                batch.append(lines.get())
+            eof = None in batch
+            for response in self.handle_lines([line for line in batch if line is not None]):
+                outfile.write(response.encode('utf-8') + b'\n')
+            outfile.flush()
+
+    def _read_lines(self, infile, lines):
+        for line in iter(infile.readline, b''):
+            if line.strip():
+                lines.put(line)
+        lines.put(None)
+
+
+def _is_error(response):
+    return isinstance(response, (str, type(u''))) and response.startswith('error:')
+
+def _binary_stream(stream):
+    return getattr(stream, 'buffer', stream)
+
+def serve_stdio(**kw):
+    daemon = ElixirSenseDaemon(**kw)
+    daemon.serve(_binary_stream(sys.stdin), _binary_stream(sys.stdout))
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
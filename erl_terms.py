@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
 import struct
+import codecs
+import zlib
+from collections import namedtuple
 #def encode(py_struct):
 
 __EXPORTS__ = [
@@ -22,7 +25,7 @@ PID_EXT = 103           # [atom:Node, UInt32:ID, UInt32:Serial, UInt8:Creation]
 SMALL_TUPLE_EXT = 104   # [UInt8:Arity, N:Elements]
 LARGE_TUPLE_EXT = 105   # [UInt32:Arity, N:Elements]
 NIL_EXT = struct.pack("b", 106)           # empty list
-STRING_EXT = 107        # [UInt32:Len, Len:Characters]
+STRING_EXT = 107        # [UInt16:Len, Len:Characters]
 LIST_EXT = struct.pack("b", 108)          # [UInt32:Len, Elements, Tail]
 BINARY_EXT = struct.pack("b", 109)        # [UInt32:Len, Len:Data]
 SMALL_BIG_EXT = 110     # [UInt8:n, UInt8:Sign, n:nums]
@@ -34,12 +37,75 @@ SMALL_ATOM_EXT = 115    # [UInt8:Len, Len:AtomName]
 MAP_EXT = struct.pack("b", 116)
 FUN_EXT = 117           # [UInt4:NumFree, pid:Pid, atom:Module, int:Index, int:Uniq, NumFree*ext:FreeVars]
 COMPRESSED = 80         # [UInt4:UncompressedSize, N:ZlibCompressedData]
+NEW_PID_EXT = 88        # [atom:Node, UInt32:ID, UInt32:Serial, UInt32:Creation]
+NEW_PORT_EXT = 89       # [atom:Node, UInt32:ID, UInt32:Creation]
+NEWER_REFERENCE_EXT = 90 # [UInt16:Len, atom:Node, UInt32:Creation, Len*UInt32:ID]
+ATOM_UTF8_EXT = 118     # [UInt16:Len, Len:AtomName] max Len is 255 characters
+SMALL_ATOM_UTF8_EXT = 119 # [UInt8:Len, Len:AtomName]
+V4_PORT_EXT = 120       # [atom:Node, UInt64:ID, UInt32:Creation]
+
+class Atom(type(u'')):
+    """
+    A string that is encoded as an atom instead of a binary. Decoded atoms
+    are plain strings (or True, False and None). It's unicode on python 2,
+    so atoms can have any character.
+    """
+    __slots__ = ()
+
+Pid = namedtuple('Pid', ['node', 'id', 'serial', 'creation'])
+Port = namedtuple('Port', ['node', 'id', 'creation'])
+Reference = namedtuple('Reference', ['node', 'creation', 'ids'])
+Export = namedtuple('Export', ['module', 'function', 'arity'])
+BitBinary = namedtuple('BitBinary', ['data', 'bits'])
+# funs can't be called outside of the VM, they are kept undecoded
+Fun = namedtuple('Fun', ['term'])
 
 try:
     xrange
 except NameError:
     xrange = range
 
+try:
+    memoryview(b'\x83')[0] + 0
+    _as_buffer = memoryview
+except TypeError:
+    # python 2 memoryviews are indexed as str, bytearrays as int
+    _as_buffer = bytearray
+
+_UINT16 = struct.Struct(">H")
+_UINT32 = struct.Struct(">L")
+_INT32 = struct.Struct(">l")
+_DOUBLE = struct.Struct(">d")
+_UINT32_UINT8 = struct.Struct(">LB")
+_UINT32_UINT32 = struct.Struct(">LL")
+_UINT64_UINT32 = struct.Struct(">QL")
+_PID = struct.Struct(">LLB")
+_NEW_PID = struct.Struct(">LLL")
+_utf8_decode = codecs.utf_8_decode
+_latin1_decode = codecs.latin_1_decode
+_SPECIAL_ATOMS = {'true': True, 'false': False, 'nil': None}
+
+# binaries from this size on are not copied into the term by encode_iovec()
+IOVEC_MIN_SIZE = 4096
+FORMAT_VERSION_BYTE = b'\x83'
+_TAG_UINT8 = struct.Struct(">BB")
+_TAG_UINT16 = struct.Struct(">BH")
+_TAG_UINT32 = struct.Struct(">BL")
+_TAG_INT32 = struct.Struct(">Bl")
+_TAG_DOUBLE = struct.Struct(">Bd")
+_TAG_UINT8_UINT8 = struct.Struct(">BBB")
+_TAG_UINT32_UINT8 = struct.Struct(">BLB")
+_TAG_UINT16_UINT32 = struct.Struct(">BHL")
+_SMALL_INTEGER_TAG = ord(SMALL_INTEGER_EXT)
+_INTEGER_TAG = ord(INTEGER_EXT)
+_ATOM_TAG = ord(ATOM_EXT)
+_LIST_TAG = ord(LIST_EXT)
+_BINARY_TAG = ord(BINARY_EXT)
+_MAP_TAG = ord(MAP_EXT)
+_NIL_ATOM = ATOM_EXT + struct.pack(">H", 3) + b'nil'
+_TRUE_ATOM = ATOM_EXT + struct.pack(">H", 4) + b'true'
+_FALSE_ATOM = ATOM_EXT + struct.pack(">H", 5) + b'false'
+
 def decode(binary):
     """
         >>> decode(b'\\x83' + SMALL_INTEGER_EXT + b'\x01')
@@ -61,52 +127,221 @@ def decode(binary):
         [1]
         >>> decode(encode(['a']))
         ['a']
+        >>> decode(encode((Atom('ok'), 1.5, 2 ** 70)))
+        ('ok', 1.5, 1180591620717411303424)
+        >>> decode(encode(['measure'] * 100, compressed=True))[99]
+        'measure'
     """
-    if binary[0] not in [b'\x83', 131]:
-        raise NotImplementedError("Unable to serialize version %s" % binary[0])
-    binary = binary[1:]
-
-    (obj_size, fn) = _decode_func(binary)
-    return fn(binary[0: obj_size])
-
-def _decode_func(binary):
-    if _data_type(binary[0]) == SMALL_INTEGER_EXT:
-        return (2, _decode_int)
-    elif _data_type(binary[0]) == INTEGER_EXT:
-        return (5, _decode_int)
-    elif _data_type(binary[0]) == BINARY_EXT:
-        (size, ) = struct.unpack(">L", binary[1:5])
-        return (1 + 4 + size, _decode_string)
-    elif _data_type(binary[0]) == ATOM_EXT:
-        (size, ) = struct.unpack(">H", binary[1:3])
-        return (1 + 2 + size, _decode_atom)
-    elif _data_type(binary[0]) == NIL_EXT:
-        return (1, _decode_list)
-    elif _data_type(binary[0]) == LIST_EXT:
-        (list_size, ) = struct.unpack(">L", binary[1:5])
-        tmp_binary = binary[5:]
-        byte_size = 0
-        for i in xrange(list_size):
-            (obj_size, fn) = _decode_func(tmp_binary)
-            byte_size = byte_size + obj_size
-            tmp_binary = tmp_binary[obj_size:]
-        return (1 + 4 + byte_size + 1, _decode_list)
-    elif _data_type(binary[0]) == MAP_EXT:
-        (map_size, ) = struct.unpack(">L", binary[1:5])
-        tmp_binary = binary[5:]
-        byte_size = 0
-        for i in xrange(map_size):
-            (obj_size, fn) = _decode_func(tmp_binary)
-            byte_size = byte_size + obj_size
-            tmp_binary = tmp_binary[obj_size:]
-
-
-            (obj_size, fn) = _decode_func(tmp_binary)
-            byte_size = byte_size + obj_size
-            tmp_binary = tmp_binary[obj_size:]
-        return (1 + 4 + byte_size , _decode_map)
-    else:
-        raise NotImplementedError("Unable to unserialize %r" % _data_type(binary[0]))
+    data = _as_buffer(binary)
+    if data[0] != 131:
+        raise NotImplementedError("Unable to serialize version %s" % data[0])
+
+    (term, _) = _decode_term(data, 1)
+    return term
+
+def _decode_term(data, pos):
+    """
+    decode the term starting at `pos` and return it together with the
+    position right after it, so nested terms are read in a single pass
+    without copying the remaining binary
+    """
+    try:
+        fn = _DECODERS[data[pos]]
+    except KeyError:
+        raise NotImplementedError("Unable to unserialize %r" % _data_type(data[pos]))
+    return fn(data, pos + 1)
+
+def _read_small_int(data, pos):
+    return (data[pos], pos + 1)
+
+def _read_int(data, pos):
+    (num, ) = _INT32.unpack_from(data, pos)
+    return (num, pos + 4)
+
+def _read_binary(data, pos):
+    (size, ) = _UINT32.unpack_from(data, pos)
+    pos = pos + 4
+    try:
+        (string, _) = _utf8_decode(data[pos:pos + size], 'strict', True)
+    except UnicodeDecodeError:
+        # not a string, keep the raw bytes
+        string = bytes(data[pos:pos + size])
+    return (string, pos + size)
+
+def _atom_reader(length, charset_decode):
+    def read_atom(data, pos):
+        (size, ) = length.unpack_from(data, pos)
+        pos = pos + length.size
+        (atom, _) = charset_decode(data[pos:pos + size], 'strict')
+        return (_SPECIAL_ATOMS.get(atom, atom), pos + size)
+    return read_atom
+
+_read_atom = _atom_reader(_UINT16, _latin1_decode)
+_read_small_atom = _atom_reader(struct.Struct(">B"), _latin1_decode)
+_read_atom_utf8 = _atom_reader(_UINT16, _utf8_decode)
+_read_small_atom_utf8 = _atom_reader(struct.Struct(">B"), _utf8_decode)
+
+def _read_new_float(data, pos):
+    (num, ) = _DOUBLE.unpack_from(data, pos)
+    return (num, pos + 8)
+
+def _read_float(data, pos):
+    return (float(bytes(data[pos:pos + 31]).rstrip(b'\x00')), pos + 31)
+
+def _read_small_big(data, pos):
+    return _read_big(data, pos + 1, data[pos])
+
+def _read_large_big(data, pos):
+    (size, ) = _UINT32.unpack_from(data, pos)
+    return _read_big(data, pos + 4, size)
+
+def _read_big(data, pos, size):
+    sign = data[pos]
+    pos = pos + 1
+    num = 0
+    for digit in reversed(bytearray(data[pos:pos + size])):
+        num = (num << 8) | digit
+    if sign:
+        num = -num
+    return (num, pos + size)
+
+def _read_bit_binary(data, pos):
+    (size, bits) = _UINT32_UINT8.unpack_from(data, pos)
+    pos = pos + 5
+    return (BitBinary(bytes(data[pos:pos + size]), bits), pos + size)
+
+def _read_charlist(data, pos):
+    (size, ) = _UINT16.unpack_from(data, pos)
+    pos = pos + 2
+    return (list(bytearray(data[pos:pos + size])), pos + size)
+
+def _read_small_tuple(data, pos):
+    return _read_tuple(data, pos + 1, data[pos])
+
+def _read_large_tuple(data, pos):
+    (arity, ) = _UINT32.unpack_from(data, pos)
+    return _read_tuple(data, pos + 4, arity)
+
+def _read_tuple(data, pos, arity):
+    items = []
+    for i in xrange(arity):
+        (item, pos) = _decode_term(data, pos)
+        items.append(item)
+    return (tuple(items), pos)
+
+def _read_compressed(data, pos):
+    (size, ) = _UINT32.unpack_from(data, pos)
+    # python 2 zlib doesn't take bytearrays
+    term = zlib.decompress(bytes(data[pos + 4:]), zlib.MAX_WBITS, size)
+    (result, _) = _decode_term(_as_buffer(term), 0)
+    return (result, len(data))
+
+def _read_pid(data, pos):
+    (node, pos) = _decode_term(data, pos)
+    (id, serial, creation) = _PID.unpack_from(data, pos)
+    return (Pid(node, id, serial, creation), pos + _PID.size)
+
+def _read_new_pid(data, pos):
+    (node, pos) = _decode_term(data, pos)
+    (id, serial, creation) = _NEW_PID.unpack_from(data, pos)
+    return (Pid(node, id, serial, creation), pos + _NEW_PID.size)
+
+def _port_reader(fields):
+    def read_port(data, pos):
+        (node, pos) = _decode_term(data, pos)
+        (id, creation) = fields.unpack_from(data, pos)
+        return (Port(node, id, creation), pos + fields.size)
+    return read_port
+
+_read_port = _port_reader(_UINT32_UINT8)
+_read_new_port = _port_reader(_UINT32_UINT32)
+_read_v4_port = _port_reader(_UINT64_UINT32)
+
+def _read_reference(data, pos):
+    (node, pos) = _decode_term(data, pos)
+    (id, creation) = _UINT32_UINT8.unpack_from(data, pos)
+    return (Reference(node, creation, (id, )), pos + 5)
+
+def _new_reference_reader(creation_size):
+    def read_reference(data, pos):
+        (size, ) = _UINT16.unpack_from(data, pos)
+        (node, pos) = _decode_term(data, pos + 2)
+        (creation, ) = struct.unpack_from(creation_size, data, pos)
+        pos = pos + struct.calcsize(creation_size)
+        ids = struct.unpack_from(">%dL" % size, data, pos)
+        return (Reference(node, creation, ids), pos + 4 * size)
+    return read_reference
+
+_read_new_reference = _new_reference_reader(">B")
+_read_newer_reference = _new_reference_reader(">L")
+
+def _read_export(data, pos):
+    (module, pos) = _decode_term(data, pos)
+    (function, pos) = _decode_term(data, pos)
+    (arity, pos) = _decode_term(data, pos)
+    return (Export(module, function, arity), pos)
+
+def _read_new_fun(data, pos):
+    (size, ) = _UINT32.unpack_from(data, pos)
+    return (Fun(bytes(data[pos - 1:pos + size])), pos + size)
+
+def _read_nil(data, pos):
+    return ([], pos)
+
+def _read_list(data, pos):
+    (size, ) = _UINT32.unpack_from(data, pos)
+    pos = pos + 4
+    result = []
+    for i in xrange(size):
+        (item, pos) = _decode_term(data, pos)
+        result.append(item)
+    (tail, pos) = _decode_term(data, pos)
+    if tail != []:
+        # improper list, keep the tail as last element
+        result.append(tail)
+    return (result, pos)
+
+def _read_map(data, pos):
+    (size, ) = _UINT32.unpack_from(data, pos)
+    pos = pos + 4
+    result = {}
+    for i in xrange(size):
+        (key, pos) = _decode_term(data, pos)
+        (value, pos) = _decode_term(data, pos)
+        result[key] = value
+    return (result, pos)
+
+_DECODERS = {
+    ord(SMALL_INTEGER_EXT): _read_small_int,
+    ord(INTEGER_EXT): _read_int,
+    ord(ATOM_EXT): _read_atom,
+    ord(NIL_EXT): _read_nil,
+    ord(LIST_EXT): _read_list,
+    ord(BINARY_EXT): _read_binary,
+    ord(MAP_EXT): _read_map,
+    NEW_FLOAT_EXT: _read_new_float,
+    BIT_BINARY_EXT: _read_bit_binary,
+    FLOAT_EXT: _read_float,
+    REFERENCE_EXT: _read_reference,
+    PORT_EXT: _read_port,
+    PID_EXT: _read_pid,
+    SMALL_TUPLE_EXT: _read_small_tuple,
+    LARGE_TUPLE_EXT: _read_large_tuple,
+    STRING_EXT: _read_charlist,
+    SMALL_BIG_EXT: _read_small_big,
+    LARGE_BIG_EXT: _read_large_big,
+    NEW_FUN_EXT: _read_new_fun,
+    EXPORT_EXT: _read_export,
+    NEW_REFERENCE_EXT: _read_new_reference,
+    SMALL_ATOM_EXT: _read_small_atom,
+    COMPRESSED: _read_compressed,
+    NEW_PID_EXT: _read_new_pid,
+    NEW_PORT_EXT: _read_new_port,
+    NEWER_REFERENCE_EXT: _read_newer_reference,
+    ATOM_UTF8_EXT: _read_atom_utf8,
+    SMALL_ATOM_UTF8_EXT: _read_small_atom_utf8,
+    V4_PORT_EXT: _read_v4_port,
+}
 
 def _decode_map(binary):
     """
@@ -117,23 +352,7 @@ def _decode_map(binary):
         >>> _decode_map(_encode_map({'foo': {'bar': 4938}}))
         {'foo': {'bar': 4938}}
     """
-    (size,) = struct.unpack(">L", binary[1:5])
-    result = {}
-    binary = binary[5:]
-    for i in xrange(size):
-
-        (key_obj_size, key_fn) = _decode_func(binary)
-        key = key_fn(binary[0: key_obj_size])
-        binary = binary[key_obj_size:]
-
-        (value_obj_size, value_fn) = _decode_func(binary)
-        value = value_fn(binary[0: value_obj_size])
-
-        binary = binary[value_obj_size:]
-
-        result.update({key: value})
-
-    return result
+    return _decode_term(_as_buffer(binary), 0)[0]
 
 
 def _decode_list(binary):
@@ -149,23 +368,14 @@ def _decode_list(binary):
         >>> _decode_list(_encode_list([True, None, 1, 'a']))
         [True, None, 1, 'a']
     """
-    if binary == NIL_EXT: return []
-    (size, ) = struct.unpack(">L", binary[1:5])
-    result = []
-    binary = binary[5:]
-    for i in xrange(size):
-        (obj_size, fn) = _decode_func(binary)
-        result.append(fn(binary[0: obj_size]))
-        binary = binary[obj_size:]
-
-    return result
+    return _decode_term(_as_buffer(binary), 0)[0]
 
 def _decode_string(binary):
     """
         >>> _decode_string(_encode_string("h"))
         'h'
     """
-    return binary[5:].decode('UTF-8')
+    return _decode_term(_as_buffer(binary), 0)[0]
 
 def _decode_atom(binary):
     """
@@ -177,14 +387,7 @@ def _decode_atom(binary):
         >>> _decode_atom(_encode_atom("my_key"))
         'my_key'
     """
-    atom = binary[3:]
-    if atom == b'true':
-        return True
-    elif atom == b'false':
-        return False
-    elif atom == b'nil':
-        return None
-    return atom.decode('UTF-8')
+    return _decode_term(_as_buffer(binary), 0)[0]
 
 def _decode_int(binary):
     """
@@ -193,23 +396,175 @@ def _decode_int(binary):
         >>> _decode_int(_encode_int(256))
         256
     """
-    if binary[0] == 97 or binary[0] == 'a' :
-        if type(binary[1]) == int:
-            return binary[1]
-        else:
-            (num,) = struct.unpack("B", binary[1])
-            return num
-    (num,) = struct.unpack(">l", binary[1:])
-    return num
+    return _decode_term(_as_buffer(binary), 0)[0]
 
-def encode(struct):
+def encode(obj, compressed=False):
     """
+    `compressed` is either a zlib level or True for the default level, like
+    with term_to_binary/2 the term is kept uncompressed if compression
+    doesn't make it smaller
+
         >>> encode(False)
         b'\\x83d\\x00\\x05false'
         >>> encode([])
         b'\\x83j'
+        >>> encode([], compressed=True)
+        b'\\x83j'
     """
-    return b'\x83' + _encoder_func(struct)(struct)
+    buf = bytearray(FORMAT_VERSION_BYTE)
+    _encode_term(buf, obj, None)
+    if compressed:
+        return _compress(buf, 6 if compressed is True else compressed)
+    return bytes(buf)
+
+def _compress(buf, level):
+    data = zlib.compress(bytes(buf[1:]), level)
+    if len(data) + 5 >= len(buf) - 1:
+        return bytes(buf)
+    return FORMAT_VERSION_BYTE + _TAG_UINT32.pack(COMPRESSED, len(buf) - 1) + data
+
+def encode_iovec(obj, compressed=False):
+    """
+    encode `obj` into a list of byte strings meant for `socket.sendmsg`,
+    binaries bigger than IOVEC_MIN_SIZE (the editor buffer) are referenced
+    as they are instead of being copied into the term
+
+        >>> b''.join(encode_iovec({'buffer': 'x' * IOVEC_MIN_SIZE})) == encode({'buffer': 'x' * IOVEC_MIN_SIZE})
+        True
+        >>> len(encode_iovec({'buffer': 'x' * IOVEC_MIN_SIZE}))
+        3
+    """
+    if compressed:
+        return [encode(obj, compressed)]
+    buf = bytearray(FORMAT_VERSION_BYTE)
+    large = []
+    _encode_term(buf, obj, large)
+    chunks = []
+    pos = 0
+    for (offset, data) in large:
+        chunks.append(bytes(buf[pos:offset]))
+        chunks.append(data)
+        pos = offset
+    chunks.append(bytes(buf[pos:]))
+    return chunks
+
+def _encode_term(buf, obj, large):
+    fn = _ENCODERS.get(type(obj))
+    if fn is None:
+        fn = _encoder_func(obj)
+    fn(buf, obj, large)
+
+def _encoded(fn, obj):
+    buf = bytearray()
+    fn(buf, obj, None)
+    return bytes(buf)
+
+def _write_list(buf, obj, large):
+    if len(obj) == 0:
+        buf += NIL_EXT
+        return
+    buf += _TAG_UINT32.pack(_LIST_TAG, len(obj))
+    for i in obj:
+        _encode_term(buf, i, large)
+    buf += NIL_EXT
+
+def _write_map(buf, obj, large):
+    buf += _TAG_UINT32.pack(_MAP_TAG, len(obj))
+    for k,v in obj.items():
+        _encode_term(buf, k, large)
+        _encode_term(buf, v, large)
+
+def _write_string(buf, obj, large):
+    _write_bytes(buf, obj.encode('utf-8'), large)
+
+def _write_bytes(buf, obj, large):
+    buf += _TAG_UINT32.pack(_BINARY_TAG, len(obj))
+    if large is not None and len(obj) >= IOVEC_MIN_SIZE:
+        large.append((len(buf), obj))
+    else:
+        buf += obj
+
+def _write_bit_binary(buf, obj, large):
+    buf += _TAG_UINT32_UINT8.pack(BIT_BINARY_EXT, len(obj.data), obj.bits)
+    buf += obj.data
+
+def _write_tuple(buf, obj, large):
+    if len(obj) < 256:
+        buf += _TAG_UINT8.pack(SMALL_TUPLE_EXT, len(obj))
+    else:
+        buf += _TAG_UINT32.pack(LARGE_TUPLE_EXT, len(obj))
+    for i in obj:
+        _encode_term(buf, i, large)
+
+def _write_float(buf, obj, large):
+    buf += _TAG_DOUBLE.pack(NEW_FLOAT_EXT, obj)
+
+def _write_pid(buf, obj, large):
+    buf.append(NEW_PID_EXT)
+    _write_atom(buf, obj.node, large)
+    buf += _NEW_PID.pack(obj.id, obj.serial, obj.creation)
+
+def _write_port(buf, obj, large):
+    if obj.id <= 0xffffffff:
+        buf.append(NEW_PORT_EXT)
+        _write_atom(buf, obj.node, large)
+        buf += _UINT32_UINT32.pack(obj.id, obj.creation)
+    else:
+        buf.append(V4_PORT_EXT)
+        _write_atom(buf, obj.node, large)
+        buf += _UINT64_UINT32.pack(obj.id, obj.creation)
+
+def _write_reference(buf, obj, large):
+    buf += _TAG_UINT16.pack(NEWER_REFERENCE_EXT, len(obj.ids))
+    _write_atom(buf, obj.node, large)
+    buf += _UINT32.pack(obj.creation)
+    buf += struct.pack(">%dL" % len(obj.ids), *obj.ids)
+
+def _write_export(buf, obj, large):
+    buf.append(EXPORT_EXT)
+    _write_atom(buf, obj.module, large)
+    _write_atom(buf, obj.function, large)
+    _write_int(buf, obj.arity, large)
+
+def _write_fun(buf, obj, large):
+    buf += obj.term
+
+def _write_none(buf, obj, large):
+    buf += _NIL_ATOM
+
+def _write_boolean(buf, obj, large):
+    buf += _TRUE_ATOM if obj else _FALSE_ATOM
+
+def _write_atom(buf, obj, large):
+    atom = obj.encode('utf-8')
+    if len(atom) == len(obj):
+        buf += _TAG_UINT16.pack(_ATOM_TAG, len(atom))
+    elif len(atom) < 256:
+        buf += _TAG_UINT8.pack(SMALL_ATOM_UTF8_EXT, len(atom))
+    else:
+        buf += _TAG_UINT16.pack(ATOM_UTF8_EXT, len(atom))
+    buf += atom
+
+def _write_int(buf, obj, large):
+    if 0 <= obj <= 255:
+        buf += _TAG_UINT8.pack(_SMALL_INTEGER_TAG, obj)
+    elif -2147483648 <= obj <= 2147483647:
+        buf += _TAG_INT32.pack(_INTEGER_TAG, obj)
+    else:
+        _write_big(buf, obj)
+
+def _write_big(buf, obj):
+    sign = 1 if obj < 0 else 0
+    num = abs(obj)
+    digits = bytearray()
+    while num:
+        digits.append(num & 0xff)
+        num = num >> 8
+    if len(digits) < 256:
+        buf += _TAG_UINT8_UINT8.pack(SMALL_BIG_EXT, len(digits), sign)
+    else:
+        buf += _TAG_UINT32_UINT8.pack(LARGE_BIG_EXT, len(digits), sign)
+    buf += digits
 
 def _encode_list(obj):
     """
@@ -220,12 +575,7 @@ def _encode_list(obj):
         >>> _encode_list([1])
         b'l\\x00\\x00\\x00\\x01a\\x01j'
     """
-    if len(obj) == 0:
-        return NIL_EXT
-    b = struct.pack(">L", len(obj))
-    for i in obj:
-        b = b + _encoder_func(i)(i)
-    return LIST_EXT + b + NIL_EXT
+    return _encoded(_write_list, obj)
 
 def _encode_map(obj):
     """
@@ -236,27 +586,57 @@ def _encode_map(obj):
         >>> _encode_map({'foo': {'bar': 4938}})
         b't\\x00\\x00\\x00\\x01m\\x00\\x00\\x00\\x03foot\\x00\\x00\\x00\\x01m\\x00\\x00\\x00\\x03barb\\x00\\x00\\x13J'
     """
-    b = struct.pack(">L", len(obj))
-    for k,v in obj.items():
-        b = b + _encoder_func(k)(k) +  _encoder_func(v)(v)
-    return MAP_EXT + b
+    return _encoded(_write_map, obj)
 
 def _encoder_func(obj):
     if isinstance(obj, str):
-        return _encode_string
+        return _write_string
     elif isinstance(obj, bool):
-        return _encode_boolean
+        return _write_boolean
     elif isinstance(obj, int):
-        return _encode_int
+        return _write_int
+    elif isinstance(obj, float):
+        return _write_float
     elif isinstance(obj, dict):
-        return _encode_map
+        return _write_map
     elif isinstance(obj, list):
-        return _encode_list
+        return _write_list
+    elif isinstance(obj, tuple):
+        return _write_tuple
+    elif isinstance(obj, bytes):
+        return _write_bytes
     elif obj is None:
-        return _encode_none
+        return _write_none
     else:
         raise NotImplementedError("Unable to serialize %r" % obj)
 
+_ENCODERS = {
+    str: _write_string,
+    bool: _write_boolean,
+    int: _write_int,
+    dict: _write_map,
+    list: _write_list,
+    type(None): _write_none,
+    float: _write_float,
+    tuple: _write_tuple,
+    Atom: _write_atom,
+    Pid: _write_pid,
+    Port: _write_port,
+    Reference: _write_reference,
+    Export: _write_export,
+    BitBinary: _write_bit_binary,
+    Fun: _write_fun,
+}
+if bytes is not str:
+    _ENCODERS[bytes] = _write_bytes
+try:
+    _ENCODERS[unicode] = _write_string
+    _ENCODERS[long] = _write_int
+    # python 2 strings are already bytes (utf-8 from vim)
+    _ENCODERS[str] = _write_bytes
+except NameError:
+    pass
+
 def _encode_string(obj):
     """
         >>> _encode_string("h")
@@ -266,15 +646,14 @@ def _encode_string(obj):
         >>> _encode_string("测试")
         b'm\x00\x00\x00\x06\xe6\xb5\x8b\xe8\xaf\x95'
     """
-    str_enc = obj.encode('utf-8')
-    return BINARY_EXT + struct.pack(">L", len(str_enc)) + str_enc
+    return _encoded(_write_string, obj)
 
 def _encode_none(obj):
     """
         >>> _encode_none(None)
         b'd\\x00\\x03nil'
     """
-    return _encode_atom("nil")
+    return _encoded(_write_none, obj)
 
 def _encode_boolean(obj):
     """
@@ -283,15 +662,10 @@ def _encode_boolean(obj):
         >>> _encode_boolean(False)
         b'd\\x00\\x05false'
     """
-    if obj == True:
-        return _encode_atom("true")
-    elif obj == False:
-        return _encode_atom("false")
-    else:
-        raise "Maybe later"
+    return _encoded(_write_boolean, obj)
 
 def _encode_atom(obj):
-    return ATOM_EXT + struct.pack(">H", len(obj)) + obj.encode('utf-8')
+    return _encoded(_write_atom, obj)
 
 def _encode_int(obj):
     """
@@ -300,12 +674,7 @@ def _encode_int(obj):
         >>> _encode_int(256)
         b'b\\x00\\x00\\x01\\x00'
     """
-    if 0 <= obj <= 255:
-        return SMALL_INTEGER_EXT +  struct.pack("B", obj)
-    elif -2147483648 <= obj <= 2147483647:
-        return INTEGER_EXT + struct.pack(">l", obj)
-    else:
-        raise "Maybe later"
+    return _encoded(_write_int, obj)
 
 def _data_type(dtype):
     if type(dtype) == int:
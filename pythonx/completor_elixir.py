@@ -7,12 +7,18 @@ from completor import Completor, vim
 
 PLUGIN_BASE_PATH = os.path.abspath("%s/../../" % __file__)
 sys.path.insert(0, PLUGIN_BASE_PATH)
+try:
+    from elixir_sense_async import AsyncElixirSenseClient, EventLoopThread
+except (ImportError, SyntaxError):
+    AsyncElixirSenseClient = None
 from elixir_sense import ElixirSenseClient
 
 DEBUG = False
 ALCHEMIST_SCRIPT = os.path.join(PLUGIN_BASE_PATH, 'elixir_sense/run.exs')
-RE_SUGGESTIONS = re.compile(r'kind:(?P<kind>[^,]*), word:(?P<word>[^,]*), abbr:(?P<abbr>[\w\W]*), menu:(?P<menu>[\w\W]*), info:(?P<info>[\w\W]*)$')
 RE_IS_ONLY_FUNC = re.compile(r'((^|\.|\s+)([a-z]\w*)|\w+\.)$')
+# completor waits synchronously, a slow answer is left to finish in the
+# background instead of freezing typing
+COMPLETION_TIMEOUT = 1
 
 
 class Alchemist(Completor):
@@ -20,36 +26,67 @@ class Alchemist(Completor):
     trigger = r'(\w{2}|\.\w?)$'
     sync = True
 
-    def parse(self, base):
-        sense_client = ElixirSenseClient(debug=DEBUG, cwd=os.getcwd(), ansi=False, elixir_sense_script=ALCHEMIST_SCRIPT, elixir_otp_src='')
+    _sense_loop = None
+    # one client per project, the directories of the buffers are mapped to
+    # the client of their project
+    _sense_clients = {}
+    _dir_clients = {}
 
+    def parse(self, base):
         lnum, cnum = vim.current.window.cursor
         lines = "\n".join(vim.current.buffer[:])
-        response = sense_client.process_command('suggestions', lines, lnum, cnum)
+        response = self.__process_suggestions__(lines, lnum, cnum)
 
-        if response[0:6] == 'error:':
+        if not isinstance(response, list):
             return []
-        return self.__get_suggestions__(base, response.split("\n")[:-1])
+        return self.__get_suggestions__(base, response)
+
+    def __process_suggestions__(self, lines, lnum, cnum):
+        sense_client = self.__sense_client__()
+        if AsyncElixirSenseClient is None:
+            return sense_client.process_command('suggestions', lines, lnum, cnum)
+
+        future = self._sense_loop.submit(sense_client.process_command(
+            'suggestions', lines, lnum, cnum, key='suggestions', buffer_id=vim.current.buffer.number))
+        try:
+            return future.result(COMPLETION_TIMEOUT)
+        except Exception as e:
+            return 'error:%s' % e
+
+    def __sense_client__(self):
+        directory = os.path.dirname(vim.current.buffer.name) or os.getcwd()
+        if directory in self._dir_clients:
+            return self._dir_clients[directory]
+
+        if AsyncElixirSenseClient is None:
+            client_class = ElixirSenseClient
+        else:
+            client_class = AsyncElixirSenseClient
+            if Alchemist._sense_loop is None:
+                Alchemist._sense_loop = EventLoopThread()
+        client = client_class(debug=DEBUG, cwd=directory, ansi=False, elixir_sense_script=ALCHEMIST_SCRIPT, elixir_otp_src='', suggestions_format='records')
+        client = self._sense_clients.setdefault(client._cwd, client)
+        self._dir_clients[directory] = client
+        return client
 
-    def __get_suggestions__(self, base, results):
+    def __get_suggestions__(self, base, records):
         suggestions = []
         extended_autocomplete = bool(vim.vars.get('alchemist#extended_autocomplete'))
+        only_func = RE_IS_ONLY_FUNC.search(base)
 
-        for result in results:
-            matches = RE_SUGGESTIONS.match(result)
-            kind = matches.group('kind')
-            word = matches.group('word')
-            if kind == 'f' and RE_IS_ONLY_FUNC.search(base):
+        for record in records:
+            word = record['word']
+            if record['kind'] == 'f' and only_func:
                 word = word.split('.')[-1]
 
             sugg = {
-                'kind': kind,
+                'kind': record['kind'],
                 'word': word,
-                'abbr': matches.group('abbr'),
-                'menu': matches.group('menu')
+                'abbr': record['abbr'],
+                'menu': record['menu']
             }
             if extended_autocomplete:
-                sugg['info'] = matches.group('info').replace('<n>', "\n").strip()
+                sugg['info'] = record['info']
             suggestions.append(sugg)
 
         return suggestions
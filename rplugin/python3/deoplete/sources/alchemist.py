@@ -1,11 +1,13 @@
 import os, sys
 PLUGIN_BASE_PATH = os.path.abspath("%s/../../../../../" % __file__)
 sys.path.insert(0, PLUGIN_BASE_PATH)
-from elixir_sense import ElixirSenseClient
+from elixir_sense_async import AsyncElixirSenseClient, EventLoopThread
 import re
 from deoplete.base.source import Base
 
 DEBUG = False
+# seconds a completion waits for the next keystroke before it's sent
+DEBOUNCE = 0.05
 
 class Source(Base):
     def __init__(self, vim):
@@ -15,49 +17,62 @@ class Source(Base):
         self.mark = '[alchemist]'
         self.filetypes = ['elixir']
         self.is_bytepos = False
-        self.re_suggestions = re.compile(r'kind:(?P<kind>[^,]*), word:(?P<word>[^,]*), abbr:(?P<abbr>[\w\W]*), menu:(?P<menu>[\w\W]*), info:(?P<info>[\w\W]*)$')
         self.re_is_only_func = re.compile(r'^[a-z]')
 
         alchemist_script = "%s/elixir_sense/run.exs" % PLUGIN_BASE_PATH
-        self.sense_client = ElixirSenseClient(debug=DEBUG, cwd=os.getcwd(), ansi=False, elixir_sense_script=alchemist_script, elixir_otp_src="")
+        self.sense_loop = EventLoopThread()
+        self.sense_future = None
+        self.sense_client = AsyncElixirSenseClient(debug=DEBUG, cwd=os.getcwd(), ansi=False, elixir_sense_script=alchemist_script, elixir_otp_src="", debounce=DEBOUNCE, suggestions_format='records')
 
     def get_complete_position(self, context):
         return self.vim.call('elixircomplete#auto_complete', 1, '')
 
     def gather_candidates(self, context):
-        lnum = self.vim.funcs.line('.')
-        cnum = self.vim.funcs.col('.')
-        lines = self.vim.funcs.getline(1, '$')
-        complete_str = context['complete_str']
+        # deoplete calls again while is_async is set, the server answers
+        # in the background meanwhile and a newer completion replaces it
+        if not context['is_async'] or self.sense_future is None:
+            lnum = self.vim.funcs.line('.')
+            cnum = self.vim.funcs.col('.')
+            lines = self.vim.funcs.getline(1, '$')
+            self.sense_future = self.sense_loop.submit(self.sense_client.process_command(
+                'suggestions', "\n".join(lines), lnum ,cnum, key='suggestions',
+                buffer_id=context['bufnr']))
 
-        response = self.sense_client.process_command('suggestions', "\n".join(lines), lnum ,cnum)
-        if response[0:6] == 'error:':
+        if not self.sense_future.done():
+            context['is_async'] = True
+            return []
+        context['is_async'] = False
+        (future, self.sense_future) = (self.sense_future, None)
+        if future.cancelled():
+            return []
+        response = future.result()
+        complete_str = context['complete_str']
+        if not isinstance(response, list):
             #self.vim.command('echohl ErrorMsg|echom "%s"|echohl None' % response)
             return []
 
-        return self.__get_suggestions__(complete_str, response.split('\n')[:-1])
+        return self.__get_suggestions__(complete_str, response)
 
     # Private implementation
     ########################
 
-    def __get_suggestions__(self, complete_str, server_results):
+    def __get_suggestions__(self, complete_str, records):
         suggestions = []
-        for result in server_results:
-            matches = self.re_suggestions.match(result)
-            word = matches.group('word')
-            kind = matches.group('kind')
-            if  kind == "f" and self.re_is_only_func.match(complete_str):
-                word = word.split(".")[-1]
-
+        extended_autocomplete = False
+        if self.vim.funcs.exists('g:alchemist#extended_autocomplete'):
+            extended_autocomplete = self.vim.eval('g:alchemist#extended_autocomplete') == 1
+        only_func = self.re_is_only_func.match(complete_str)
+        for record in records:
             sugg = {
-                'kind': kind,
-                'word': word,
-                'abbr': matches.group('abbr'),
-                'menu': matches.group('menu'),
+                'kind': record['kind'],
+                'word': record['word'],
+                'abbr': record['abbr'],
+                'menu': record['menu'],
             }
-            if self.vim.funcs.exists('g:alchemist#extended_autocomplete'):
-                if self.vim.eval('g:alchemist#extended_autocomplete') == 1:
-                    sugg['info'] = matches.group('info').replace("<n>", "\n").strip()
+            if record['kind'] == "f" and only_func:
+                sugg['word'] = record['word'].split(".")[-1]
+            if extended_autocomplete:
+                sugg['info'] = record['info']
             suggestions.append(sugg)
 
         return suggestions
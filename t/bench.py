@@ -0,0 +1,162 @@
+"""
+Benchmarks of the codec (erl_terms) and of the formatting of suggestions
+on payloads the size of the ones seen in big projects.
+
+    python -m t.bench                 # run and compare with the baseline
+    python -m t.bench --save          # run and store the results as baseline
+    python -m t.bench --check=0.2     # exit 1 when a benchmark is 20% slower
+    python -m t.bench encode decode   # only the benchmarks matching a name
+
+Run it from the root of the repository. Allocations (peak KB of one call)
+are only measured on python 3. Timings depend on the machine, save a
+baseline before changing the code and compare against it afterwards.
+"""
+from __future__ import print_function
+import getopt
+import gc
+import json
+import os
+import sys
+import time
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import erl_terms
+from elixir_sense import ElixirSenseClient
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'bench_baseline.json')
+MIN_TIME = 1.0
+
+
+def buffer_source(lines=10000):
+    source = []
+    for i in range(lines // 10):
+        source.extend([
+            'defmodule Project.Module%d do' % i,
+            '  alias Project.{Repo, Schema}',
+            '  @moduledoc "Module number %d"' % i,
+            '  def call(%%{id: id} = params, opts \\\\ []) do',
+            '    params',
+            '    |> Map.take([:id, :name, :value])',
+            '    |> Enum.map(fn {k, v} -> {k, to_string(v)} end)',
+            '    |> Repo.insert!(opts)',
+            '  end',
+            'end'])
+    return '\n'.join(source)
+
+
+def suggestions(count=2000):
+    A = erl_terms.Atom
+    payload = [{A('type'): A('hint'), A('value'): 'Enum.'}]
+    for i in range(count):
+        if i % 10 == 0:
+            payload.append({A('type'): A('module'), A('name'): 'Module%d' % i,
+                            A('subtype'): None, A('summary'): 'A module with a one line summary.'})
+        else:
+            payload.append({A('type'): A('function'), A('name'): 'function_%d' % i,
+                            A('arity'): i % 4, A('origin'): 'Enum',
+                            A('args'): 'enumerable, fun, acc', A('spec'): '@spec function_%d(t, (element -> any)) :: list' % i,
+                            A('summary'): 'Invokes the given function for each element and returns a list.'})
+    return payload
+
+
+def all_modules(count=20000):
+    modules = [':module_%d' % i for i in range(count // 4)]
+    modules += ['Project.Context%d.Module%d' % (i // 50, i) for i in range(count - len(modules))]
+    return sorted(modules)
+
+
+def response(request_id, payload):
+    return {erl_terms.Atom('request_id'): request_id, erl_terms.Atom('error'): None, erl_terms.Atom('payload'): payload}
+
+
+def benchmarks():
+    source = buffer_source()
+    request = {'request_id': 1, 'auth_token': None, 'request': 'suggestions',
+               'payload': {'buffer': source, 'line': 5000, 'column': 10}}
+    suggestions_reply = response(1, suggestions())
+    modules_reply = response(1, all_modules())
+    encoded_suggestions = erl_terms.encode(suggestions_reply)
+    encoded_modules = erl_terms.encode(modules_reply)
+    decoded_suggestions = erl_terms.decode(encoded_suggestions)['payload']
+    client = ElixirSenseClient(cwd=os.getcwd())
+
+    return [
+        ('encode 10k lines buffer', lambda: erl_terms.encode(request)),
+        ('encode_iovec 10k lines buffer', lambda: erl_terms.encode_iovec(request)),
+        ('encode 2000 suggestions', lambda: erl_terms.encode(suggestions_reply)),
+        ('decode 2000 suggestions', lambda: erl_terms.decode(encoded_suggestions)),
+        ('encode all_modules', lambda: erl_terms.encode(modules_reply)),
+        ('decode all_modules', lambda: erl_terms.decode(encoded_modules)),
+        ('to_vim_suggestions 2000 suggestions', lambda: client.to_vim_suggestions(decoded_suggestions)),
+        ('to_suggestion_records 2000 suggestions', lambda: client.to_suggestion_records(decoded_suggestions)),
+    ]
+
+
+def ops_per_sec(fn):
+    fn()
+    gc.collect()
+    (count, started) = (0, time.time())
+    while time.time() - started < MIN_TIME:
+        fn()
+        count = count + 1
+    return count / (time.time() - started)
+
+
+def peak_kb(fn):
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        (_, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak // 1024
+
+
+def load_baseline():
+    try:
+        with open(BASELINE) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def main(argv):
+    (opts, names) = getopt.getopt(argv, '', ['save', 'check='])
+    opts = dict(opts)
+    baseline = load_baseline()
+    results = {}
+    regressions = []
+    print('%-40s %12s %10s %10s' % ('benchmark', 'ops/sec', 'peak KB', 'baseline'))
+    for (name, fn) in benchmarks():
+        if names and not any(n in name for n in names):
+            continue
+        ops = ops_per_sec(fn)
+        peak = peak_kb(fn)
+        results[name] = {'ops': ops, 'peak_kb': peak}
+        change = ''
+        if name in baseline:
+            ratio = ops / baseline[name]['ops']
+            change = '%+.0f%%' % ((ratio - 1) * 100)
+            if '--check' in opts and ratio < 1 - float(opts['--check']):
+                regressions.append(name)
+        print('%-40s %12.1f %10s %10s' % (name, ops, '-' if peak is None else peak, change))
+
+    if '--save' in opts:
+        baseline.update(results)
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print('baseline saved to %s' % BASELINE)
+    if regressions:
+        print('slower than the baseline: %s' % ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
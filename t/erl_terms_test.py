@@ -1,5 +1,7 @@
 import erl_terms
+import struct
 import unittest
+import zlib
 
 
 class Tests(unittest.TestCase):
@@ -93,5 +95,72 @@ class Tests(unittest.TestCase):
 
         self.assertEqual(erl_terms.decode(erl_terms.encode(complex_data)), complex_data)
 
+    def test_decode_large_nested_payload(self):
+        suggestions = [{'type': 'hint', 'value': 'Enum.'}] + [
+            {'type': 'function', 'name': 'f%d' % i, 'arity': i % 4, 'origin': 'Enum', 'spec': None, 'args': ['list', 'fun']}
+            for i in range(2000)]
+        response = {'request_id': 1, 'error': None, 'payload': suggestions}
+
+        self.assertEqual(erl_terms.decode(erl_terms.encode(response)), response)
+        self.assertEqual(erl_terms.decode(bytearray(erl_terms.encode(response))), response)
+
+    def test_encode_iovec(self):
+        buffer = "defmodule A do\n  Enum.ma\nend\n" * 1000
+        request = {'request_id': 1, 'auth_token': None, 'request': 'suggestions', 'payload': {'buffer': buffer, 'line': 2, 'column': 10}}
+        chunks = erl_terms.encode_iovec(request)
+
+        self.assertEqual(b''.join(chunks), erl_terms.encode(request))
+        self.assertIn(buffer.encode('utf-8'), chunks)
+        self.assertEqual(erl_terms.encode_iovec([1]), [erl_terms.encode([1])])
+
+    def test_otp_terms(self):
+        # :erlang.term_to_binary/1 output of {:ok, 1} before and after OTP 26
+        self.assertEqual(erl_terms.decode(b'\x83h\x02d\x00\x02oka\x01'), ('ok', 1))
+        self.assertEqual(erl_terms.decode(b'\x83h\x02w\x02oka\x01'), ('ok', 1))
+        self.assertEqual(erl_terms.decode(b'\x83s\x02ok'), 'ok')
+        self.assertEqual(erl_terms.decode(b'\x83v\x00\x06\xc3\xa9t\xc3\xa9'), u'\xe9t\xe9')
+        self.assertEqual(erl_terms.decode(b'\x83w\x04true'), True)
+        self.assertEqual(erl_terms.decode(b'\x83F?\xf8\x00\x00\x00\x00\x00\x00'), 1.5)
+        self.assertEqual(erl_terms.decode(b'\x83n\t\x00\x00\x00\x00\x00\x00\x00\x00\x00\x01'), 2 ** 64)
+        self.assertEqual(erl_terms.decode(b'\x83n\x06\x01\x00\x00\x00\x00\x00\x01'), -2 ** 40)
+        self.assertEqual(erl_terms.decode(b'\x83k\x00\x03abc'), [97, 98, 99])
+        self.assertEqual(erl_terms.decode(b'\x83l\x00\x00\x00\x01a\x01a\x02'), [1, 2])
+        self.assertEqual(
+            erl_terms.decode(b'\x83X\x77\x0dnonode@nohost\x00\x00\x00\x50\x00\x00\x00\x00\x00\x00\x00\x00'),
+            erl_terms.Pid('nonode@nohost', 80, 0, 0))
+
+    def test_compressed(self):
+        term = {'docs': 'Returns a list where each item is the result of invoking `fun`. ' * 100}
+        uncompressed = erl_terms.encode(term)
+        compressed = b'\x83P' + struct.pack('>L', len(uncompressed) - 1) + zlib.compress(uncompressed[1:])
+
+        self.assertEqual(erl_terms.decode(compressed), term)
+        self.assertEqual(erl_terms.decode(erl_terms.encode(term, compressed=9)), term)
+        self.assertTrue(len(erl_terms.encode(term, compressed=True)) < len(uncompressed))
+
+    def test_encode_extended_terms(self):
+        terms = [
+            (erl_terms.Atom('ok'), 'result'),
+            1.25,
+            -2 ** 40,
+            2 ** 2100,
+            b'\xff\x00',
+            erl_terms.Atom(u'\xe9t\xe9'),
+            erl_terms.Pid('nonode@nohost', 80, 0, 0),
+            erl_terms.Reference('nonode@nohost', 0, (1, 2, 3)),
+            erl_terms.Port('nonode@nohost', 2 ** 40, 1),
+            erl_terms.Export('lists', 'map', 2),
+            erl_terms.BitBinary(b'\x80', 1),
+            tuple(range(300)),
+        ]
+        for term in terms:
+            self.assertEqual(erl_terms.decode(erl_terms.encode(term)), term)
+
+        self.assertEqual(erl_terms.encode(erl_terms.Atom('ok')), b'\x83d\x00\x02ok')
+        self.assertEqual(erl_terms.encode(erl_terms.Atom(u'\xe9')), b'\x83w\x02\xc3\xa9')
+
+    def test_decode_unsupported_term(self):
+        self.assertRaises(NotImplementedError, erl_terms.decode, b'\x83z')
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,224 @@
+"""
+Replays editing sessions through ElixirSenseClient.process_command and
+reports the latency of each request type and the throughput.
+
+    python -m t.replay                          # generated session, stand-in server
+    python -m t.replay --session=session.jsonl  # recorded session
+    python -m t.replay --server=real --project=~/dev/my_app
+    python -m t.replay --clients=4 --delay=5    # 4 clients, 5ms per request
+    python -m t.replay --cache=off              # without the client caches
+
+A session is a JSON line per request: `{"request": "suggestions", "line": 3,
+"column": 9, "buffer": "..."}`, the buffer may be left out when it didn't
+change since the previous request.
+
+The stand-in server answers like the ElixirSense server (packet: 4 framed
+ETF terms on a unix socket) with canned payloads after `--delay` ms, so
+the client side (socket, codec, formatting) is measured without elixir.
+With `--server=real` the server of `--project` is started from
+elixir_sense/run.exs like the editors do, once before the clients connect.
+
+The session is replayed with the client caches (suggestions and docs) and
+without them, `--cache=on` or `--cache=off` replays only one of the modes.
+The docs cache of the clients is a dbm file of their own, so docs cached
+by the editors or a previous replay aren't counted. Both modes use the
+same server, its own caches are warm for the second one.
+"""
+from __future__ import print_function
+import getopt
+import json
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import erl_terms
+from elixir_sense import ElixirSenseClient
+from t.bench import buffer_source, suggestions, all_modules
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKET_HEADER = struct.Struct('!I')
+
+
+class StandInServer:
+    """
+    Answers the requests of ElixirSenseClient like the ElixirSense server,
+    every request of a connection is answered in order after `delay`
+    seconds.
+    """
+
+    def __init__(self, path, delay=0):
+        self.path = path
+        self._delay = delay
+        A = erl_terms.Atom
+        self._payloads = {
+            'suggestions': suggestions(200),
+            'docs': {A('subject'): 'Enum.map', A('actual_subject'): 'Enum.map',
+                     A('docs'): {A('docs'): '> Enum.map(enumerable, fun)\n\nReturns a list.' * 20, A('types'): ''}},
+            'definition': {A('found'): False},
+            'signature': {A('active_param'): 0, A('pipe_before'): False, A('signatures'): []},
+            'version': {A('elixir'): '1.9.4', A('otp'): '22'},
+            'all_modules': all_modules(),
+        }
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen(16)
+        self._spawn(self._accept)
+
+    def stop(self):
+        self._sock.close()
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                (conn, _) = self._sock.accept()
+            except (socket.error, OSError):
+                return
+            self._spawn(self._serve, conn)
+
+    def _serve(self, conn):
+        try:
+            while True:
+                (size, ) = PACKET_HEADER.unpack(self._recv_exactly(conn, PACKET_HEADER.size))
+                request = erl_terms.decode(self._recv_exactly(conn, size))
+                if self._delay:
+                    time.sleep(self._delay)
+                reply = erl_terms.encode({
+                    erl_terms.Atom('request_id'): request['request_id'],
+                    erl_terms.Atom('error'): None,
+                    erl_terms.Atom('payload'): self._payloads.get(request['request'])})
+                conn.sendall(PACKET_HEADER.pack(len(reply)) + reply)
+        except (socket.error, OSError, EOFError):
+            conn.close()
+
+    def _recv_exactly(self, conn, size):
+        data = b''
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise EOFError()
+            data = data + chunk
+        return data
+
+
+def generated_session():
+    """
+    typing a few calls at the end of a 1000 lines buffer, asking for
+    suggestions on every keystroke and for the docs and the definition of
+    every call
+    """
+    source = buffer_source(1000)
+    session = []
+    for call in ['Enum.map', 'String.split', ':lists.reverse', 'Map.get', 'Enum.reduce'] * 4:
+        lines = source.split('\n')
+        line = len(lines)
+        for end in range(1, len(call) + 1):
+            session.append({'request': 'suggestions', 'line': line, 'column': end + 1,
+                            'buffer': source + call[:end]})
+        source = source + call + '()\n'
+        for request in ['docs', 'definition']:
+            session.append({'request': request, 'line': line, 'column': len(call), 'buffer': source})
+    return session
+
+
+def load_session(path):
+    session = []
+    buffer = ''
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                event = json.loads(line)
+                buffer = event.get('buffer', buffer)
+                event['buffer'] = buffer
+                session.append(event)
+    return session
+
+
+def replay(client, session, buffer_id, latencies):
+    for event in session:
+        started = time.time()
+        client.process_command(event['request'], event['buffer'], event['line'], event['column'], buffer_id)
+        latencies.append((event['request'], time.time() - started))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[int(round(p / 100.0 * (len(values) - 1)))]
+
+
+def report(latencies, elapsed):
+    print('%-14s %8s %10s %10s %10s' % ('request', 'count', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for request in sorted(set(r for (r, _) in latencies)):
+        values = [t * 1000 for (r, t) in latencies if r == request]
+        print('%-14s %8d %10.2f %10.2f %10.2f' % (
+            request, len(values), percentile(values, 50), percentile(values, 95), percentile(values, 99)))
+    print('%d requests in %.2f sec, %.1f requests/sec' % (len(latencies), elapsed, len(latencies) / elapsed))
+
+
+def run(session, project, clients, buffer_sync, kw):
+    latencies = []
+    threads = []
+    started = time.time()
+    for i in range(clients):
+        client = ElixirSenseClient(cwd=project, **kw)
+        buffer_id = i if buffer_sync else None
+        thread = threading.Thread(target=replay, args=(client, session, buffer_id, latencies))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    report(latencies, time.time() - started)
+
+
+def main(argv):
+    (opts, _) = getopt.getopt(argv, '', ['session=', 'server=', 'project=', 'clients=', 'delay=', 'buffer-sync', 'cache='])
+    opts = dict(opts)
+    session = load_session(opts['--session']) if '--session' in opts else generated_session()
+    clients = int(opts.get('--clients', 1))
+    cache = opts.get('--cache', 'both')
+    tmp_dir = tempfile.mkdtemp()
+    kw = {'elixir_sense_script': os.path.join(ROOT, 'elixir_sense', 'run.exs'), 'ansi': False}
+
+    server = None
+    if opts.get('--server', 'stand-in') == 'stand-in':
+        # the clients find the stand-in server in the logs of their tmp dir
+        os.environ['TMPDIR'] = tmp_dir
+        project = os.path.join(tmp_dir, 'project')
+        os.mkdir(project)
+        server = StandInServer(os.path.join(tmp_dir, 'stand-in.sock'), float(opts.get('--delay', 0)) / 1000)
+        server.start()
+        probe = ElixirSenseClient(cwd=project, **kw)
+        with open(os.path.join(probe._get_tmp_dir(), probe._server_log_name()), 'w') as f:
+            f.write('ok:localhost:%s\n' % server.path)
+    else:
+        project = os.path.abspath(os.path.expanduser(opts.get('--project', '.')))
+        # started here, clients starting it concurrently would race for its log
+        ElixirSenseClient(cwd=project, **kw).process_command('version', '', 1, 1)
+
+    modes = [('on', {'cache_size': 64}), ('off', {'cache_size': 0})]
+    for (mode, cache_kw) in modes:
+        if cache in (mode, 'both'):
+            print('client caches %s' % mode)
+            cache_kw['docs_cache_path'] = os.path.join(tmp_dir, 'docs_cache_%s' % mode)
+            cache_kw.update(kw)
+            run(session, project, clients, '--buffer-sync' in opts, cache_kw)
+
+    if server is not None:
+        server.stop()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])